@@ -0,0 +1,158 @@
+import asyncio
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, Optional
+
+from metrics import LLM_SHED
+from ratelimit import TokenBucketLimiter
+
+# ---------- Config ----------
+CHAT_ADMISSION_ENABLED = os.getenv("CHAT_ADMISSION_ENABLED", "true").lower() == "true"
+CHAT_USER_PER_MINUTE = float(os.getenv("CHAT_USER_PER_MINUTE", "20"))
+CHAT_USER_BURST = float(os.getenv("CHAT_USER_BURST", "5"))
+# Upstream LLM calls allowed in flight at once (per process)
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))
+# Requests allowed to wait for a free slot, and for how long
+LLM_QUEUE_MAX = int(os.getenv("LLM_QUEUE_MAX", "64"))
+LLM_QUEUE_TIMEOUT_SECONDS = float(os.getenv("LLM_QUEUE_TIMEOUT_SECONDS", "2.0"))
+
+# Weight of the newest sample in the service-time moving average
+SERVICE_TIME_ALPHA = 0.2
+
+
+class AdmissionController:
+    """
+    Gatekeeper for upstream LLM calls.
+
+    A request is admitted only if (1) its caller's token bucket has a token,
+    and (2) one of `max_concurrency` slots is free, or frees up within
+    `queue_timeout` while it waits in a FIFO queue of at most `queue_max`.
+    The expected wait is estimated from the queue position and a moving
+    average of how long a slot is held; a request that would not get a slot
+    before its deadline is turned away at once rather than after waiting.
+    Turned-away requests are answered by the caller's fallback, so overload
+    shows up as degraded replies instead of timeouts.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        queue_max: int = LLM_QUEUE_MAX,
+        queue_timeout: float = LLM_QUEUE_TIMEOUT_SECONDS,
+        user_limiter: Optional[TokenBucketLimiter] = None,
+    ):
+        self.max_concurrency = max(1, max_concurrency)
+        self.queue_max = queue_max
+        self.queue_timeout = queue_timeout
+        self.user_limiter = user_limiter or TokenBucketLimiter(CHAT_USER_PER_MINUTE, CHAT_USER_BURST)
+        self._active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._service_time: Optional[float] = None
+
+        self.admitted = 0
+        self.queued = 0
+        self.shed = {"user_rate": 0, "queue_full": 0, "deadline": 0}
+
+    def _shed(self, reason: str) -> bool:
+        self.shed[reason] += 1
+        LLM_SHED.labels(reason).inc()
+        return False
+
+    def _expected_wait(self, position: int) -> float:
+        if self._service_time is None:
+            return 0.0
+        return (position + 1) / self.max_concurrency * self._service_time
+
+    async def _acquire(self, key: str) -> bool:
+        allowed, _ = self.user_limiter.acquire(key)
+        if not allowed:
+            return self._shed("user_rate")
+
+        if self._active < self.max_concurrency and not self._waiters:
+            self._active += 1
+            return True
+        if len(self._waiters) >= self.queue_max:
+            return self._shed("queue_full")
+        if self._expected_wait(len(self._waiters)) > self.queue_timeout:
+            return self._shed("deadline")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.queued += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+            return True
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as we gave up; pass it on
+                self._release()
+            else:
+                waiter.cancel()
+            try:
+                self._waiters.remove(waiter)
+            except ValueError:
+                pass
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            return self._shed("deadline")
+
+    def _release(self) -> None:
+        # Hand the slot straight to the next live waiter, if any
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self._active -= 1
+
+    @asynccontextmanager
+    async def admit(self, key: str) -> AsyncIterator[bool]:
+        """
+        `async with controller.admit(key) as admitted:` holds an LLM slot for
+        the block when `admitted` is True; when False, serve a fallback.
+        """
+        if not CHAT_ADMISSION_ENABLED:
+            yield True
+            return
+        if not await self._acquire(key):
+            yield False
+            return
+        self.admitted += 1
+        start = time.monotonic()
+        try:
+            yield True
+        finally:
+            held = time.monotonic() - start
+            if self._service_time is None:
+                self._service_time = held
+            else:
+                self._service_time += SERVICE_TIME_ALPHA * (held - self._service_time)
+            self._release()
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    @property
+    def depth(self) -> int:
+        return sum(1 for w in self._waiters if not w.done())
+
+    def stats(self) -> dict:
+        return {
+            "enabled": CHAT_ADMISSION_ENABLED,
+            "max_concurrency": self.max_concurrency,
+            "active": self._active,
+            "queue_depth": self.depth,
+            "queue_max": self.queue_max,
+            "queue_timeout_seconds": self.queue_timeout,
+            "service_time_ms": round(self._service_time * 1000, 1) if self._service_time else None,
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "shed": dict(self.shed),
+            "per_user": self.user_limiter.stats(),
+        }
+
+
+chat_admission = AdmissionController()
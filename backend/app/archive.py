@@ -0,0 +1,406 @@
+"""
+Retention and archival for chat_messages and symptom_checks (SQLite backend).
+
+Rows older than the table's retention window are moved, oldest first, into
+gzip-compressed JSONL files under ARCHIVE_DIR and then deleted from the live
+table. Within a file each user's rows form one gzip member, newest first,
+and `archive_segments` records where every member starts and ends, so
+reading one user's archived history decompresses only that user's members.
+After each run, freed pages go back to the filesystem with
+`PRAGMA incremental_vacuum` and the planner statistics are refreshed.
+
+Because each batch takes the globally oldest rows (by created_ts, id), every
+archived row sorts before every live row. History pages therefore read the
+live table first and continue into the archive once it runs out
+(see main.history_page). Trend rollups are kept. Archived rows drop out of
+full-text search.
+
+Runs in the background when ARCHIVE_ENABLED=true, at most once per interval
+across all workers, or on demand:
+
+    python archive.py run
+    python archive.py run --full-vacuum   # also convert an old database (blocks writers)
+    python archive.py stats
+"""
+import asyncio
+import gzip
+import json
+import logging
+import os
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+
+from db import DB_PATH, get_db, utc_now
+from metrics import record_error, timed
+from storage import HISTORY_COLUMNS, select_list
+
+logger = logging.getLogger("safelink")
+
+# ---------- Config ----------
+ARCHIVE_ENABLED = os.getenv("ARCHIVE_ENABLED", "false").lower() == "true"
+# History endpoints page into archived rows; they only look once a table has
+# archive segments (see has_archived), so this costs nothing until then
+ARCHIVE_READS_ENABLED = os.getenv("ARCHIVE_READS_ENABLED", "true").lower() == "true"
+# How often a worker that has seen no segments for a table looks again
+ARCHIVE_SEGMENTS_RECHECK_SECONDS = float(os.getenv("ARCHIVE_SEGMENTS_RECHECK_SECONDS", "60"))
+ARCHIVE_DIR = Path(os.getenv("ARCHIVE_DIR", str(DB_PATH.parent / "archive")))
+RETENTION_DAYS = {
+    "chat_messages": int(os.getenv("CHAT_RETENTION_DAYS", "180")),
+    "symptom_checks": int(os.getenv("SYMPTOM_RETENTION_DAYS", "365")),
+}
+ARCHIVE_INTERVAL_SECONDS = int(os.getenv("ARCHIVE_INTERVAL_SECONDS", str(6 * 3600)))
+# Rows per archive file (one transaction each)
+ARCHIVE_BATCH_ROWS = int(os.getenv("ARCHIVE_BATCH_ROWS", "20000"))
+ARCHIVE_COMPRESS_LEVEL = int(os.getenv("ARCHIVE_COMPRESS_LEVEL", "6"))
+# Pages returned to the filesystem per run; 0 = all free pages
+ARCHIVE_VACUUM_PAGES = int(os.getenv("ARCHIVE_VACUUM_PAGES", "0"))
+# Databases created before incremental auto-vacuum need one full VACUUM to
+# switch. It rewrites the whole file and blocks writers meanwhile, so the
+# background job leaves it alone unless this opts in; otherwise run
+# `python archive.py run --full-vacuum` in a maintenance window.
+ARCHIVE_ALLOW_FULL_VACUUM = os.getenv("ARCHIVE_ALLOW_FULL_VACUUM", "false").lower() == "true"
+
+ARCHIVE_COLUMNS = {
+    "symptom_checks": (
+        "id", "user_id", "age", "temperature", "symptoms_text",
+        "risk_level", "risk_score", "advice", "created_at", "created_ts",
+    ),
+    "chat_messages": ("id", "user_id", "role", "content", "created_at", "created_ts"),
+}
+
+# Keys a history reader gets back, same as a live row
+_HISTORY_KEYS = {table: [*columns, "created_ts"] for table, columns in HISTORY_COLUMNS.items()}
+
+DAY_MS = 24 * 3600 * 1000
+
+
+# ---------- Writing ----------
+def _write_segment_file(path: Path, rows: List[dict]) -> List[tuple]:
+    """
+    Write `rows` (oldest first) as one gzip member per user, newest first
+    within the member. Returns manifest tuples
+    (user_id, offset, length, rows, min_ts, min_id, max_ts, max_id).
+    """
+    by_user: Dict[int, List[dict]] = defaultdict(list)
+    for row in rows:
+        by_user[row["user_id"]].append(row)
+
+    manifest = []
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp, "wb") as f:
+        for user_id, user_rows in by_user.items():
+            user_rows.reverse()
+            payload = "".join(
+                json.dumps(r, ensure_ascii=False, separators=(",", ":")) + "\n" for r in user_rows
+            ).encode("utf-8")
+            member = gzip.compress(payload, compresslevel=ARCHIVE_COMPRESS_LEVEL, mtime=0)
+            manifest.append((
+                user_id, f.tell(), len(member), len(user_rows),
+                user_rows[-1]["created_ts"], user_rows[-1]["id"],
+                user_rows[0]["created_ts"], user_rows[0]["id"],
+            ))
+            f.write(member)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return manifest
+
+
+def _archive_batch(table: str, cutoff_ms: int, limit: int) -> int:
+    columns = ARCHIVE_COLUMNS[table]
+    with get_db() as conn:
+        rows = [
+            dict(row)
+            for row in conn.execute(
+                f"""
+                SELECT {select_list(columns)} FROM {table}
+                WHERE created_ts < ?
+                ORDER BY created_ts, id
+                LIMIT ?
+                """,
+                (cutoff_ms, limit),
+            )
+        ]
+    if not rows:
+        return 0
+
+    first, last = rows[0], rows[-1]
+    relative = Path(table) / f"{table}-{first['created_ts']}-{first['id']}.jsonl.gz"
+    path = ARCHIVE_DIR / relative
+    path.parent.mkdir(parents=True, exist_ok=True)
+    manifest = _write_segment_file(path, rows)
+
+    _, now_ms = utc_now()
+    try:
+        with get_db() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            deleted = conn.execute(
+                f"DELETE FROM {table} WHERE (created_ts, id) <= (?, ?)",
+                (last["created_ts"], last["id"]),
+            ).rowcount
+            if deleted != len(rows):
+                # Another worker archived (part of) this range first
+                conn.rollback()
+                path.unlink(missing_ok=True)
+                return 0
+            conn.executemany(
+                """
+                INSERT INTO archive_segments (
+                    table_name, path, user_id, offset, length, rows,
+                    min_ts, min_id, max_ts, max_id, created_ts
+                )
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                [(table, str(relative), *m, now_ms) for m in manifest],
+            )
+    except Exception:
+        path.unlink(missing_ok=True)
+        raise
+    _segments_seen[table] = (True, time.monotonic())
+    return len(rows)
+
+
+@timed("archive_table")
+def archive_table(table: str, retention_days: int, batch_rows: int = ARCHIVE_BATCH_ROWS) -> int:
+    """Archive every row older than `retention_days`; returns the row count."""
+    if retention_days <= 0:
+        return 0
+    _, now_ms = utc_now()
+    cutoff_ms = now_ms - retention_days * DAY_MS
+    total = 0
+    while True:
+        archived = _archive_batch(table, cutoff_ms, batch_rows)
+        if not archived:
+            return total
+        total += archived
+
+
+def _compact(tables, full_vacuum: bool = ARCHIVE_ALLOW_FULL_VACUUM) -> dict:
+    with get_db() as conn:
+        mode = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+        freed_before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    result = {"auto_vacuum": mode, "free_pages_before": freed_before, "full_vacuum": False}
+    if mode == 0 and not full_vacuum:
+        logger.info(
+            "Archive: database is not in incremental auto-vacuum mode, so freed pages stay "
+            "in the file; run `python archive.py run --full-vacuum` once to switch"
+        )
+    with get_db() as conn:
+        if mode == 0 and full_vacuum:
+            # One-off switch to incremental mode; rewrites the whole file
+            logger.info("Archive: converting database to incremental auto-vacuum (full VACUUM)")
+            conn.executescript("PRAGMA auto_vacuum = INCREMENTAL; VACUUM;")
+            result["full_vacuum"] = True
+        elif mode == 2:
+            pages = f"({ARCHIVE_VACUUM_PAGES})" if ARCHIVE_VACUUM_PAGES > 0 else ""
+            # executescript steps the pragma to completion (execute frees one page)
+            conn.executescript(f"PRAGMA incremental_vacuum{pages};")
+        for table in tables:
+            conn.execute(f"ANALYZE {table}")
+        result["free_pages_after"] = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    return result
+
+
+def _claim_run(interval: int) -> Optional[int]:
+    """Start a run unless another worker started one within `interval` seconds."""
+    _, now_ms = utc_now()
+    with get_db() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        last = conn.execute("SELECT MAX(started_ts) FROM archive_runs").fetchone()[0]
+        if last is not None and now_ms - last < interval * 1000:
+            conn.rollback()
+            return None
+        return conn.execute(
+            "INSERT INTO archive_runs (started_ts) VALUES (?)", (now_ms,)
+        ).lastrowid
+
+
+def run_maintenance(
+    interval: int = 0, full_vacuum: bool = ARCHIVE_ALLOW_FULL_VACUUM
+) -> Optional[dict]:
+    """
+    Archive both tables and compact the file. With `interval`, skips (returns
+    None) when any worker already ran within that many seconds. `full_vacuum`
+    allows the one-off VACUUM that switches an old database to incremental
+    auto-vacuum.
+    """
+    run_id = _claim_run(interval)
+    if run_id is None:
+        return None
+    start = time.perf_counter()
+    archived = {table: archive_table(table, days) for table, days in RETENTION_DAYS.items()}
+    compaction = None
+    if any(archived.values()) or full_vacuum:
+        compaction = _compact(RETENTION_DAYS, full_vacuum)
+    _, now_ms = utc_now()
+    with get_db() as conn:
+        conn.execute(
+            "UPDATE archive_runs SET finished_ts = ?, rows = ? WHERE id = ?",
+            (now_ms, sum(archived.values()), run_id),
+        )
+    summary = {
+        "archived": archived,
+        "compaction": compaction,
+        "seconds": round(time.perf_counter() - start, 3),
+    }
+    logger.info("Archive run: %s", summary)
+    return summary
+
+
+# ---------- Reading ----------
+# table -> (has segments, time.monotonic() when checked)
+_segments_seen: Dict[str, Tuple[bool, float]] = {}
+
+
+def archived_hint(table: str) -> Optional[bool]:
+    """
+    Cached has_archived() answer, or None when it needs a fresh look. Once a
+    table has segments it always will; "none" is re-checked every
+    ARCHIVE_SEGMENTS_RECHECK_SECONDS so a worker notices another worker's
+    first run.
+    """
+    seen = _segments_seen.get(table)
+    if seen is None:
+        return None
+    found, checked = seen
+    if found or time.monotonic() - checked < ARCHIVE_SEGMENTS_RECHECK_SECONDS:
+        return found
+    return None
+
+
+def has_archived(table: str) -> bool:
+    """Whether any rows of `table` were archived (one indexed lookup)."""
+    with get_db() as conn:
+        found = conn.execute(
+            "SELECT 1 FROM archive_segments WHERE table_name = ? LIMIT 1", (table,)
+        ).fetchone() is not None
+    _segments_seen[table] = (found, time.monotonic())
+    return found
+
+
+def _segments(table: str, user_id: int, after: Optional[Tuple[int, int]]) -> List:
+    sql = "SELECT path, offset, length FROM archive_segments WHERE table_name = ? AND user_id = ?"
+    params: list = [table, user_id]
+    if after:
+        sql += " AND (min_ts, min_id) < (?, ?)"
+        params.extend(after)
+    sql += " ORDER BY max_ts DESC, max_id DESC"
+    with get_db() as conn:
+        return conn.execute(sql, params).fetchall()
+
+
+def _read_member(path: str, offset: int, length: int) -> List[dict]:
+    with open(ARCHIVE_DIR / path, "rb") as f:
+        f.seek(offset)
+        data = gzip.decompress(f.read(length))
+    return [json.loads(line) for line in data.decode("utf-8").splitlines()]
+
+
+def iter_history(
+    table: str,
+    user_id: int,
+    limit: Optional[int] = None,
+    after: Optional[Tuple[int, int]] = None,
+) -> Iterator[dict]:
+    """Archived rows for the user, newest first and strictly after `after`."""
+    if limit is not None and limit <= 0:
+        return
+    keys = _HISTORY_KEYS[table]
+    count = 0
+    for segment in _segments(table, user_id, after):
+        for row in _read_member(segment["path"], segment["offset"], segment["length"]):
+            if after and (row["created_ts"], row["id"]) >= after:
+                continue
+            yield {k: row[k] for k in keys}
+            count += 1
+            if limit is not None and count >= limit:
+                return
+
+
+@timed("archive_read_history")
+def read_history(
+    table: str, user_id: int, limit: int, after: Optional[Tuple[int, int]] = None
+) -> List[dict]:
+    return list(iter_history(table, user_id, limit, after))
+
+
+def stats() -> dict:
+    with get_db() as conn:
+        segments = conn.execute(
+            """
+            SELECT table_name, COUNT(DISTINCT path) AS files, SUM(rows) AS rows,
+                   SUM(length) AS bytes
+            FROM archive_segments GROUP BY table_name
+            """
+        ).fetchall()
+        last = conn.execute(
+            "SELECT started_ts, finished_ts, rows FROM archive_runs ORDER BY id DESC LIMIT 1"
+        ).fetchone()
+    return {
+        "enabled": ARCHIVE_ENABLED,
+        "retention_days": RETENTION_DAYS,
+        "interval_seconds": ARCHIVE_INTERVAL_SECONDS,
+        "tables": {
+            row["table_name"]: {"files": row["files"], "rows": row["rows"], "bytes": row["bytes"]}
+            for row in segments
+        },
+        "last_run": dict(last) if last else None,
+    }
+
+
+# ---------- Scheduling ----------
+class ArchiveScheduler:
+    """Background task running run_maintenance() every `interval` seconds."""
+
+    def __init__(self, interval: int = ARCHIVE_INTERVAL_SECONDS):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await run_in_threadpool(run_maintenance, self.interval)
+            except Exception as e:
+                record_error("archive", "Archive run failed", e)
+            await asyncio.sleep(self.interval)
+
+
+archive_scheduler = ArchiveScheduler()
+
+
+def main_cli(argv: List[str]) -> int:
+    if argv[:1] == ["run"] and set(argv[1:]) <= {"--full-vacuum"}:
+        from migrations import migrate
+
+        with get_db() as conn:
+            migrate(conn)
+        full_vacuum = "--full-vacuum" in argv or ARCHIVE_ALLOW_FULL_VACUUM
+        print(json.dumps(run_maintenance(full_vacuum=full_vacuum), indent=2))
+        return 0
+    if argv[:1] == ["stats"]:
+        print(json.dumps(stats(), indent=2))
+        return 0
+    print("usage: python archive.py run [--full-vacuum] | stats", file=sys.stderr)
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli(sys.argv[1:]))
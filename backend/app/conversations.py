@@ -0,0 +1,239 @@
+import os
+import re
+import threading
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+# ---------- Config ----------
+CHAT_CONTEXT_ENABLED = os.getenv("CHAT_CONTEXT_ENABLED", "true").lower() == "true"
+CHAT_CONTEXT_MAX_USERS = int(os.getenv("CHAT_CONTEXT_MAX_USERS", "1000"))
+# Budget for verbatim recent turns; older turns are folded into the summary.
+CHAT_CONTEXT_TOKEN_BUDGET = int(os.getenv("CHAT_CONTEXT_TOKEN_BUDGET", "1200"))
+CHAT_CONTEXT_SUMMARY_TOKENS = int(os.getenv("CHAT_CONTEXT_SUMMARY_TOKENS", "250"))
+# Messages read from storage when a user's context is not in memory.
+CHAT_CONTEXT_LOAD_MESSAGES = int(os.getenv("CHAT_CONTEXT_LOAD_MESSAGES", "20"))
+# Check each turn that no other worker or node stored newer messages for the
+# user (one indexed MAX(created_ts) read). "auto": on when WEB_CONCURRENCY > 1
+# or the storage is shared PostgreSQL.
+CHAT_CONTEXT_VERIFY = os.getenv("CHAT_CONTEXT_VERIFY", "auto").lower()
+if CHAT_CONTEXT_VERIFY == "auto":
+    CHAT_CONTEXT_VERIFY = (
+        int(os.getenv("WEB_CONCURRENCY", "1")) > 1
+        or os.getenv("STORAGE_BACKEND", "sqlite").lower() == "postgres"
+    )
+else:
+    CHAT_CONTEXT_VERIFY = CHAT_CONTEXT_VERIFY == "true"
+
+SUMMARY_POINT_CHARS = 160
+SUMMARY_HEADER = "Summary of earlier turns in this conversation:"
+
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s")
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token for English text)."""
+    return len(text) // 4 + 1
+
+
+def summarize_turn(role: str, content: str) -> str:
+    """Extractive one-line summary of a turn: its first sentence, clipped."""
+    text = " ".join(content.split())
+    first = _SENTENCE_END_RE.split(text, maxsplit=1)[0]
+    if len(first) > SUMMARY_POINT_CHARS:
+        first = first[:SUMMARY_POINT_CHARS].rsplit(" ", 1)[0] + "..."
+    prefix = "User asked" if role == "user" else "Assistant said"
+    return f"{prefix}: {first}"
+
+
+class Conversation:
+    """
+    One user's prompt context: a rolling window of recent turns kept under
+    `budget` tokens, plus a bounded list of one-line summaries of the turns
+    that fell out of the window. The chat-format messages are built once and
+    reused until the conversation changes.
+    """
+
+    __slots__ = ("turns", "turn_tokens", "summary", "summary_tokens", "last_ts", "_messages")
+
+    def __init__(self) -> None:
+        self.turns: Deque[Tuple[str, str, int]] = deque()
+        self.turn_tokens = 0
+        self.summary: Deque[Tuple[str, int]] = deque()
+        self.summary_tokens = 0
+        # created_ts of the newest chat row folded in
+        self.last_ts = 0
+        self._messages: Optional[List[Dict[str, str]]] = None
+
+    def add(
+        self, role: str, content: str, created_ts: int, budget: int, summary_budget: int
+    ) -> int:
+        """Append a turn and trim to budget. Returns how many turns were summarized."""
+        self.last_ts = max(self.last_ts, created_ts)
+        tokens = estimate_tokens(content)
+        self.turns.append((role, content, tokens))
+        self.turn_tokens += tokens
+        self._messages = None
+
+        summarized = 0
+        # Always keep the newest turn verbatim, even if it alone is over budget
+        while self.turn_tokens > budget and len(self.turns) > 1:
+            old_role, old_content, old_tokens = self.turns.popleft()
+            self.turn_tokens -= old_tokens
+            point = summarize_turn(old_role, old_content)
+            point_tokens = estimate_tokens(point)
+            self.summary.append((point, point_tokens))
+            self.summary_tokens += point_tokens
+            summarized += 1
+        while self.summary_tokens > summary_budget and self.summary:
+            _, point_tokens = self.summary.popleft()
+            self.summary_tokens -= point_tokens
+        return summarized
+
+    def messages(self) -> List[Dict[str, str]]:
+        if self._messages is None:
+            messages = []
+            if self.summary:
+                points = "\n".join(f"- {point}" for point, _ in self.summary)
+                messages.append({"role": "system", "content": f"{SUMMARY_HEADER}\n{points}"})
+            messages.extend({"role": role, "content": content} for role, content, _ in self.turns)
+            self._messages = messages
+        return self._messages
+
+    @property
+    def tokens(self) -> int:
+        return self.turn_tokens + self.summary_tokens
+
+
+class ConversationStore:
+    """
+    Per-user conversation contexts, LRU-bounded to `max_users`.
+
+    A user's context is seeded from their last `load_messages` chat rows
+    (read by the caller through Storage.recent_chat_messages, so it follows
+    the configured backend) the first time it is needed and then kept up to
+    date in memory by record(), so a chat turn never re-reads or
+    re-serializes the whole history. Evicted users are simply seeded again
+    later.
+
+    Every worker process has its own store. When several workers (or API
+    nodes) serve the same user, pass the newest stored created_ts to
+    cached(): a context that is older than storage is dropped and seeded
+    again, so turns answered by another worker are not lost. Seeds also
+    take the caller's rows still waiting in the write-behind queue. A turn
+    another worker has not flushed yet (a few ms) can still be missed.
+    """
+
+    def __init__(
+        self,
+        max_users: int = CHAT_CONTEXT_MAX_USERS,
+        budget: int = CHAT_CONTEXT_TOKEN_BUDGET,
+        summary_budget: int = CHAT_CONTEXT_SUMMARY_TOKENS,
+        load_messages: int = CHAT_CONTEXT_LOAD_MESSAGES,
+    ):
+        self.max_users = max_users
+        self.budget = budget
+        self.summary_budget = summary_budget
+        self.load_messages = load_messages
+        self._conversations: "OrderedDict[int, Conversation]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.loads = 0
+        self.evictions = 0
+        self.stale = 0
+        self.summarized_turns = 0
+
+    def _build(self, rows, pending) -> Conversation:
+        conversation = Conversation()
+        turns = [(row["role"], row["content"], row["created_ts"]) for row in reversed(rows)]
+        stored = set(turns)
+        # Queued rows are (user_id, role, content, created_at, created_ts)
+        turns.extend(
+            turn for turn in ((r[1], r[2], r[4]) for r in pending) if turn not in stored
+        )
+        for role, content, created_ts in turns[max(0, len(turns) - self.load_messages):]:
+            conversation.add(role, content, created_ts, self.budget, self.summary_budget)
+        return conversation
+
+    def _store(self, user_id: int, conversation: Conversation) -> Conversation:
+        # caller holds the lock
+        existing = self._conversations.get(user_id)
+        if existing is not None:
+            # Another request loaded it first; keep theirs, it may be newer
+            return existing
+        self._conversations[user_id] = conversation
+        while len(self._conversations) > self.max_users:
+            self._conversations.popitem(last=False)
+            self.evictions += 1
+        return conversation
+
+    def cached(
+        self, user_id: int, stored_ts: Optional[int] = None
+    ) -> Optional[List[Dict[str, str]]]:
+        """
+        Prompt messages if the user's context is in memory and not older than
+        `stored_ts` (the newest stored chat row), else None.
+        """
+        with self._lock:
+            conversation = self._conversations.get(user_id)
+            if conversation is None:
+                return None
+            if stored_ts is not None and stored_ts > conversation.last_ts:
+                del self._conversations[user_id]
+                self.stale += 1
+                return None
+            self._conversations.move_to_end(user_id)
+            self.hits += 1
+            return conversation.messages()
+
+    def seed(self, user_id: int, rows, pending=()) -> List[Dict[str, str]]:
+        """
+        Build the user's context from their newest chat rows (newest first,
+        as returned by Storage.recent_chat_messages) plus rows not yet
+        committed (oldest first, as from WriteBehindQueue.pending) and
+        return its messages.
+        """
+        loaded = self._build(rows, pending)
+        with self._lock:
+            self.loads += 1
+            return self._store(user_id, loaded).messages()
+
+    def record(self, user_id: int, rows: List[tuple]) -> None:
+        """
+        Append one exchange (chat rows as built by main.chat_pair_rows) to
+        the user's context, if it is in memory.
+        """
+        with self._lock:
+            conversation = self._conversations.get(user_id)
+            if conversation is None:
+                return
+            for _, role, content, _, created_ts in rows:
+                self.summarized_turns += conversation.add(
+                    role, content, created_ts, self.budget, self.summary_budget
+                )
+
+    def forget(self, user_id: int) -> None:
+        with self._lock:
+            self._conversations.pop(user_id, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.loads
+            return {
+                "enabled": CHAT_CONTEXT_ENABLED,
+                "verify": CHAT_CONTEXT_VERIFY,
+                "users": len(self._conversations),
+                "max_users": self.max_users,
+                "token_budget": self.budget,
+                "summary_budget": self.summary_budget,
+                "hits": self.hits,
+                "loads": self.loads,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "stale": self.stale,
+                "summarized_turns": self.summarized_turns,
+                "tokens_in_memory": sum(c.tokens for c in self._conversations.values()),
+            }
+
+
+conversation_store = ConversationStore()
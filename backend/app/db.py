@@ -0,0 +1,197 @@
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+# ---------- Config ----------
+DB_PATH = Path(os.getenv("SAFELINK_DB_PATH", Path(__file__).parent / "safelink.db"))
+DB_POOL_SIZE = int(os.getenv("SAFELINK_DB_POOL_SIZE", "8"))
+DB_POOL_TIMEOUT = float(os.getenv("SAFELINK_DB_POOL_TIMEOUT", "10"))
+DB_BUSY_TIMEOUT_MS = int(os.getenv("SAFELINK_DB_BUSY_TIMEOUT_MS", "5000"))
+DB_CACHE_SIZE_KB = int(os.getenv("SAFELINK_DB_CACHE_SIZE_KB", "16384"))
+DB_MMAP_SIZE = int(os.getenv("SAFELINK_DB_MMAP_SIZE", str(256 * 1024 * 1024)))
+# Per-connection prepared statement cache (sqlite3 default is 128).
+DB_STATEMENT_CACHE = int(os.getenv("SAFELINK_DB_STATEMENT_CACHE", "256"))
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class PooledConnection(sqlite3.Connection):
+    """
+    sqlite3 connection that goes back to its pool on close().
+
+    Used both as `conn = get_db(); ...; conn.close()` and as
+    `with get_db() as conn:` (commit/rollback, then release).
+    """
+
+    _pool: Optional["ConnectionPool"] = None
+    _generation = 0
+
+    def close(self) -> None:
+        if self._pool is None:
+            super().close()
+        else:
+            self._pool.release(self)
+
+    def really_close(self) -> None:
+        super().close()
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            return super().__exit__(exc_type, exc, tb)
+        finally:
+            self.close()
+
+
+class ConnectionPool:
+    """
+    Fixed-size SQLite connection pool with thread affinity.
+
+    Each thread gets back the connection it used last when that connection
+    is idle, so its statement cache and page cache stay warm. Idle
+    connections owned by other threads are handed over when needed, and
+    callers wait (up to `timeout`) once `max_size` connections are busy.
+    """
+
+    def __init__(self, path: Path, max_size: int = DB_POOL_SIZE, timeout: float = DB_POOL_TIMEOUT):
+        self.path = Path(path)
+        self.max_size = max(1, max_size)
+        self.timeout = timeout
+        self._cond = threading.Condition()
+        self._all: List[PooledConnection] = []
+        self._idle: List[PooledConnection] = []
+        self._affinity: Dict[int, PooledConnection] = {}
+        # Bumped by close(); connections from an older generation are
+        # discarded on release instead of going back to the idle list.
+        self._generation = 0
+
+        # Metrics
+        self.acquires = 0
+        self.waits = 0
+        self.timeouts = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+
+    def _connect(self) -> PooledConnection:
+        conn = sqlite3.connect(
+            self.path,
+            factory=PooledConnection,
+            check_same_thread=False,
+            cached_statements=DB_STATEMENT_CACHE,
+            timeout=DB_BUSY_TIMEOUT_MS / 1000,
+        )
+        conn.row_factory = sqlite3.Row
+        # Only takes effect on a brand-new file, and only before WAL is set;
+        # lets archive.py hand freed pages back with incremental_vacuum.
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA cache_size=-{DB_CACHE_SIZE_KB}")
+        conn.execute(f"PRAGMA mmap_size={DB_MMAP_SIZE}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}")
+        conn._pool = self
+        conn._generation = self._generation
+        return conn
+
+    def acquire(self) -> PooledConnection:
+        thread_id = threading.get_ident()
+        start = time.perf_counter()
+        waited = False
+        with self._cond:
+            while True:
+                conn = self._affinity.get(thread_id)
+                if conn is not None and conn in self._idle:
+                    self._idle.remove(conn)
+                    break
+                if self._idle:
+                    conn = self._idle.pop()
+                    break
+                if len(self._all) < self.max_size:
+                    conn = self._connect()
+                    self._all.append(conn)
+                    break
+
+                waited = True
+                remaining = self.timeout - (time.perf_counter() - start)
+                if remaining <= 0:
+                    self.timeouts += 1
+                    raise PoolTimeout(
+                        f"Timed out after {self.timeout}s waiting for a DB connection."
+                    )
+                self._cond.wait(remaining)
+
+            self._affinity[thread_id] = conn
+            elapsed = time.perf_counter() - start
+            self.acquires += 1
+            if waited:
+                self.waits += 1
+            self.wait_time_total += elapsed
+            self.wait_time_max = max(self.wait_time_max, elapsed)
+        return conn
+
+    def release(self, conn: PooledConnection) -> None:
+        if conn.in_transaction:
+            conn.rollback()
+        with self._cond:
+            if conn._generation != self._generation:
+                conn.really_close()
+                if conn in self._all:
+                    self._all.remove(conn)
+                self._cond.notify()
+                return
+            if conn not in self._idle:
+                self._idle.append(conn)
+            self._cond.notify()
+
+    def close(self) -> None:
+        """
+        Close idle connections now and busy ones when they are released.
+        The pool stays usable and reopens connections on demand.
+        """
+        with self._cond:
+            self._generation += 1
+            for conn in self._idle:
+                conn.really_close()
+            self._all = [c for c in self._all if c not in self._idle]
+            self._idle.clear()
+            self._affinity.clear()
+            self._cond.notify_all()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "max_size": self.max_size,
+                "size": len(self._all),
+                "idle": len(self._idle),
+                "in_use": len(self._all) - len(self._idle),
+                "acquires": self.acquires,
+                "waits": self.waits,
+                "timeouts": self.timeouts,
+                "wait_time_total_ms": round(self.wait_time_total * 1000, 3),
+                "wait_time_avg_ms": round(
+                    self.wait_time_total * 1000 / self.acquires, 3
+                ) if self.acquires else 0.0,
+                "wait_time_max_ms": round(self.wait_time_max * 1000, 3),
+            }
+
+
+db_pool = ConnectionPool(DB_PATH)
+
+
+def get_db() -> PooledConnection:
+    return db_pool.acquire()
+
+
+def utc_now() -> Tuple[str, int]:
+    """
+    Current UTC time as (ISO-8601 text, epoch milliseconds), the pair stored
+    in every `created_at` / `created_ts` column.
+    """
+    now = datetime.now(timezone.utc)
+    return now.replace(tzinfo=None).isoformat(), int(now.timestamp() * 1000)
@@ -0,0 +1,223 @@
+import asyncio
+import math
+import os
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+# ---------- Config ----------
+GEO_CACHE_PRECISION = int(os.getenv("GEO_CACHE_PRECISION", "5"))  # ~4.9 km tiles
+GEO_CACHE_TTL_SECONDS = float(os.getenv("GEO_CACHE_TTL_SECONDS", str(6 * 3600)))
+# How long past the TTL a stale entry may still be served while it refreshes.
+GEO_CACHE_STALE_SECONDS = float(os.getenv("GEO_CACHE_STALE_SECONDS", str(24 * 3600)))
+GEO_CACHE_MAX_ENTRIES = int(os.getenv("GEO_CACHE_MAX_ENTRIES", "5000"))
+# Requested radii are rounded up to one of these so nearby callers share keys.
+RADIUS_BUCKETS_M = [1000, 2000, 5000, 10000, 20000, 50000]
+
+EARTH_RADIUS_M = 6371008.8
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def haversine_m(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp = p2 - p1
+    dl = math.radians(lng2 - lng1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+def geohash_encode(lat: float, lng: float, precision: int = GEO_CACHE_PRECISION) -> str:
+    lat_lo, lat_hi = -90.0, 90.0
+    lng_lo, lng_hi = -180.0, 180.0
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(chars) < precision:
+        if even:
+            mid = (lng_lo + lng_hi) / 2
+            if lng >= mid:
+                bits = bits * 2 + 1
+                lng_lo = mid
+            else:
+                bits = bits * 2
+                lng_hi = mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if lat >= mid:
+                bits = bits * 2 + 1
+                lat_lo = mid
+            else:
+                bits = bits * 2
+                lat_hi = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_BASE32[bits])
+            bits = 0
+            bit_count = 0
+    return "".join(chars)
+
+
+def geohash_bounds(geohash: str) -> Tuple[float, float, float, float]:
+    """(min_lat, max_lat, min_lng, max_lng) of a geohash cell."""
+    lat_lo, lat_hi = -90.0, 90.0
+    lng_lo, lng_hi = -180.0, 180.0
+    even = True
+    for ch in geohash:
+        value = _BASE32.index(ch)
+        for shift in range(4, -1, -1):
+            bit = (value >> shift) & 1
+            if even:
+                mid = (lng_lo + lng_hi) / 2
+                if bit:
+                    lng_lo = mid
+                else:
+                    lng_hi = mid
+            else:
+                mid = (lat_lo + lat_hi) / 2
+                if bit:
+                    lat_lo = mid
+                else:
+                    lat_hi = mid
+            even = not even
+    return lat_lo, lat_hi, lng_lo, lng_hi
+
+
+def radius_bucket(radius_m: float) -> int:
+    for bucket in RADIUS_BUCKETS_M:
+        if radius_m <= bucket:
+            return bucket
+    return RADIUS_BUCKETS_M[-1]
+
+
+class _TileEntry:
+    __slots__ = ("value", "fetched_at")
+
+    def __init__(self, value: List[dict], fetched_at: float):
+        self.value = value
+        self.fetched_at = fetched_at
+
+
+Fetch = Callable[[float, float, int], Awaitable[List[dict]]]
+
+
+class TileCache:
+    """
+    Cache of upstream geo queries keyed by (geohash tile, radius bucket).
+
+    A miss fetches once for the whole tile: the query is centered on the
+    tile and widened by the tile's half-diagonal, so its result covers the
+    requested radius for any caller inside the tile, and callers filter and
+    distance-sort it locally. Concurrent misses for the same key share one
+    in-flight fetch. Entries are fresh for `ttl` seconds; after that they are
+    served stale for up to `stale` more seconds while a single background
+    refresh runs.
+    """
+
+    def __init__(
+        self,
+        precision: int = GEO_CACHE_PRECISION,
+        ttl: float = GEO_CACHE_TTL_SECONDS,
+        stale: float = GEO_CACHE_STALE_SECONDS,
+        max_entries: int = GEO_CACHE_MAX_ENTRIES,
+    ):
+        self.precision = precision
+        self.ttl = ttl
+        self.stale = stale
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, int], _TileEntry]" = OrderedDict()
+        self._inflight: Dict[Tuple[str, int], asyncio.Future] = {}
+
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.upstream_calls = 0
+        self.upstream_errors = 0
+
+    def key(self, lat: float, lng: float, radius_m: float) -> Tuple[str, int]:
+        return geohash_encode(lat, lng, self.precision), radius_bucket(radius_m)
+
+    @staticmethod
+    def tile_query(key: Tuple[str, int]) -> Tuple[float, float, int]:
+        """Center and radius of the upstream query that covers a whole tile."""
+        geohash, bucket = key
+        min_lat, max_lat, min_lng, max_lng = geohash_bounds(geohash)
+        lat, lng = (min_lat + max_lat) / 2, (min_lng + max_lng) / 2
+        half_diagonal = haversine_m(lat, lng, max_lat, max_lng)
+        return lat, lng, int(bucket + half_diagonal) + 1
+
+    def _store(self, key: Tuple[str, int], value: List[dict]) -> None:
+        self._entries[key] = _TileEntry(value, time.monotonic())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _fetch(self, key: Tuple[str, int], fetch: Fetch) -> asyncio.Future:
+        """Start (or join) the single upstream fetch for `key`."""
+        future = self._inflight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            return future
+
+        async def run() -> List[dict]:
+            self.upstream_calls += 1
+            try:
+                value = await fetch(*self.tile_query(key))
+            except Exception:
+                self.upstream_errors += 1
+                raise
+            finally:
+                self._inflight.pop(key, None)
+            self._store(key, value)
+            return value
+
+        future = asyncio.ensure_future(run())
+        # Background refreshes may have no awaiter; don't log their errors twice.
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._inflight[key] = future
+        return future
+
+    async def get(self, lat: float, lng: float, radius_m: float, fetch: Fetch) -> List[dict]:
+        key = self.key(lat, lng, radius_m)
+        entry = self._entries.get(key)
+        if entry is not None:
+            age = time.monotonic() - entry.fetched_at
+            if age < self.ttl:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return entry.value
+            if age < self.ttl + self.stale:
+                self.stale_hits += 1
+                self._fetch(key, fetch)
+                return entry.value
+        self.misses += 1
+        # shield: one caller disconnecting must not cancel the shared fetch
+        return await asyncio.shield(self._fetch(key, fetch))
+
+    async def refresh(self, lat: float, lng: float, radius_m: float, fetch: Fetch) -> None:
+        """
+        Revalidate a tile unless it was fetched within the TTL, joining any
+        fetch already in flight.
+        """
+        key = self.key(lat, lng, radius_m)
+        entry = self._entries.get(key)
+        if entry is not None and time.monotonic() - entry.fetched_at < self.ttl:
+            return
+        await asyncio.shield(self._fetch(key, fetch))
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "hit_ratio": round((self.hits + self.stale_hits) / lookups, 4) if lookups else 0.0,
+            "coalesced": self.coalesced,
+            "upstream_calls": self.upstream_calls,
+            "upstream_errors": self.upstream_errors,
+            "inflight": len(self._inflight),
+        }
@@ -0,0 +1,367 @@
+"""
+Local hospital index.
+
+Hospitals are stored in SQLite (`hospitals` plus an R*Tree over their
+coordinates) so /api/nearby-hospitals can answer with a bounding-box lookup
+and haversine ranking instead of a live Overpass query.
+
+The index also records which circles it is complete for
+(`hospital_coverage`: one row per Overpass fetch or file import). A lookup
+is only answered locally when its circle lies inside a covered one; a wider
+query than anything fetched so far goes to Overpass, so a 20 km search after
+an earlier 2 km fetch doesn't return just the few hospitals near the center.
+
+Seed it offline from an OSM extract (Overpass JSON) or a GeoJSON file:
+
+    python hospitals.py import hospitals.geojson
+"""
+import json
+import math
+import os
+import sys
+from typing import Iterable, List, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+
+from db import get_db, utc_now
+from geo_cache import TileCache, haversine_m
+from llm import get_http_client
+from metrics import STAGE_SECONDS, record_error, timed
+
+# ---------- Config ----------
+OVERPASS_URL = os.getenv("OVERPASS_URL", "https://overpass-api.de/api/interpreter")
+OVERPASS_TIMEOUT = float(os.getenv("OVERPASS_TIMEOUT", "25"))
+# Query Overpass when the local index has nothing for an area.
+HOSPITALS_OVERPASS_FALLBACK = os.getenv("HOSPITALS_OVERPASS_FALLBACK", "true").lower() == "true"
+# Local rows older than this are refreshed from Overpass in the background.
+HOSPITALS_REFRESH_SECONDS = int(os.getenv("HOSPITALS_REFRESH_SECONDS", str(7 * 24 * 3600)))
+HOSPITALS_MAX_RESULTS = int(os.getenv("HOSPITALS_MAX_RESULTS", "50"))
+HOSPITALS_MAX_RADIUS_M = int(os.getenv("HOSPITALS_MAX_RADIUS_M", "50000"))
+
+METERS_PER_DEGREE_LAT = 111320.0
+
+
+def bounding_box(lat: float, lng: float, radius_m: float):
+    dlat = radius_m / METERS_PER_DEGREE_LAT
+    dlng = radius_m / (METERS_PER_DEGREE_LAT * max(0.01, math.cos(math.radians(lat))))
+    return lat - dlat, lat + dlat, lng - dlng, lng + dlng
+
+
+def rank(
+    hospitals: Iterable[dict],
+    lat: float,
+    lng: float,
+    radius_m: float,
+    limit: int = HOSPITALS_MAX_RESULTS,
+) -> List[dict]:
+    """Hospitals within `radius_m`, nearest first, with `distance_m` set."""
+    ranked = []
+    for h in hospitals:
+        distance = haversine_m(lat, lng, h["lat"], h["lng"])
+        if distance <= radius_m:
+            ranked.append({**h, "distance_m": distance})
+    ranked.sort(key=lambda h: h["distance_m"])
+    return ranked[:limit]
+
+
+# ---------- Parsing ----------
+def _address(tags: dict, name: str) -> str:
+    if tags.get("addr:full"):
+        return tags["addr:full"]
+    street = " ".join(p for p in (tags.get("addr:housenumber"), tags.get("addr:street")) if p)
+    parts = [p for p in (street, tags.get("addr:city")) if p]
+    return ", ".join(parts) if parts else name
+
+
+def parse_overpass(data: dict) -> List[dict]:
+    hospitals = []
+    for el in data.get("elements", []):
+        tags = el.get("tags", {})
+        name = tags.get("name", "Unnamed Hospital")
+        if "lat" in el and "lon" in el:
+            lat, lng = el["lat"], el["lon"]
+        elif "center" in el:
+            lat, lng = el["center"]["lat"], el["center"]["lon"]
+        else:
+            continue
+        hospitals.append({
+            "osm_key": f"{el.get('type', 'node')}/{el.get('id')}",
+            "place_id": str(el.get("id")),
+            "name": name,
+            "address": _address(tags, name),
+            "lat": lat,
+            "lng": lng,
+        })
+    return hospitals
+
+
+def _centroid(geometry: dict) -> Optional[tuple]:
+    coords = geometry.get("coordinates")
+    kind = geometry.get("type")
+    if kind == "Point":
+        return coords[1], coords[0]
+    # Polygons etc.: average of all vertices is close enough for a building
+    flat = []
+
+    def walk(c):
+        if c and isinstance(c[0], (int, float)):
+            flat.append(c)
+        else:
+            for sub in c or []:
+                walk(sub)
+
+    walk(coords)
+    if not flat:
+        return None
+    return sum(p[1] for p in flat) / len(flat), sum(p[0] for p in flat) / len(flat)
+
+
+def parse_geojson(data: dict) -> List[dict]:
+    hospitals = []
+    for i, feature in enumerate(data.get("features", [])):
+        props = feature.get("properties") or {}
+        point = _centroid(feature.get("geometry") or {})
+        if point is None:
+            continue
+        osm_id = props.get("@id") or props.get("osm_id") or feature.get("id") or f"geojson/{i}"
+        name = props.get("name", "Unnamed Hospital")
+        hospitals.append({
+            "osm_key": str(osm_id),
+            "place_id": str(osm_id).split("/")[-1],
+            "name": name,
+            "address": _address(props, name),
+            "lat": point[0],
+            "lng": point[1],
+        })
+    return hospitals
+
+
+# ---------- Storage ----------
+_rtree_available: Optional[bool] = None
+
+
+def _has_rtree(conn) -> bool:
+    global _rtree_available
+    if _rtree_available is None:
+        row = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'hospitals_rtree'"
+        ).fetchone()
+        _rtree_available = row is not None
+    return _rtree_available
+
+
+def _record_coverage(conn, lat: float, lng: float, radius_m: float, source: str, now_ts: int) -> None:
+    """Remember that the index is complete within `radius_m` of (lat, lng)."""
+    min_lat, max_lat, min_lng, max_lng = bounding_box(lat, lng, radius_m)
+    # Drop the circles this one contains so the table stays small
+    for row in conn.execute(
+        "SELECT id, lat, lng, radius_m FROM hospital_coverage "
+        "WHERE min_lat >= ? AND max_lat <= ? AND min_lng >= ? AND max_lng <= ?",
+        (min_lat, max_lat, min_lng, max_lng),
+    ).fetchall():
+        if haversine_m(lat, lng, row["lat"], row["lng"]) + row["radius_m"] <= radius_m:
+            conn.execute("DELETE FROM hospital_coverage WHERE id = ?", (row["id"],))
+    conn.execute(
+        """
+        INSERT INTO hospital_coverage
+            (lat, lng, radius_m, min_lat, max_lat, min_lng, max_lng, source, fetched_ts)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        (lat, lng, radius_m, min_lat, max_lat, min_lng, max_lng, source, now_ts),
+    )
+
+
+def _coverage_ts(conn, lat: float, lng: float, radius_m: float) -> Optional[int]:
+    """
+    Latest fetch time of a covered circle containing the whole query circle,
+    or None when the query reaches outside everything fetched so far.
+    """
+    rows = conn.execute(
+        "SELECT lat, lng, radius_m, fetched_ts FROM hospital_coverage "
+        "WHERE min_lat <= ? AND max_lat >= ? AND min_lng <= ? AND max_lng >= ?",
+        (lat, lat, lng, lng),
+    ).fetchall()
+    covering = [
+        r["fetched_ts"] for r in rows
+        if haversine_m(lat, lng, r["lat"], r["lng"]) + radius_m <= r["radius_m"]
+    ]
+    return max(covering) if covering else None
+
+
+@timed("hospitals_upsert")
+def upsert(
+    hospitals: List[dict],
+    source: str = "overpass",
+    covers: Optional[Tuple[float, float, float]] = None,
+) -> int:
+    """
+    Insert or update hospitals. `covers` = (lat, lng, radius_m) records that
+    the batch is everything there is within that circle.
+    """
+    _, now_ts = utc_now()
+    if not hospitals and covers is None:
+        return 0
+    with get_db() as conn:
+        if covers is not None:
+            _record_coverage(conn, *covers, source, now_ts)
+        rtree = _has_rtree(conn)
+        for h in hospitals:
+            conn.execute(
+                """
+                INSERT INTO hospitals (osm_key, place_id, name, address, lat, lng, source, updated_ts)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(osm_key) DO UPDATE SET
+                    place_id = excluded.place_id,
+                    name = excluded.name,
+                    address = excluded.address,
+                    lat = excluded.lat,
+                    lng = excluded.lng,
+                    source = excluded.source,
+                    updated_ts = excluded.updated_ts
+                """,
+                (h["osm_key"], h["place_id"], h["name"], h["address"],
+                 h["lat"], h["lng"], source, now_ts),
+            )
+            if rtree:
+                row = conn.execute(
+                    "SELECT id FROM hospitals WHERE osm_key = ?", (h["osm_key"],)
+                ).fetchone()
+                conn.execute(
+                    "INSERT OR REPLACE INTO hospitals_rtree (id, min_lat, max_lat, min_lng, max_lng) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (row["id"], h["lat"], h["lat"], h["lng"], h["lng"]),
+                )
+    return len(hospitals)
+
+
+def _nearest(conn, lat: float, lng: float, radius_m: float, limit: int) -> List[dict]:
+    min_lat, max_lat, min_lng, max_lng = bounding_box(lat, lng, radius_m)
+    if _has_rtree(conn):
+        rows = conn.execute(
+            """
+            SELECT h.osm_key, h.place_id, h.name, h.address, h.lat, h.lng, h.updated_ts
+            FROM hospitals_rtree r JOIN hospitals h ON h.id = r.id
+            WHERE r.min_lat >= ? AND r.max_lat <= ? AND r.min_lng >= ? AND r.max_lng <= ?
+            """,
+            (min_lat, max_lat, min_lng, max_lng),
+        ).fetchall()
+    else:
+        rows = conn.execute(
+            """
+            SELECT osm_key, place_id, name, address, lat, lng, updated_ts
+            FROM hospitals
+            WHERE lat BETWEEN ? AND ? AND lng BETWEEN ? AND ?
+            """,
+            (min_lat, max_lat, min_lng, max_lng),
+        ).fetchall()
+    return rank((dict(r) for r in rows), lat, lng, radius_m, limit)
+
+
+@timed("hospitals_local")
+def nearest(
+    lat: float,
+    lng: float,
+    radius_m: float,
+    limit: int = HOSPITALS_MAX_RESULTS,
+) -> Tuple[List[dict], Optional[int]]:
+    """
+    Hospitals within `radius_m` of (lat, lng), nearest first, and the fetch
+    time of the coverage that vouches for them (None: the index may be
+    missing hospitals in this circle). Candidates come from an R*Tree
+    bounding-box search (or the lat/lng index when the SQLite build has no
+    R*Tree module) and are ranked by haversine distance.
+    """
+    with get_db() as conn:
+        return _nearest(conn, lat, lng, radius_m, limit), _coverage_ts(conn, lat, lng, radius_m)
+
+
+# ---------- Overpass ----------
+def overpass_query(lat: float, lng: float, radius_m: int) -> str:
+    return f"""
+    [out:json];
+    (
+      node["amenity"="hospital"](around:{radius_m},{lat},{lng});
+      way["amenity"="hospital"](around:{radius_m},{lat},{lng});
+      relation["amenity"="hospital"](around:{radius_m},{lat},{lng});
+    );
+    out center;
+    """
+
+
+async def fetch_overpass(lat: float, lng: float, radius_m: int) -> List[dict]:
+    with STAGE_SECONDS.labels("overpass").time():
+        resp = await get_http_client().post(
+            OVERPASS_URL,
+            content=overpass_query(lat, lng, radius_m),
+            timeout=OVERPASS_TIMEOUT,
+        )
+    resp.raise_for_status()
+    return parse_overpass(resp.json())
+
+
+# Upstream Overpass results, shared per geohash tile (see geo_cache.TileCache)
+hospital_tile_cache = TileCache()
+
+
+async def _fetch_and_index(lat: float, lng: float, radius_m: int) -> List[dict]:
+    fetched = await fetch_overpass(lat, lng, radius_m)
+    try:
+        await run_in_threadpool(upsert, fetched, "overpass", (lat, lng, radius_m))
+    except Exception as e:
+        record_error("hospitals", "Error saving hospitals", e)
+    return fetched
+
+
+async def lookup_upstream(
+    lat: float,
+    lng: float,
+    radius_m: int,
+    limit: int = HOSPITALS_MAX_RESULTS,
+) -> List[dict]:
+    """Overpass results for the caller's tile, filtered and ranked for the caller."""
+    tile = await hospital_tile_cache.get(lat, lng, radius_m, _fetch_and_index)
+    return rank(tile, lat, lng, radius_m, limit)
+
+
+async def refresh_area(lat: float, lng: float, radius_m: int) -> None:
+    """Background refresh of one area from Overpass into the local index."""
+    try:
+        await hospital_tile_cache.refresh(lat, lng, radius_m, _fetch_and_index)
+    except Exception as e:
+        record_error("overpass", "Overpass refresh error", e)
+
+
+# ---------- CLI ----------
+def import_file(path: str) -> int:
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if "elements" in data:
+        hospitals = parse_overpass(data)
+    elif "features" in data:
+        hospitals = parse_geojson(data)
+    else:
+        raise ValueError("Expected Overpass JSON ('elements') or GeoJSON ('features').")
+    return upsert(hospitals, source="import", covers=_extent(hospitals))
+
+
+def _extent(hospitals: List[dict]) -> Optional[Tuple[float, float, float]]:
+    """Smallest circle around an extract's bounding box: the area it covers."""
+    if not hospitals:
+        return None
+    min_lat, max_lat = min(h["lat"] for h in hospitals), max(h["lat"] for h in hospitals)
+    min_lng, max_lng = min(h["lng"] for h in hospitals), max(h["lng"] for h in hospitals)
+    lat, lng = (min_lat + max_lat) / 2, (min_lng + max_lng) / 2
+    radius = max(haversine_m(lat, lng, la, ln) for la in (min_lat, max_lat) for ln in (min_lng, max_lng))
+    return lat, lng, radius
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3 or sys.argv[1] != "import":
+        print("usage: python hospitals.py import <overpass.json | hospitals.geojson>")
+        sys.exit(2)
+
+    from migrations import migrate
+
+    with get_db() as conn:
+        migrate(conn)
+    print(f"Imported {import_file(sys.argv[2])} hospitals")
@@ -0,0 +1,191 @@
+import re
+from collections import deque
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+# Inflections accepted after a keyword ("cough" matches "coughs"/"coughing",
+# "fever" matches "feverish"); any other trailing letter means a different word.
+ALLOWED_SUFFIXES = ("s", "es", "ed", "ing", "ish")
+
+# Negation cues (NegEx-style) and how far back they reach, in words.
+NEGATION_CUES = frozenset([
+    "no", "not", "without", "never", "nor", "denies", "deny", "denied",
+    "dont", "don't", "doesnt", "doesn't", "didnt", "didn't",
+    "isnt", "isn't", "havent", "haven't", "hasnt", "hasn't", "arent", "aren't",
+])
+NEGATION_PHRASES = frozenset(["free of", "negative for", "absence of", "ruled out"])
+NEGATION_WINDOW = 4
+# Pseudo-negations: a cue word that starts one of these negates nothing
+# ("not sure, chest pain", "no one noticed the blue lips").
+PSEUDO_NEGATIONS = frozenset([
+    "no idea", "no one", "no doubt", "not sure", "not certain", "not only", "not just",
+    "dont know", "don't know", "didnt know", "didn't know", "never mind",
+])
+# "never" followed by one of these after the keyword is a comparison with
+# the past, not a denial: "never had chest pain this bad", "... like this".
+_NEVER_COMPARISON_RE = re.compile(
+    r"\W*(?:(?:this|that|so|as)\s+(?:bad|badly|severe|strong|intense|painful|much|high|long)\b"
+    r"|like\s+(?:this|that)\b)"
+)
+
+# A negation does not carry across these.
+_CLAUSE_BREAK_RE = re.compile(r"[.;:!?,]|\b(?:but|however|although|though|except|yet)\b")
+_WORD_RE = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+
+
+class KeywordMatch(NamedTuple):
+    term: str        # canonical keyword
+    category: str
+    start: int
+    end: int
+    negated: bool
+    order: int       # registration order of the keyword
+
+
+class KeywordEngine:
+    """
+    Multi-pattern keyword matcher (Aho-Corasick).
+
+    All keywords from every vocabulary are compiled into one automaton, so a
+    text is scanned once no matter how many terms are loaded. Matches must
+    start on a word boundary and end on one (allowing ALLOWED_SUFFIXES);
+    overlapping matches are all reported, so "high fever" yields both
+    "high fever" and "fever". Each match is flagged as negated when a
+    negation cue appears shortly before it in the same clause
+    ("no chest pain", "denies fever"). Pseudo-negations ("not sure") and
+    "never ... this bad" comparisons, which describe a symptom the user has
+    right now, do not negate.
+    """
+
+    def __init__(self) -> None:
+        # keyword text -> list of (canonical term, category, registration order)
+        self._keywords: Dict[str, List[Tuple[str, str, int]]] = {}
+        self._count = 0
+        self._goto: List[Dict[str, int]] = []
+        self._fail: List[int] = []
+        self._out: List[List[str]] = []
+        self._built = False
+
+    def add(self, keyword: str, category: str, canonical: Optional[str] = None) -> None:
+        """Register a keyword; `canonical` lets synonyms report one term."""
+        keyword = keyword.lower().strip()
+        if not keyword:
+            return
+        self._keywords.setdefault(keyword, []).append(
+            (canonical or keyword, category, self._count)
+        )
+        self._count += 1
+        self._built = False
+
+    def add_all(self, keywords: Iterable[str], category: str) -> None:
+        for keyword in keywords:
+            self.add(keyword, category)
+
+    def build(self) -> "KeywordEngine":
+        goto: List[Dict[str, int]] = [{}]
+        out: List[List[str]] = [[]]
+        for keyword in self._keywords:
+            state = 0
+            for ch in keyword:
+                nxt = goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[state][ch] = nxt
+                    goto.append({})
+                    out.append([])
+                state = nxt
+            out[state].append(keyword)
+
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in goto[state].items():
+                queue.append(nxt)
+                f = fail[state]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[nxt] = goto[f].get(ch, 0)
+                out[nxt] = out[nxt] + out[fail[nxt]]
+
+        self._goto, self._fail, self._out = goto, fail, out
+        self._built = True
+        return self
+
+    @staticmethod
+    def _right_boundary(text: str, end: int) -> bool:
+        if end >= len(text) or not text[end].isalnum():
+            return True
+        for suffix in ALLOWED_SUFFIXES:
+            stop = end + len(suffix)
+            if text.startswith(suffix, end) and (stop >= len(text) or not text[stop].isalnum()):
+                return True
+        return False
+
+    @staticmethod
+    def _is_negated(text: str, start: int, end: int) -> bool:
+        window = text[max(0, start - 60):start]
+        breaks = list(_CLAUSE_BREAK_RE.finditer(window))
+        if breaks:
+            window = window[breaks[-1].end():]
+        # The keyword's first word follows the window, so a cue that ends it
+        # can still be checked for a pseudo-negation bigram
+        words = _WORD_RE.findall(window) + _WORD_RE.findall(text[start:end])[:1]
+        first = max(0, len(words) - 1 - NEGATION_WINDOW)
+        cues = {
+            w
+            for i, w in enumerate(words[first:-1], first)
+            if w in NEGATION_CUES and f"{w} {words[i + 1]}" not in PSEUDO_NEGATIONS
+        }
+        if cues == {"never"} and _NEVER_COMPARISON_RE.match(text, end):
+            return False
+        if cues:
+            return True
+        tail = words[first:-1]
+        return any(f"{a} {b}" in NEGATION_PHRASES for a, b in zip(tail, tail[1:]))
+
+    def scan(self, text: str) -> List[KeywordMatch]:
+        """All keyword matches in `text`, in order of their end position."""
+        if not self._built:
+            self.build()
+        text = text.lower()
+        goto, fail, out = self._goto, self._fail, self._out
+        matches: List[KeywordMatch] = []
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if not out[state]:
+                continue
+            end = i + 1
+            for keyword in out[state]:
+                start = end - len(keyword)
+                if start > 0 and text[start - 1].isalnum():
+                    continue
+                if not self._right_boundary(text, end):
+                    continue
+                negated = self._is_negated(text, start, end)
+                for canonical, category, order in self._keywords[keyword]:
+                    matches.append(KeywordMatch(canonical, category, start, end, negated, order))
+        return matches
+
+    def terms(
+        self,
+        matches: List[KeywordMatch],
+        category: str,
+        include_negated: bool = False,
+    ) -> List[str]:
+        """
+        Distinct canonical terms of `category` found in `matches`, in the
+        order the keywords were registered (so results are stable no matter
+        where in the text they appeared).
+        """
+        found: Dict[str, int] = {}
+        for m in matches:
+            if m.category != category or (m.negated and not include_negated):
+                continue
+            found[m.term] = min(m.order, found.get(m.term, m.order))
+        return sorted(found, key=found.get)
+
+    def has(self, matches: List[KeywordMatch], category: str) -> bool:
+        return any(m.category == category and not m.negated for m in matches)
@@ -0,0 +1,368 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, AsyncIterator, Dict, List, Optional
+
+import httpx
+
+from metrics import OLLAMA_CONTEXT, OLLAMA_SECONDS, OLLAMA_TOKENS
+
+if TYPE_CHECKING:
+    from groq import AsyncGroq  # type: ignore
+
+# ---------- Config ----------
+GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+GROQ_MODEL = os.getenv("GROQ_MODEL", "llama-3.1-8b-instant")
+GROQ_TIMEOUT = float(os.getenv("GROQ_TIMEOUT", "20"))
+GROQ_MAX_RETRIES = int(os.getenv("GROQ_MAX_RETRIES", "2"))
+# Point at a Groq-compatible stub (e.g. backend/bench/stubs.py) for load tests
+GROQ_BASE_URL = os.getenv("GROQ_BASE_URL") or None
+
+LLM_TEMPERATURE = 0.3
+LLM_MAX_TOKENS = 512
+
+OLLAMA_URL = os.getenv("OLLAMA_URL", "http://127.0.0.1:11434/api/generate")
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "llama3.2")
+OLLAMA_TIMEOUT = float(os.getenv("OLLAMA_TIMEOUT", "20"))
+# How long Ollama keeps the model in memory after a request ("30m", "1h";
+# "-1" = until it is unloaded), so chats don't pay a cold load
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+OLLAMA_NUM_CTX = int(os.getenv("OLLAMA_NUM_CTX", "4096"))
+OLLAMA_NUM_PREDICT = int(os.getenv("OLLAMA_NUM_PREDICT", str(LLM_MAX_TOKENS)))
+# Load the model at startup instead of on the first chat
+OLLAMA_WARMUP = os.getenv("OLLAMA_WARMUP", "true").lower() == "true"
+OLLAMA_WARMUP_TIMEOUT = float(os.getenv("OLLAMA_WARMUP_TIMEOUT", "120"))
+# Continue multi-turn chats from Ollama's returned context instead of
+# re-sending (and re-evaluating) the whole transcript
+OLLAMA_CONTEXT_REUSE = os.getenv("OLLAMA_CONTEXT_REUSE", "true").lower() == "true"
+OLLAMA_CONTEXT_CACHE_SIZE = int(os.getenv("OLLAMA_CONTEXT_CACHE_SIZE", "1000"))
+
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+
+logger = logging.getLogger("safelink")
+
+
+class LLMError(Exception):
+    pass
+
+
+# ---------- Shared clients ----------
+_http_client: Optional[httpx.AsyncClient] = None
+_groq_client: Optional["AsyncGroq"] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Process-wide pooled AsyncClient, so upstream calls reuse keep-alive
+    connections instead of paying a TCP/TLS handshake per request.
+    """
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(30.0, connect=5.0),
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+            ),
+        )
+    return _http_client
+
+
+def get_groq_client() -> Optional["AsyncGroq"]:
+    """
+    Created on first use: the groq SDK is slow to import, and processes
+    without a key (or that never chat) should not pay for it at boot.
+    """
+    global _groq_client
+    if GROQ_API_KEY and _groq_client is None:
+        from groq import AsyncGroq  # type: ignore
+
+        _groq_client = AsyncGroq(
+            api_key=GROQ_API_KEY,
+            base_url=GROQ_BASE_URL,
+            timeout=GROQ_TIMEOUT,
+            max_retries=GROQ_MAX_RETRIES,
+            http_client=get_http_client(),
+        )
+    return _groq_client
+
+
+async def close_clients() -> None:
+    global _http_client, _groq_client
+    _groq_client = None
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+# ---------- Providers ----------
+# Each provider raises on failure and returns/yields only non-empty text, so
+# callers can move on to the next provider on any exception.
+
+def build_messages(
+    system_prompt: str,
+    user_message: str,
+    history: Optional[List[Dict[str, str]]] = None,
+) -> List[Dict[str, str]]:
+    """Chat-format prompt: system prompt, earlier turns, then the new message."""
+    return [
+        {"role": "system", "content": system_prompt},
+        *(history or []),
+        {"role": "user", "content": user_message},
+    ]
+
+
+async def call_groq(messages: List[Dict[str, str]]) -> str:
+    client = get_groq_client()
+    if client is None:
+        raise LLMError("GROQ_API_KEY is not set")
+    completion = await client.chat.completions.create(
+        model=GROQ_MODEL,
+        messages=messages,
+        temperature=LLM_TEMPERATURE,
+        max_tokens=LLM_MAX_TOKENS,
+    )
+    reply = (completion.choices[0].message.content or "").strip()
+    if not reply:
+        raise LLMError("Groq returned an empty reply")
+    return reply
+
+
+async def stream_groq(messages: List[Dict[str, str]]) -> AsyncIterator[str]:
+    client = get_groq_client()
+    if client is None:
+        raise LLMError("GROQ_API_KEY is not set")
+    stream = await client.chat.completions.create(
+        model=GROQ_MODEL,
+        messages=messages,
+        temperature=LLM_TEMPERATURE,
+        max_tokens=LLM_MAX_TOKENS,
+        stream=True,
+    )
+    async for chunk in stream:
+        if not chunk.choices:
+            continue
+        token = chunk.choices[0].delta.content
+        if token:
+            yield token
+
+
+# Ollama reports these in nanoseconds on the final response
+_OLLAMA_PHASES = (
+    ("load", "load_duration"),
+    ("prompt_eval", "prompt_eval_duration"),
+    ("eval", "eval_duration"),
+    ("total", "total_duration"),
+)
+
+
+def _keep_alive(value: str):
+    # Ollama reads bare numbers as seconds and strings as durations
+    try:
+        return int(value)
+    except ValueError:
+        return value
+
+
+class OllamaClient:
+    """
+    The one Ollama client. It goes through the shared pooled HTTP client,
+    asks Ollama to keep the model loaded (keep_alive), and caps num_ctx /
+    num_predict on every request.
+
+    /api/generate returns `context`, the KV-cache tokens of the prompt and
+    reply. They are kept in a small LRU keyed by a hash of the transcript
+    they cover. When the next request's earlier turns hash to a stored
+    entry (same conversation, nothing trimmed), only the new message is
+    sent along with that context. Otherwise the full transcript is sent.
+
+    Ollama's load / prompt_eval / eval timings and token counts go into
+    safelink_ollama_* metrics.
+    """
+
+    def __init__(
+        self,
+        url: str = OLLAMA_URL,
+        model: str = OLLAMA_MODEL,
+        keep_alive: str = OLLAMA_KEEP_ALIVE,
+        num_ctx: int = OLLAMA_NUM_CTX,
+        num_predict: int = OLLAMA_NUM_PREDICT,
+        context_reuse: bool = OLLAMA_CONTEXT_REUSE,
+        context_cache_size: int = OLLAMA_CONTEXT_CACHE_SIZE,
+    ):
+        self.url = url
+        self.model = model
+        self.keep_alive = _keep_alive(keep_alive)
+        self.num_ctx = num_ctx
+        self.num_predict = num_predict
+        self.context_reuse = context_reuse and context_cache_size > 0
+        self.context_cache_size = context_cache_size
+        self._contexts: "OrderedDict[str, List[int]]" = OrderedDict()
+        self._warmup_task: Optional[asyncio.Task] = None
+
+        # Stats
+        self.requests = 0
+        self.context_hits = 0
+        self.context_misses = 0
+        self.warm = False
+        self.warmup_ms: Optional[float] = None
+        self.last_timings: Dict[str, float] = {}
+
+    @staticmethod
+    def _fingerprint(messages: List[Dict[str, str]]) -> str:
+        raw = json.dumps(messages, ensure_ascii=False, separators=(",", ":"))
+        return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).hexdigest()
+
+    def _payload(self, messages: List[Dict[str, str]], stream: bool) -> dict:
+        # /api/generate takes one system string and one prompt, so earlier turns
+        # are rendered into the prompt as a transcript.
+        system = "\n\n".join(m["content"] for m in messages if m["role"] == "system")
+        turns = [m for m in messages if m["role"] != "system"]
+        payload = {
+            "model": self.model,
+            "system": system,
+            "stream": stream,
+            "keep_alive": self.keep_alive,
+            "options": {
+                "temperature": LLM_TEMPERATURE,
+                "num_ctx": self.num_ctx,
+                "num_predict": self.num_predict,
+            },
+        }
+        if len(turns) == 1:
+            payload["prompt"] = turns[0]["content"]
+            return payload
+
+        context = self._contexts.get(self._fingerprint(messages[:-1])) if self.context_reuse else None
+        # Leave room for the new message and the reply, else start over
+        if context is not None and len(context) + self.num_predict < self.num_ctx:
+            self.context_hits += 1
+            OLLAMA_CONTEXT.labels("hit").inc()
+            payload["context"] = context
+            payload["prompt"] = turns[-1]["content"]
+            return payload
+        if self.context_reuse:
+            self.context_misses += 1
+            OLLAMA_CONTEXT.labels("miss").inc()
+        payload["prompt"] = (
+            "\n\n".join(f"{m['role'].capitalize()}: {m['content']}" for m in turns)
+            + "\n\nAssistant:"
+        )
+        return payload
+
+    def _record_timings(self, data: dict) -> None:
+        timings = {}
+        for phase, field in _OLLAMA_PHASES:
+            ns = data.get(field)
+            if ns:
+                OLLAMA_SECONDS.labels(phase).observe(ns / 1e9)
+                timings[f"{phase}_ms"] = round(ns / 1e6, 3)
+        for kind, field in (("prompt", "prompt_eval_count"), ("generated", "eval_count")):
+            if data.get(field):
+                OLLAMA_TOKENS.labels(kind).inc(data[field])
+                timings[field] = data[field]
+        self.last_timings = timings
+
+    def _finish(self, messages: List[Dict[str, str]], reply: str, data: dict) -> None:
+        """Record the final response's timings and keep its context for the next turn."""
+        self._record_timings(data)
+        context = data.get("context")
+        if not self.context_reuse or not context:
+            return
+        # The previous turn's entry is superseded by this one
+        self._contexts.pop(self._fingerprint(messages[:-1]), None)
+        key = self._fingerprint(messages + [{"role": "assistant", "content": reply}])
+        self._contexts[key] = context
+        self._contexts.move_to_end(key)
+        while len(self._contexts) > self.context_cache_size:
+            self._contexts.popitem(last=False)
+
+    async def generate(self, messages: List[Dict[str, str]]) -> str:
+        self.requests += 1
+        resp = await get_http_client().post(
+            self.url, json=self._payload(messages, stream=False), timeout=OLLAMA_TIMEOUT
+        )
+        resp.raise_for_status()
+        data = resp.json()
+        reply = (data.get("response") or "").strip()
+        if not reply:
+            raise LLMError("Ollama returned an empty reply")
+        self._finish(messages, reply, data)
+        return reply
+
+    async def stream(self, messages: List[Dict[str, str]]) -> AsyncIterator[str]:
+        self.requests += 1
+        parts: List[str] = []
+        async with get_http_client().stream(
+            "POST", self.url, json=self._payload(messages, stream=True), timeout=OLLAMA_TIMEOUT
+        ) as resp:
+            resp.raise_for_status()
+            async for line in resp.aiter_lines():
+                if not line.strip():
+                    continue
+                data = json.loads(line)
+                if data.get("error"):
+                    raise LLMError(f"Ollama error: {data['error']}")
+                token = data.get("response")
+                if token:
+                    parts.append(token)
+                    yield token
+                if data.get("done"):
+                    self._finish(messages, "".join(parts).strip(), data)
+                    break
+
+    async def warm_up(self) -> bool:
+        """Load the model now (a request with no prompt) so the first chat doesn't wait for it."""
+        start = time.perf_counter()
+        try:
+            resp = await get_http_client().post(
+                self.url,
+                json={"model": self.model, "keep_alive": self.keep_alive, "stream": False},
+                timeout=OLLAMA_WARMUP_TIMEOUT,
+            )
+            resp.raise_for_status()
+            self._record_timings(resp.json())
+        except Exception as e:
+            # Ollama is optional; it may simply not be running
+            logger.info("Ollama warm-up skipped (%s): %s", self.model, e)
+            return False
+        self.warm = True
+        self.warmup_ms = round((time.perf_counter() - start) * 1000, 1)
+        logger.info("Ollama model %s loaded in %.0f ms", self.model, self.warmup_ms)
+        return True
+
+    def start_warm_up(self) -> None:
+        if self._warmup_task is None or self._warmup_task.done():
+            self._warmup_task = asyncio.create_task(self.warm_up())
+
+    def stats(self) -> dict:
+        return {
+            "model": self.model,
+            "keep_alive": self.keep_alive,
+            "num_ctx": self.num_ctx,
+            "num_predict": self.num_predict,
+            "warm": self.warm,
+            "warmup_ms": self.warmup_ms,
+            "requests": self.requests,
+            "context_reuse": self.context_reuse,
+            "contexts_cached": len(self._contexts),
+            "context_hits": self.context_hits,
+            "context_misses": self.context_misses,
+            "last_timings": self.last_timings,
+        }
+
+
+ollama_client = OllamaClient()
+
+
+async def call_ollama(messages: List[Dict[str, str]]) -> str:
+    return await ollama_client.generate(messages)
+
+
+def stream_ollama(messages: List[Dict[str, str]]) -> AsyncIterator[str]:
+    return ollama_client.stream(messages)
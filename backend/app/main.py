@@ -1,15 +1,59 @@
-from fastapi import FastAPI, HTTPException, Header
-from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, EmailStr
-from typing import List, Optional
-from pathlib import Path
-from datetime import datetime
+import time
+
+# Taken before the heavy imports so the startup log can report their cost
+_BOOT_STARTED = time.perf_counter()
+
+from fastapi import BackgroundTasks, Depends, FastAPI, HTTPException, Header, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-import sqlite3
-import hashlib
-import httpx
+from fastapi.concurrency import run_in_threadpool
+from starlette.concurrency import iterate_in_threadpool
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, EmailStr, Field
+from typing import AsyncIterator, List, Literal, Optional, Tuple
+import base64
+import hmac
+import json
+import logging
+import math
 import os
-import uvicorn
+
+import hospitals
+from admission import chat_admission
+import llm
+from conversations import CHAT_CONTEXT_ENABLED, CHAT_CONTEXT_VERIFY, conversation_store
+from db import db_pool, get_db, utc_now
+from metrics import (
+    CHAT_REPLIES,
+    HTTP_REQUESTS,
+    HTTP_SECONDS,
+    STAGE_SECONDS,
+    record_error,
+    registry,
+    timed,
+)
+import archive
+from migrations import ensure_schema
+from passwords import HashPoolBusy, password_hasher
+from ratelimit import AUTH_RATE_LIMIT_ENABLED, auth_email_limiter, auth_ip_limiter
+from reply_cache import REPLY_CACHE_ENABLED, reply_cache
+from responses import add_compression, dumps, json_response
+from rules import NO_FLAGS_MESSAGE, rule_book
+from scheduler import Provider, ProviderScheduler, StreamInterrupted
+import search
+from sessions import SESSION_ALLOW_USER_ID_HEADER, Session, session_manager
+from storage import HISTORY_COLUMNS, storage
+import trends
+from writer import WRITE_QUEUE_ENABLED, write_queue
+
+_IMPORTS_DONE = time.perf_counter()
+
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+)
+logger = logging.getLogger("safelink")
+# httpx logs every upstream request at INFO
+logging.getLogger("httpx").setLevel(logging.WARNING)
 
 # ---------- FastAPI app ----------
 app = FastAPI(
@@ -34,83 +78,74 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
+# gzip/Brotli above HTTP_COMPRESSION_MIN_BYTES (responses.py)
+add_compression(app)
 
-# ---------- DB SETUP ----------
-DB_PATH = Path(__file__).parent / "safelink.db"
 
 
-def get_db():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Label by route template, not raw path, to keep cardinality bounded
+        route = request.scope.get("route")
+        path = getattr(route, "path", "unmatched")
+        HTTP_REQUESTS.labels(request.method, path, status).inc()
+        HTTP_SECONDS.labels(request.method, path).observe(time.perf_counter() - start)
 
 
+# ---------- DB SETUP ----------
 def init_db():
-    conn = get_db()
-    cur = conn.cursor()
-
-    # Users
-    cur.execute(
-        """
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            email TEXT UNIQUE NOT NULL,
-            password_hash TEXT NOT NULL,
-            created_at TEXT NOT NULL
-        );
-        """
-    )
-
-    # Symptom checks
-    cur.execute(
-        """
-        CREATE TABLE IF NOT EXISTS symptom_checks (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            age INTEGER,
-            temperature REAL,
-            symptoms_text TEXT,
-            risk_level TEXT,
-            risk_score INTEGER,
-            advice TEXT,
-            created_at TEXT NOT NULL,
-            FOREIGN KEY (user_id) REFERENCES users(id)
-        );
-        """
-    )
-
-    # Chat history
-    cur.execute(
-        """
-        CREATE TABLE IF NOT EXISTS chat_messages (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            role TEXT NOT NULL,
-            content TEXT NOT NULL,
-            created_at TEXT NOT NULL,
-            FOREIGN KEY (user_id) REFERENCES users(id)
-        );
-        """
-    )
-
-    conn.commit()
-    conn.close()
+    with get_db() as conn:
+        ensure_schema(conn, str(db_pool.path))
+    if REPLY_CACHE_ENABLED:
+        reply_cache.load()
 
 
 @app.on_event("startup")
-def on_startup():
+async def on_startup():
+    started = time.perf_counter()
     init_db()
+    await storage.start()
+    if WRITE_QUEUE_ENABLED:
+        write_queue.start()
+    if archive.ARCHIVE_ENABLED and storage.name == "sqlite":
+        archive.archive_scheduler.start()
+    if llm.OLLAMA_WARMUP:
+        llm.ollama_client.start_warm_up()
+    done = time.perf_counter()
+    logger.info(
+        "Startup: imports %.0f ms, app setup %.0f ms, db + caches %.0f ms (pid %d)",
+        (_IMPORTS_DONE - _BOOT_STARTED) * 1000,
+        (_APP_READY - _IMPORTS_DONE) * 1000,
+        (done - started) * 1000,
+        os.getpid(),
+    )
 
 
-def hash_password(password: str) -> str:
-    return hashlib.sha256(password.encode("utf-8")).hexdigest()
+@app.on_event("shutdown")
+async def on_shutdown():
+    await archive.archive_scheduler.stop()
+    await write_queue.stop()
+    await storage.close()
+    await llm.close_clients()
+    password_hasher.shutdown()
+    db_pool.close()
 
 
 # ---------- Pydantic models ----------
 class SymptomCheckRequest(BaseModel):
-    age: Optional[int] = None
-    temperature: Optional[float] = None  # Fahrenheit
+    # Bounded so an absurd value is a 422 here rather than a row the
+    # database refuses later, inside someone else's write batch
+    age: Optional[int] = Field(default=None, ge=0, le=150)
+    temperature: Optional[float] = Field(default=None, ge=75.0, le=115.0)  # Fahrenheit
     symptoms_text: str
 
 
@@ -161,6 +196,8 @@ class LoginRequest(BaseModel):
 class LoginResponse(BaseModel):
     user_id: int
     email: EmailStr
+    token: str           # send as `Authorization: Bearer <token>`
+    expires_at: int      # epoch seconds
 
 
 class SymptomHistoryItem(BaseModel):
@@ -174,6 +211,37 @@ class SymptomHistoryItem(BaseModel):
     advice: str
 
 
+class HistorySearchHit(BaseModel):
+    kind: str                # "chat" or "symptom"
+    id: int
+    created_at: str
+    role: Optional[str] = None        # chat hits
+    risk_level: Optional[str] = None  # symptom hits
+    snippet: str             # matched terms wrapped in <mark>...</mark>
+    score: float             # higher is more relevant
+
+
+class SymptomTrendDay(BaseModel):
+    day: str                 # UTC date, YYYY-MM-DD
+    checks: int
+    low: int
+    medium: int
+    high: int
+    mean_score: float
+
+
+class FlagCount(BaseModel):
+    flag: str
+    count: int
+
+
+class SymptomTrendsResponse(BaseModel):
+    scope: str               # "user" or "global"
+    days: int
+    daily: List[SymptomTrendDay]
+    top_flags: List[FlagCount]
+
+
 class ChatHistoryItem(BaseModel):
     id: int
     created_at: str
@@ -181,109 +249,108 @@ class ChatHistoryItem(BaseModel):
     content: str
 
 
-# ---------- Symptom checker logic ----------
-HIGH_RISK_KEYWORDS = [
-    "chest pain",
-    "difficulty breathing",
-    "shortness of breath",
-    "blue lips",
-    "high fever",
-    "confusion",
-]
+HISTORY_DEFAULT_LIMIT = 50
+HISTORY_MAX_LIMIT = 200
 
-MEDIUM_RISK_KEYWORDS = [
-    "fever",
-    "cough",
-    "sore throat",
-    "body pain",
-    "fatigue",
-    "headache",
-    "loss of smell",
-    "loss of taste",
-]
+
+# ---------- Symptom checker logic ----------
+# Thresholds, weights, keywords and advice come from the rule file (rules.py)
+SYMPTOM_BATCH_MAX = 1000
 
 
+@timed("analyze_symptoms")
 def analyze_symptoms(payload: SymptomCheckRequest) -> SymptomCheckResponse:
-    text = payload.symptoms_text.lower()
-    flags: List[str] = []
-
-    temp_score = 0
-    if payload.temperature:
-        if payload.temperature >= 102:
-            flags.append("High fever")
-            temp_score = 30
-        elif payload.temperature >= 100.4:
-            flags.append("Mild fever")
-            temp_score = 15
-
-    age_score = 0
-    if payload.age:
-        if payload.age >= 65:
-            flags.append("Older age (65+)")
-            age_score = 15
-        elif payload.age <= 5:
-            flags.append("Young age (≤5)")
-            age_score = 15
-
-    high_hits = [k for k in HIGH_RISK_KEYWORDS if k in text]
-    medium_hits = [k for k in MEDIUM_RISK_KEYWORDS if k in text]
-
-    if high_hits:
-        flags.extend([f"High-risk symptom: {k}" for k in high_hits])
-    if medium_hits:
-        flags.extend([f"Medium-risk symptom: {k}" for k in medium_hits])
-
-    keyword_score = len(high_hits) * 25 + len(medium_hits) * 10
-    raw_score = temp_score + age_score + keyword_score
-    risk_score = max(0, min(100, raw_score))
-
-    if risk_score >= 60 or high_hits:
-        risk_level = "High"
-        advice = (
-            "Your symptoms may indicate a higher-risk situation. "
-            "Consider seeking immediate medical attention or contacting your doctor. "
-            "If you have severe chest pain, trouble breathing, or confusion, call emergency services."
-        )
-    elif risk_score >= 30:
-        risk_level = "Medium"
-        advice = (
-            "Your symptoms suggest a moderate level of concern. "
-            "Monitor your condition, rest, stay hydrated, and contact a healthcare provider "
-            "if symptoms worsen or persist."
-        )
-    else:
-        risk_level = "Low"
-        advice = (
-            "Your symptoms currently appear mild. Rest, drink fluids, and watch for changes. "
-            "If you feel worse, contact a medical professional."
-        )
+    result = rule_book.current().evaluate(payload.age, payload.temperature, payload.symptoms_text)
+    return SymptomCheckResponse(
+        risk_level=result.risk_level,
+        risk_score=result.risk_score,
+        advice=result.advice,
+        detected_flags=result.flags,
+    )
 
-    if not flags:
-        flags.append("No specific high/medium risk symptoms detected from description.")
 
-    return SymptomCheckResponse(
-        risk_level=risk_level,
-        risk_score=risk_score,
-        advice=advice,
-        detected_flags=flags,
+def _band_index(np, bands, values):
+    """Index of the first matching band per value (-1 = none), as rules.match_band."""
+    provided = values != 0
+    conditions = [
+        provided
+        & (values >= (band.low if band.low is not None else -np.inf))
+        & (values <= (band.high if band.high is not None else np.inf))
+        for band in bands
+    ]
+    return np.select(conditions, np.arange(len(bands)), -1) if bands else np.full(len(values), -1)
+
+
+@timed("analyze_symptoms_batch")
+def analyze_symptoms_batch(payloads: List[SymptomCheckRequest]) -> List[SymptomCheckResponse]:
+    """
+    Vectorized analyze_symptoms for many intakes at once. Temperature and age
+    bands are applied as NumPy array ops and keyword scores come from an
+    (items x matched keywords) hit matrix; the output matches
+    analyze_symptoms item for item.
+    """
+    import numpy as np  # only batch requests pay for the import
+
+    n = len(payloads)
+    if n == 0:
+        return []
+    rules = rule_book.current()
+
+    # None and 0 are both "not provided", as in rules.match_band
+    temps = np.array([p.temperature or 0.0 for p in payloads], dtype=np.float64)
+    ages = np.array([p.age or 0 for p in payloads], dtype=np.float64)
+    temp_band = _band_index(np, rules.temperature_bands, temps)
+    age_band = _band_index(np, rules.age_bands, ages)
+    # Trailing 0 so band index -1 scores nothing
+    temp_scores = np.array([b.score for b in rules.temperature_bands] + [0], dtype=np.int64)
+    age_scores = np.array([b.score for b in rules.age_bands] + [0], dtype=np.int64)
+
+    # Only the columns some item matched, so the matrix stays small however
+    # large the rule book is
+    item_cols = [rules.hit_columns(p.symptoms_text) for p in payloads]
+    used = sorted({c for cols in item_cols for c in cols})
+    local = {c: j for j, c in enumerate(used)}
+    hits = np.zeros((n, len(used)), dtype=bool)
+    for i, cols in enumerate(item_cols):
+        hits[i, [local[c] for c in cols]] = True
+    weights = np.array([rules.columns[c].weight for c in used], dtype=np.int64)
+    ranks = np.array([rules.columns[c].min_rank for c in used], dtype=np.int64)
+
+    keyword_score = hits.astype(np.int64) @ weights
+    risk_score = np.clip(
+        temp_scores[temp_band] + age_scores[age_band] + keyword_score, 0, rules.max_score
     )
+    min_rank = (hits * ranks).max(axis=1) if used else np.zeros(n, dtype=np.int64)
+
+    results: List[SymptomCheckResponse] = []
+    for i in range(n):
+        flags: List[str] = []
+        if temp_band[i] >= 0:
+            flags.append(rules.temperature_bands[temp_band[i]].flag)
+        if age_band[i] >= 0:
+            flags.append(rules.age_bands[age_band[i]].flag)
+        flags.extend(rules.columns[c].flag for c in item_cols[i])
+        if not flags:
+            flags.append(NO_FLAGS_MESSAGE)
+
+        risk_level = rules.level_for(int(risk_score[i]), int(min_rank[i]))
+        results.append(
+            SymptomCheckResponse(
+                risk_level=risk_level,
+                risk_score=int(risk_score[i]),
+                advice=rules.advice[risk_level],
+                detected_flags=flags,
+            )
+        )
+    return results
 
 
-def save_symptom_check_to_db(
+def symptom_check_rows(
     user_id: int,
-    payload: SymptomCheckRequest,
-    result: SymptomCheckResponse,
-) -> None:
-    conn = get_db()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        INSERT INTO symptom_checks (
-            user_id, age, temperature, symptoms_text,
-            risk_level, risk_score, advice, created_at
-        )
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        """,
+    checks: List[Tuple[SymptomCheckRequest, SymptomCheckResponse]],
+) -> List[tuple]:
+    created_at, created_ts = utc_now()
+    return [
         (
             user_id,
             payload.age,
@@ -292,340 +359,569 @@ def save_symptom_check_to_db(
             result.risk_level,
             result.risk_score,
             result.advice,
-            datetime.utcnow().isoformat(),
-        ),
-    )
-    conn.commit()
-    conn.close()
-
-
-def get_symptom_history_from_db(user_id: int) -> List[SymptomHistoryItem]:
-    conn = get_db()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        SELECT id, created_at, age, temperature, symptoms_text,
-               risk_level, risk_score, advice
-        FROM symptom_checks
-        WHERE user_id = ?
-        ORDER BY datetime(created_at) DESC
-        LIMIT 50;
-        """,
-        (user_id,),
-    )
-    rows = cur.fetchall()
-    conn.close()
-
-    history: List[SymptomHistoryItem] = []
-    for row in rows:
-        history.append(
-            SymptomHistoryItem(
-                id=row["id"],
-                created_at=row["created_at"],
-                age=row["age"],
-                temperature=row["temperature"],
-                symptoms_text=row["symptoms_text"],
-                risk_level=row["risk_level"],
-                risk_score=row["risk_score"],
-                advice=row["advice"],
-            )
+            created_at,
+            created_ts,
+            # Not a column: only feeds the trend rollups
+            tuple(f for f in result.detected_flags if f != NO_FLAGS_MESSAGE),
         )
-    return history
+        for payload, result in checks
+    ]
 
 
-def save_chat_pair_to_db(user_id: int, user_message: str, assistant_reply: str) -> None:
-    conn = get_db()
-    cur = conn.cursor()
-    now = datetime.utcnow().isoformat()
+def history_items(table: str, rows: list, limit: int) -> List[dict]:
+    """
+    Plain dicts shaped like SymptomHistoryItem / ChatHistoryItem. The rows come
+    straight from our own tables, so they skip model construction and
+    response_model validation and are served as FastJSONResponse.
+    """
+    columns = HISTORY_COLUMNS[table]
+    return [{column: row[column] for column in columns} for row in rows[:limit]]
 
-    cur.execute(
-        """
-        INSERT INTO chat_messages (user_id, role, content, created_at)
-        VALUES (?, ?, ?, ?)
-        """,
-        (user_id, "user", user_message, now),
-    )
-    cur.execute(
-        """
-        INSERT INTO chat_messages (user_id, role, content, created_at)
-        VALUES (?, ?, ?, ?)
-        """,
-        (user_id, "assistant", assistant_reply, now),
+
+@timed("db_read_symptom_history")
+async def get_symptom_history_from_db(
+    user_id: int,
+    limit: int = HISTORY_DEFAULT_LIMIT,
+    cursor: Optional[str] = None,
+) -> Tuple[List[dict], Optional[str]]:
+    rows = await history_page(
+        "symptom_checks", user_id, limit + 1, decode_cursor(cursor) if cursor else None
     )
-    conn.commit()
-    conn.close()
-
-
-def get_chat_history_from_db(user_id: int) -> List[ChatHistoryItem]:
-    conn = get_db()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        SELECT id, created_at, role, content
-        FROM chat_messages
-        WHERE user_id = ?
-        ORDER BY datetime(created_at) DESC
-        LIMIT 50;
-        """,
-        (user_id,),
+    return history_items("symptom_checks", rows, limit), _next_cursor(rows, limit)
+
+
+def chat_pair_rows(user_id: int, user_message: str, assistant_reply: str) -> List[tuple]:
+    created_at, created_ts = utc_now()
+    return [
+        (user_id, "user", user_message, created_at, created_ts),
+        (user_id, "assistant", assistant_reply, created_at, created_ts),
+    ]
+
+
+# All request-path inserts go through the write-behind queue (see writer.py);
+# storage.write_batch is its only sink, so there is one insert path.
+write_queue.bind(storage.write_batch)
+
+
+@timed("db_read_chat_history")
+async def get_chat_history_from_db(
+    user_id: int,
+    limit: int = HISTORY_DEFAULT_LIMIT,
+    cursor: Optional[str] = None,
+) -> Tuple[List[dict], Optional[str]]:
+    rows = await history_page(
+        "chat_messages", user_id, limit + 1, decode_cursor(cursor) if cursor else None
     )
-    rows = cur.fetchall()
-    conn.close()
-
-    history: List[ChatHistoryItem] = []
-    for row in rows:
-        history.append(
-            ChatHistoryItem(
-                id=row["id"],
-                created_at=row["created_at"],
-                role=row["role"],
-                content=row["content"],
-            )
+    return history_items("chat_messages", rows, limit), _next_cursor(rows, limit)
+
+
+# ---------- History pagination ----------
+# Archived rows (archive.py) all sort before the live ones, so a page that
+# runs out of live rows carries on into the archive.
+HISTORY_ARCHIVE_READS = archive.ARCHIVE_READS_ENABLED and storage.name == "sqlite"
+
+
+async def _archive_has_rows(table: str) -> bool:
+    """Cheap gate for archive reads: usually a cached flag, no threadpool hop."""
+    if not HISTORY_ARCHIVE_READS:
+        return False
+    found = archive.archived_hint(table)
+    if found is None:
+        found = await run_in_threadpool(archive.has_archived, table)
+    return found
+
+
+async def history_page(table: str, user_id: int, limit: int, after=None) -> list:
+    rows = list(await storage.history_page(table, user_id, limit, after))
+    if len(rows) < limit and await _archive_has_rows(table):
+        last = (rows[-1]["created_ts"], rows[-1]["id"]) if rows else after
+        rows += await run_in_threadpool(
+            archive.read_history, table, user_id, limit - len(rows), last
         )
-    return history
+    return rows
+
+
+def encode_cursor(created_ts: int, row_id: int) -> str:
+    raw = f"{created_ts}:{row_id}".encode("ascii")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[int, int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_ts, row_id = base64.urlsafe_b64decode(padded).decode("ascii").split(":")
+        return int(created_ts), int(row_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+
+
+def _next_cursor(rows: list, limit: int) -> Optional[str]:
+    # Callers fetch limit + 1 rows; the extra row only signals another page.
+    if len(rows) <= limit:
+        return None
+    last = rows[limit - 1]
+    return encode_cursor(last["created_ts"], last["id"])
+
+
+def stream_history_ndjson(
+    table: str,
+    user_id: int,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+) -> StreamingResponse:
+    # Validate the cursor before the response starts streaming.
+    after = decode_cursor(cursor) if cursor else None
+
+    def line(row) -> bytes:
+        item = dict(row)
+        item["cursor"] = encode_cursor(item.pop("created_ts"), item["id"])
+        return dumps(item) + b"\n"
+
+    async def lines() -> AsyncIterator[bytes]:
+        sent, last = 0, after
+        async for row in storage.iter_history(table, user_id, limit, after):
+            sent, last = sent + 1, (row["created_ts"], row["id"])
+            yield line(row)
+        if (limit is None or sent < limit) and await _archive_has_rows(table):
+            rest = archive.iter_history(table, user_id, limit - sent if limit else None, last)
+            async for row in iterate_in_threadpool(rest):
+                yield line(row)
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
 
 
 # ---------- Chat (Groq + Ollama + Fallback) ----------
-from groq import Groq  # type: ignore
+CHAT_SYSTEM_PROMPT = (
+    "You are a cautious health information assistant. "
+    "You ONLY provide general health and safety information, not medical diagnoses. "
+    "You are NOT a doctor. "
+    "Always encourage the user to consult a healthcare professional for diagnosis "
+    "or serious concerns. Keep answers clear and concise (3–6 sentences)."
+)
+# Appended when the provider drops a streamed reply partway through
+CHAT_STREAM_CUT_OFF_NOTE = "\n\n(This reply was cut off. Please ask again.)"
 
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-groq_client = Groq(api_key=GROQ_API_KEY) if GROQ_API_KEY else None
 
-# Local Ollama endpoint
-OLLAMA_URL = "http://127.0.0.1:11434/api/generate"
+# Emergency keywords and the canned fallback replies come from the rule file
+def _is_emergency(text: str) -> bool:
+    return rule_book.current().is_emergency(text)
 
 
+@timed("fallback_reply")
 def _fallback_rule_based_reply(text: str) -> str:
-    if "fever" in text or "temperature" in text:
-        return (
-            "A fever is often a sign your body is fighting an infection. "
-            "Rest, drink plenty of fluids, and consider fever medicine if recommended by a doctor. "
-            "If the fever is very high, lasts more than a couple of days, or you feel very unwell, "
-            "contact a healthcare provider."
-        )
-    if "cough" in text or "sore throat" in text:
-        return (
-            "Cough and sore throat are common with colds, flu, and COVID-like illnesses. "
-            "Rest your voice, drink warm fluids, and monitor your breathing. "
-            "If you have chest pain, trouble breathing, or symptoms that are getting worse, "
-            "see a doctor or urgent care."
-        )
-    if "anxiety" in text or "anxious" in text or "stress" in text:
-        return (
-            "Feeling anxious or stressed is common. Try slow deep breaths, short walks, and talking "
-            "to someone you trust. If the anxiety feels overwhelming or constant, consider reaching out "
-            "to a mental health professional."
-        )
-    if "covid" in text or "covid-19" in text:
-        return (
-            "If you suspect COVID-19, test if possible, follow local public health guidance, and monitor "
-            "your symptoms. Seek medical care if you have trouble breathing, chest pain, confusion, or "
-            "belong to a higher-risk group."
-        )
+    return rule_book.current().fallback_reply(text)
 
-    return (
-        "Hello! I'm happy to help with general health and safety questions. "
-        "I can't diagnose conditions or replace a doctor, so please contact a healthcare professional "
-        "for personal medical advice. What would you like to ask about?"
-    )
+
+chat_scheduler = ProviderScheduler([
+    Provider(
+        "Groq",
+        llm.call_groq,
+        llm.stream_groq,
+        enabled=lambda: llm.get_groq_client() is not None,
+    ),
+    Provider("Ollama", llm.call_ollama, llm.stream_ollama),
+])
 
 
-def _call_groq_llm(system_prompt: str, user_message: str) -> str:
-    if groq_client is None:
-        return ""
+def _cached_reply(user_message: str) -> Optional[str]:
+    if not REPLY_CACHE_ENABLED:
+        return None
+    return reply_cache.get(user_message)
+
+
+async def _cache_reply(user_message: str, reply: str) -> None:
+    # Only LLM replies are cached; the rule-based fallback is free to recompute
+    # and caching it would pin a degraded answer after an outage.
+    if not REPLY_CACHE_ENABLED or not reply:
+        return
+    key = reply_cache.put(user_message, reply)
+    if key is not None:
+        try:
+            await run_in_threadpool(reply_cache.save_entry, key)
+        except Exception as e:
+            record_error("reply_cache", "Error saving reply cache entry", e)
+
+
+async def load_chat_context(user_id: Optional[int]) -> List[dict]:
+    """Earlier turns for the user's prompt (empty for anonymous callers)."""
+    if user_id is None or not CHAT_CONTEXT_ENABLED:
+        return []
     try:
-        completion = groq_client.chat.completions.create(
-            model="llama3-8b-8192",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_message},
-            ],
-            temperature=0.3,
-            max_tokens=512,
-        )
-        reply = completion.choices[0].message.content or ""
-        return reply.strip()
+        # Other workers may have answered this user since our copy was built
+        stored_ts = await storage.latest_chat_ts(user_id) if CHAT_CONTEXT_VERIFY else None
+        history = conversation_store.cached(user_id, stored_ts)
+        if history is None:
+            with STAGE_SECONDS.labels("db_load_chat_context").time():
+                rows = await storage.recent_chat_messages(
+                    user_id, conversation_store.load_messages
+                )
+            history = conversation_store.seed(
+                user_id, rows, write_queue.pending("chat_messages", user_id)
+            )
+        return history
     except Exception as e:
-        print("Groq error:", e)
-        return ""
+        record_error("chat_context", "Error loading chat context", e)
+        return []
 
 
-def _call_ollama_llm(system_prompt: str, user_message: str) -> str:
-    """
-    Call local Ollama if running (http://127.0.0.1:11434).
-    """
+async def save_chat_turn(user_id: Optional[int], user_message: str, reply: str) -> None:
+    """Fold the exchange into the user's context and queue it for storage."""
+    if user_id is None:
+        return
+    rows = chat_pair_rows(user_id, user_message, reply)
+    if CHAT_CONTEXT_ENABLED and reply:
+        conversation_store.record(user_id, rows)
     try:
-        payload = {
-            "model": "llama3",
-            "prompt": system_prompt + "\n\nUser message:\n" + user_message,
-            "stream": False,
-        }
-        with httpx.Client(timeout=45.0) as client:
-            resp = client.post(OLLAMA_URL, json=payload)
-            resp.raise_for_status()
-            data = resp.json()
-        reply = data.get("response", "") or ""
-        return reply.strip()
+        await write_queue.enqueue("chat_messages", rows)
     except Exception as e:
-        print("Ollama error:", e)
-        return ""
+        record_error("persistence", "Error saving chat", e)
 
-def generate_chat_reply(user_message: str) -> str:
-    text = user_message.lower()
 
-    emergency_keywords = [
-        "cant breathe", "can't breathe", "difficulty breathing",
-        "chest pain", "blue lips", "unconscious", "seizure",
-        "stroke", "heart attack",
-    ]
-    if any(k in text for k in emergency_keywords):
-        return (
-            "This could be an emergency. Stop using this app and contact emergency services "
-            "or go to the nearest hospital immediately. I am not a doctor and cannot handle emergencies."
-        )
+def chat_caller_key(request: Request, user_id: Optional[int]) -> str:
+    """Per-caller key for chat admission: the user when known, else the client IP."""
+    if user_id is not None:
+        return f"user:{user_id}"
+    return f"ip:{request.client.host if request.client else 'unknown'}"
 
-    system_prompt = (
-        "You are a cautious health information assistant. "
-        "You ONLY provide general health and safety information, not medical diagnoses. "
-        "You are NOT a doctor. "
-        "Always encourage the user to consult a healthcare professional for diagnosis "
-        "or serious concerns. Keep answers clear and concise (3–6 sentences)."
-    )
 
-    # Try Groq first
-    if groq_client is not None:
-        try:
-            completion = groq_client.chat.completions.create(
-                model="llama-3.1-8b-instant",   # ✅ UPDATED MODEL
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_message},
-                ],
-                temperature=0.3,
-                max_tokens=512,
-            )
-            reply = completion.choices[0].message.content or ""
-            if reply.strip():
-                print("⚡ Groq responded")
-                return reply.strip()
-        except Exception as e:
-            print("Groq error:", e)
+async def generate_chat_reply(
+    user_message: str,
+    history: Optional[List[dict]] = None,
+    caller: str = "anonymous",
+) -> str:
+    text = user_message.lower()
 
-    # Ollama fallback
-    try:
-        ollama_url = "http://127.0.0.1:11434/api/generate"
-        resp = httpx.post(
-            ollama_url,
-            json={"model": "llama3.2", "prompt": user_message},
-            timeout=20.0
-        )
-        if resp.status_code == 200:
-            reply = resp.json().get("response", "").strip()
-            if reply:
-                print("🟢 Ollama responded")
-                return reply
-    except Exception as e:
-        print("Ollama error:", e)
+    if _is_emergency(text):
+        CHAT_REPLIES.labels("emergency").inc()
+        return rule_book.current().emergency_reply
+
+    # A follow-up ("what about for kids?") depends on earlier turns, so the
+    # reply cache only serves and stores first messages.
+    use_cache = not history
+    if use_cache:
+        cached = _cached_reply(user_message)
+        if cached is not None:
+            CHAT_REPLIES.labels("cache").inc()
+            return cached
+
+    # Groq first, hedged to Ollama when Groq is slow; skips broken providers.
+    # Admission control bounds upstream calls; shed requests get the fallback.
+    messages = llm.build_messages(CHAT_SYSTEM_PROMPT, user_message, history)
+    async with chat_admission.admit(caller) as admitted:
+        result = await chat_scheduler.run(messages) if admitted else None
+    if not admitted:
+        CHAT_REPLIES.labels("shed").inc()
+        return _fallback_rule_based_reply(text)
+    if result is not None:
+        name, reply = result
+        CHAT_REPLIES.labels(name.lower()).inc()
+        logger.debug("%s responded", name)
+        if use_cache:
+            await _cache_reply(user_message, reply)
+        return reply
 
     # Rule-based fallback
+    CHAT_REPLIES.labels("fallback").inc()
     return _fallback_rule_based_reply(text)
 
-# ---------- Nearby hospitals (Overpass) ----------
+
+async def stream_chat_reply(
+    user_message: str,
+    history: Optional[List[dict]] = None,
+    caller: str = "anonymous",
+) -> AsyncIterator[str]:
+    """
+    Same providers as generate_chat_reply, but yields tokens as the upstream
+    model produces them. Falls back to the rule-based reply if no provider
+    produced anything. A reply the provider dropped partway through ends
+    with CHAT_STREAM_CUT_OFF_NOTE and is never cached.
+    """
+    text = user_message.lower()
+
+    if _is_emergency(text):
+        CHAT_REPLIES.labels("emergency").inc()
+        yield rule_book.current().emergency_reply
+        return
+
+    use_cache = not history
+    if use_cache:
+        cached = _cached_reply(user_message)
+        if cached is not None:
+            CHAT_REPLIES.labels("cache").inc()
+            yield cached
+            return
+
+    parts: List[str] = []
+    interrupted = False
+    messages = llm.build_messages(CHAT_SYSTEM_PROMPT, user_message, history)
+    async with chat_admission.admit(caller) as admitted:
+        if admitted:
+            try:
+                async for token in chat_scheduler.stream(messages):
+                    parts.append(token)
+                    yield token
+            except StreamInterrupted:
+                interrupted = True
+    if not admitted:
+        CHAT_REPLIES.labels("shed").inc()
+        yield _fallback_rule_based_reply(text)
+    elif interrupted:
+        # Only part of a reply: tell the user, and keep it out of the cache
+        CHAT_REPLIES.labels("llm_stream_cut_off").inc()
+        yield CHAT_STREAM_CUT_OFF_NOTE
+    elif parts:
+        CHAT_REPLIES.labels("llm_stream").inc()
+        if use_cache:
+            await _cache_reply(user_message, "".join(parts).strip())
+    else:
+        CHAT_REPLIES.labels("fallback").inc()
+        yield _fallback_rule_based_reply(text)
+
+
+def _sse(data: dict, event: Optional[str] = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+
+# ---------- Nearby hospitals (local index + Overpass) ----------
+def _to_hospital(h: dict) -> Hospital:
+    lat_h, lon_h = h["lat"], h["lng"]
+    return Hospital(
+        name=h["name"],
+        address=h["address"] or h["name"],
+        lat=lat_h,
+        lng=lon_h,
+        rating=None,
+        user_ratings_total=None,
+        place_id=h["place_id"],
+        open_now=None,
+        maps_url=f"https://www.openstreetmap.org/?mlat={lat_h}&mlon={lon_h}#map=17/{lat_h}/{lon_h}",
+    )
+
+
 @app.post("/api/nearby-hospitals", response_model=List[Hospital])
-def nearby_hospitals(payload: NearbyHospitalsRequest):
+async def nearby_hospitals(payload: NearbyHospitalsRequest, background_tasks: BackgroundTasks):
     lat = payload.latitude
     lon = payload.longitude
-    radius = 10000  # 10km
-
-    overpass_url = "https://overpass-api.de/api/interpreter"
-    query = f"""
-    [out:json];
-    (
-      node["amenity"="hospital"](around:{radius},{lat},{lon});
-      way["amenity"="hospital"](around:{radius},{lat},{lon});
-      relation["amenity"="hospital"](around:{radius},{lat},{lon});
-    );
-    out center;
-    """
-
+    radius = max(1, min(payload.radius_meters, hospitals.HOSPITALS_MAX_RADIUS_M))
+
+    found, covered_ts = await run_in_threadpool(hospitals.nearest, lat, lon, radius)
+    if covered_ts is not None or not hospitals.HOSPITALS_OVERPASS_FALLBACK:
+        _, now_ts = utc_now()
+        if (
+            covered_ts is not None
+            and hospitals.HOSPITALS_OVERPASS_FALLBACK
+            and now_ts - covered_ts > hospitals.HOSPITALS_REFRESH_SECONDS * 1000
+        ):
+            background_tasks.add_task(hospitals.refresh_area, lat, lon, radius)
+        return [_to_hospital(h) for h in found]
+
+    # The index was never filled this far out around here: ask Overpass (once
+    # per tile), which also records the area as covered
     try:
-        with httpx.Client(timeout=25.0) as client:
-            resp = client.post(overpass_url, data=query)
-            resp.raise_for_status()
-            data = resp.json()
+        found = await hospitals.lookup_upstream(lat, lon, radius)
     except Exception as e:
-        print("Overpass error:", e)
+        record_error("overpass", "Overpass error", e)
+        if found:
+            # Partial local results beat an error
+            return [_to_hospital(h) for h in found]
         raise HTTPException(status_code=502, detail="Failed to fetch nearby hospitals")
+    return [_to_hospital(h) for h in found]
+
 
-    hospitals: List[Hospital] = []
-    for el in data.get("elements", []):
-        name = el.get("tags", {}).get("name", "Unnamed Hospital")
-        if "lat" in el and "lon" in el:
-            lat_h = el["lat"]
-            lon_h = el["lon"]
-        elif "center" in el:
-            lat_h = el["center"]["lat"]
-            lon_h = el["center"]["lon"]
-        else:
-            continue
-
-        hospitals.append(
-            Hospital(
-                name=name,
-                address=name,
-                lat=lat_h,
-                lng=lon_h,
-                rating=None,
-                user_ratings_total=None,
-                place_id=str(el.get("id")),
-                open_now=None,
-                maps_url=f"https://www.openstreetmap.org/?mlat={lat_h}&mlon={lon_h}#map=17/{lat_h}/{lon_h}",
+# ---------- Auth endpoints ----------
+def _check_auth_rate(request: Request, email: str) -> None:
+    """429 when the client IP or the target email is over its auth budget."""
+    if not AUTH_RATE_LIMIT_ENABLED:
+        return
+    ip = request.client.host if request.client else "unknown"
+    for limiter, key in ((auth_ip_limiter, ip), (auth_email_limiter, email.lower())):
+        allowed, retry_after = limiter.acquire(key)
+        if not allowed:
+            raise HTTPException(
+                status_code=429,
+                detail="Too many attempts. Please try again later.",
+                headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
             )
+
+
+async def _hash_or_503(coro):
+    try:
+        return await coro
+    except HashPoolBusy:
+        raise HTTPException(
+            status_code=503,
+            detail="Server is busy. Please try again shortly.",
+            headers={"Retry-After": "1"},
         )
 
-    return hospitals
+
+@timed("db_users")
+async def get_user_by_email(email: str):
+    return await storage.get_user_by_email(email)
+
+
+@timed("db_users")
+async def create_user(email: str, password_hash: str) -> Optional[int]:
+    """New user's id, or None if the email is already registered."""
+    return await storage.create_user(email, password_hash)
+
+
+@timed("db_users")
+async def update_password_hash(user_id: int, password_hash: str) -> None:
+    await storage.update_password_hash(user_id, password_hash)
+
+
+def _login_response(user_id: int, email: str) -> LoginResponse:
+    token, expires_at = session_manager.issue(user_id)
+    return LoginResponse(user_id=user_id, email=email, token=token, expires_at=expires_at)
+
+
+def _bearer_session(authorization: Optional[str]) -> Optional[Session]:
+    """The verified session for an `Authorization: Bearer` header (401 if invalid)."""
+    if not authorization:
+        return None
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token.strip():
+        raise HTTPException(status_code=401, detail="Invalid Authorization header.")
+    session = session_manager.verify(token.strip())
+    if session is None:
+        raise HTTPException(
+            status_code=401,
+            detail="Session expired or invalid. Please log in again.",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return session
+
+
+def current_user_id(
+    authorization: Optional[str] = Header(default=None),
+    x_user_id: Optional[int] = Header(default=None, alias="X-User-Id"),
+) -> Optional[int]:
+    """
+    Caller's user id from a signed session token (checked in memory, no DB
+    lookup), falling back to the legacy X-User-Id header when
+    SESSION_ALLOW_USER_ID_HEADER opts in. None for anonymous callers.
+    """
+    session = _bearer_session(authorization)
+    if session is not None:
+        return session.user_id
+    if x_user_id is not None and SESSION_ALLOW_USER_ID_HEADER:
+        # Real ids start at 1; 0 is trends.GLOBAL_USER_ID
+        if x_user_id <= 0:
+            raise HTTPException(status_code=400, detail="Invalid X-User-Id.")
+        return x_user_id
+    return None
 
 
-# ---------- Auth endpoints ----------
 @app.post("/api/signup", response_model=LoginResponse)
-def signup(payload: SignupRequest):
-    conn = get_db()
-    cur = conn.cursor()
-    cur.execute("SELECT id FROM users WHERE email = ?", (payload.email,))
-    existing = cur.fetchone()
+async def signup(payload: SignupRequest, request: Request):
+    _check_auth_rate(request, payload.email)
+    existing = await get_user_by_email(payload.email)
     if existing:
-        conn.close()
         raise HTTPException(status_code=400, detail="Email is already registered.")
 
-    password_hash = hash_password(payload.password)
-    now = datetime.utcnow().isoformat()
+    password_hash = await _hash_or_503(password_hasher.hash(payload.password))
+    user_id = await create_user(payload.email, password_hash)
+    if user_id is None:
+        raise HTTPException(status_code=400, detail="Email is already registered.")
+    return _login_response(user_id, payload.email)
+
+
+@app.post("/api/login", response_model=LoginResponse)
+async def login(payload: LoginRequest, request: Request):
+    _check_auth_rate(request, payload.email)
+    row = await get_user_by_email(payload.email)
 
-    cur.execute(
-        "INSERT INTO users (email, password_hash, created_at) VALUES (?, ?, ?)",
-        (payload.email, password_hash, now),
+    # Unknown emails still pay for one hash so timing doesn't reveal them
+    valid, needs_rehash = await _hash_or_503(
+        password_hasher.verify(payload.password, row["password_hash"] if row else None)
     )
-    conn.commit()
-    user_id = cur.lastrowid
-    conn.close()
-    return LoginResponse(user_id=user_id, email=payload.email)
+    if not row or not valid:
+        raise HTTPException(status_code=401, detail="Invalid email or password.")
 
+    if needs_rehash:
+        # Upgrade legacy SHA-256 (or outdated scrypt) hashes while we have the password
+        try:
+            new_hash = await password_hasher.hash(payload.password)
+            await update_password_hash(row["id"], new_hash)
+        except Exception as e:
+            record_error("auth", "Error rehashing password", e)
+    return _login_response(row["id"], payload.email)
 
-@app.post("/api/login", response_model=LoginResponse)
-def login(payload: LoginRequest):
-    conn = get_db()
-    cur = conn.cursor()
-    cur.execute(
-        "SELECT id, password_hash FROM users WHERE email = ?",
-        (payload.email,),
+
+@app.post("/api/logout")
+def logout(authorization: Optional[str] = Header(default=None)):
+    session = _bearer_session(authorization)
+    if session is None:
+        raise HTTPException(status_code=401, detail="Missing bearer token.")
+    session_manager.revoke(session)
+    return {"message": "Logged out."}
+
+
+# ---------- Metrics gauges (read at scrape time) ----------
+_DB_POOL_CONNECTIONS = registry.gauge(
+    "safelink_db_pool_connections", "SQLite pool connections by state.", ["state"]
+)
+_DB_POOL_CONNECTIONS.labels("in_use").set_function(lambda: db_pool.stats()["in_use"])
+_DB_POOL_CONNECTIONS.labels("idle").set_function(lambda: db_pool.stats()["idle"])
+registry.gauge(
+    "safelink_write_queue_depth",
+    "Batches waiting in the write-behind queue.",
+    fn=lambda: write_queue.stats()["depth"],
+)
+registry.gauge(
+    "safelink_reply_cache_entries",
+    "Entries in the chat reply cache.",
+    fn=lambda: reply_cache.stats()["entries"],
+)
+registry.gauge(
+    "safelink_chat_contexts",
+    "Conversation contexts held in memory.",
+    fn=lambda: conversation_store.stats()["users"],
+)
+registry.gauge(
+    "safelink_hospital_tile_cache_entries",
+    "Overpass tiles held in memory.",
+    fn=lambda: hospitals.hospital_tile_cache.stats()["entries"],
+)
+registry.gauge(
+    "safelink_llm_active",
+    "Upstream LLM calls holding an admission slot.",
+    fn=lambda: chat_admission.active,
+)
+registry.gauge(
+    "safelink_llm_queue_depth",
+    "Chat requests waiting for an LLM admission slot.",
+    fn=lambda: chat_admission.depth,
+)
+_BREAKER_OPEN = registry.gauge(
+    "safelink_llm_breaker_open", "1 while a provider's circuit breaker is not closed.", ["provider"]
+)
+for _provider in chat_scheduler.providers:
+    _BREAKER_OPEN.labels(_provider.name.lower()).set_function(
+        lambda p=_provider: 0 if p.breaker.state == "closed" else 1
     )
-    row = cur.fetchone()
-    conn.close()
 
-    if not row:
-        raise HTTPException(status_code=401, detail="Invalid email or password.")
-    if row["password_hash"] != hash_password(payload.password):
-        raise HTTPException(status_code=401, detail="Invalid email or password.")
-    return LoginResponse(user_id=row["id"], email=payload.email)
+
+# ---------- Ops endpoints ----------
+# /metrics and the /api/*-stats pages describe the server's internals, so
+# they only answer callers sending `Authorization: Bearer <OPS_TOKEN>` (what
+# Prometheus' `authorization` scrape option sends). Without OPS_TOKEN they
+# are switched off.
+OPS_TOKEN = os.getenv("OPS_TOKEN", "")
+
+
+def require_ops_token(authorization: Optional[str] = Header(default=None)) -> None:
+    if not OPS_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(
+        token.strip().encode("utf-8"), OPS_TOKEN.encode("utf-8")
+    ):
+        raise HTTPException(
+            status_code=401, detail="Ops token required.", headers={"WWW-Authenticate": "Bearer"}
+        )
 
 
 # ---------- API routes ----------
@@ -634,55 +930,218 @@ def read_root():
     return {"message": "SafeLink AI Backend is running 🚀"}
 
 
+@app.get("/metrics", dependencies=[Depends(require_ops_token)])
+def metrics():
+    """Prometheus text exposition of all counters, gauges and histograms."""
+    return Response(content=registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.get("/api/db-stats", dependencies=[Depends(require_ops_token)])
+def db_stats():
+    stats = db_pool.stats()
+    stats["storage"] = storage.stats()
+    stats["write_queue"] = write_queue.stats()
+    if storage.name == "sqlite":
+        stats["archive"] = archive.stats()
+    return stats
+
+
+@app.get("/api/hospital-stats", dependencies=[Depends(require_ops_token)])
+def hospital_stats():
+    return hospitals.hospital_tile_cache.stats()
+
+
+@app.get("/api/auth-stats", dependencies=[Depends(require_ops_token)])
+def auth_stats():
+    return {
+        "sessions": session_manager.stats(),
+        "password_hasher": password_hasher.stats(),
+        "rate_limit": {
+            "enabled": AUTH_RATE_LIMIT_ENABLED,
+            "per_ip": auth_ip_limiter.stats(),
+            "per_email": auth_email_limiter.stats(),
+        },
+    }
+
+
+@app.get("/api/llm-stats", dependencies=[Depends(require_ops_token)])
+def llm_stats():
+    stats = chat_scheduler.stats()
+    stats["reply_cache"] = reply_cache.stats()
+    stats["conversations"] = conversation_store.stats()
+    stats["admission"] = chat_admission.stats()
+    stats["ollama"] = llm.ollama_client.stats()
+    return stats
+
+
+@app.get("/api/rules-stats", dependencies=[Depends(require_ops_token)])
+def rules_stats():
+    return rule_book.stats()
+
+
 @app.post("/api/symptom-check", response_model=SymptomCheckResponse)
-def symptom_check(
+async def symptom_check(
     payload: SymptomCheckRequest,
-    x_user_id: Optional[int] = Header(default=None, alias="X-User-Id"),
+    user_id: Optional[int] = Depends(current_user_id),
 ):
     result = analyze_symptoms(payload)
-    if x_user_id is not None:
+    if user_id is not None:
         try:
-            save_symptom_check_to_db(x_user_id, payload, result)
+            await write_queue.enqueue(
+                "symptom_checks", symptom_check_rows(user_id, [(payload, result)])
+            )
         except Exception as e:
-            print("Error saving symptom check:", e)
+            record_error("persistence", "Error saving symptom check", e)
     return result
 
 
+@app.post("/api/symptom-check/batch", response_model=List[SymptomCheckResponse])
+async def symptom_check_batch(
+    payloads: List[SymptomCheckRequest],
+    user_id: Optional[int] = Depends(current_user_id),
+):
+    if len(payloads) > SYMPTOM_BATCH_MAX:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {SYMPTOM_BATCH_MAX} symptom checks per batch.",
+        )
+    results = await run_in_threadpool(analyze_symptoms_batch, payloads)
+    if user_id is not None:
+        try:
+            await write_queue.enqueue(
+                "symptom_checks", symptom_check_rows(user_id, list(zip(payloads, results)))
+            )
+        except Exception as e:
+            record_error("persistence", "Error saving symptom checks", e)
+    return results
+
+
 @app.get("/api/symptom-history", response_model=List[SymptomHistoryItem])
-def symptom_history(
-    x_user_id: Optional[int] = Header(default=None, alias="X-User-Id"),
+async def symptom_history(
+    limit: Optional[int] = Query(default=None, ge=1),
+    cursor: Optional[str] = None,
+    format: Literal["json", "ndjson"] = "json",
+    user_id: Optional[int] = Depends(current_user_id),
 ):
-    if x_user_id is None:
-        raise HTTPException(status_code=401, detail="Missing X-User-Id header.")
-    return get_symptom_history_from_db(x_user_id)
+    if user_id is None:
+        raise HTTPException(status_code=401, detail="Not logged in.")
+    if format == "ndjson":
+        return stream_history_ndjson("symptom_checks", user_id, limit, cursor)
+    history, next_cursor = await get_symptom_history_from_db(
+        user_id, min(limit or HISTORY_DEFAULT_LIMIT, HISTORY_MAX_LIMIT), cursor
+    )
+    return json_response(history, {"X-Next-Cursor": next_cursor})
+
+
+@app.get("/api/symptom-trends", response_model=SymptomTrendsResponse)
+async def symptom_trends(
+    days: int = Query(default=trends.TRENDS_DEFAULT_DAYS, ge=1, le=trends.TRENDS_MAX_DAYS),
+    scope: Literal["user", "global"] = "user",
+    user_id: Optional[int] = Depends(current_user_id),
+):
+    if user_id is None:
+        raise HTTPException(status_code=401, detail="Not logged in.")
+    rollup_id = user_id if scope == "user" else trends.GLOBAL_USER_ID
+    daily, top_flags = await storage.symptom_trends(rollup_id, days)
+    return SymptomTrendsResponse(scope=scope, days=days, daily=daily, top_flags=top_flags)
+
+
+@app.get("/api/history/search", response_model=List[HistorySearchHit])
+async def history_search(
+    q: str = Query(..., min_length=1, max_length=200),
+    kind: Literal["all", "chat", "symptom"] = "all",
+    limit: Optional[int] = Query(default=None, ge=1),
+    cursor: Optional[str] = None,
+    user_id: Optional[int] = Depends(current_user_id),
+):
+    if user_id is None:
+        raise HTTPException(status_code=401, detail="Not logged in.")
+    sources = search.SOURCES if kind == "all" else (kind,)
+    try:
+        hits, next_cursor = await storage.search_history(
+            user_id,
+            q,
+            sources,
+            min(limit or search.SEARCH_DEFAULT_LIMIT, search.SEARCH_MAX_LIMIT),
+            cursor,
+        )
+    except search.InvalidQuery as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # Hits are built from our own rows (search.build_page); no re-validation
+    return json_response(hits, {"X-Next-Cursor": next_cursor})
 
 
 @app.post("/api/chat", response_model=ChatResponse)
-def chat_with_assistant(
+async def chat_with_assistant(
     payload: ChatRequest,
-    x_user_id: Optional[int] = Header(default=None, alias="X-User-Id"),
+    request: Request,
+    user_id: Optional[int] = Depends(current_user_id),
 ):
     text = payload.message or payload.content
     if not text or not text.strip():
         raise HTTPException(status_code=400, detail="Message is required.")
-    reply = generate_chat_reply(text)
-    if x_user_id is not None:
-        try:
-            save_chat_pair_to_db(x_user_id, text, reply)
-        except Exception as e:
-            print("Error saving chat:", e)
+    history = await load_chat_context(user_id)
+    reply = await generate_chat_reply(text, history, chat_caller_key(request, user_id))
+    await save_chat_turn(user_id, text, reply)
     return ChatResponse(reply=reply)
 
 
+@app.post("/api/chat/stream")
+async def chat_stream(
+    payload: ChatRequest,
+    request: Request,
+    user_id: Optional[int] = Depends(current_user_id),
+):
+    """
+    Server-Sent Events: one `data: {"token": ...}` event per chunk, then an
+    `event: done` carrying the full reply.
+    """
+    text = payload.message or payload.content
+    if not text or not text.strip():
+        raise HTTPException(status_code=400, detail="Message is required.")
+
+    history = await load_chat_context(user_id)
+    caller = chat_caller_key(request, user_id)
+
+    async def events() -> AsyncIterator[str]:
+        parts: List[str] = []
+        async for token in stream_chat_reply(text, history, caller):
+            parts.append(token)
+            yield _sse({"token": token})
+        reply = "".join(parts).strip()
+        yield _sse({"reply": reply}, event="done")
+        await save_chat_turn(user_id, text, reply)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @app.get("/api/chat-history", response_model=List[ChatHistoryItem])
-def chat_history(
-    x_user_id: Optional[int] = Header(default=None, alias="X-User-Id"),
+async def chat_history(
+    limit: Optional[int] = Query(default=None, ge=1),
+    cursor: Optional[str] = None,
+    format: Literal["json", "ndjson"] = "json",
+    user_id: Optional[int] = Depends(current_user_id),
 ):
-    if x_user_id is None:
-        raise HTTPException(status_code=401, detail="Missing X-User-Id header.")
-    return get_chat_history_from_db(x_user_id)
+    if user_id is None:
+        raise HTTPException(status_code=401, detail="Not logged in.")
+    if format == "ndjson":
+        return stream_history_ndjson("chat_messages", user_id, limit, cursor)
+    history, next_cursor = await get_chat_history_from_db(
+        user_id, min(limit or HISTORY_DEFAULT_LIMIT, HISTORY_MAX_LIMIT), cursor
+    )
+    return json_response(history, {"X-Next-Cursor": next_cursor})
+
+
+_APP_READY = time.perf_counter()
 
 
 # ---------- Run locally ----------
 if __name__ == "__main__":
-    uvicorn.run("main:app", host="127.0.0.1", port=8000, reload=True)
\ No newline at end of file
+    # Same entry point as production; set UVICORN_RELOAD=true for development
+    import serve
+
+    serve.main()
@@ -0,0 +1,406 @@
+import logging
+import sqlite3
+from typing import Callable, List, Set, Tuple
+
+logger = logging.getLogger("safelink")
+
+
+# ---------- Schema migrations ----------
+# Each migration runs once, in order, inside its own transaction. The applied
+# version is tracked in SQLite's built-in `PRAGMA user_version`, so adding a
+# migration is just appending a function to MIGRATIONS.
+
+# ISO-8601 `created_at` text -> epoch milliseconds.
+_ISO_TO_EPOCH_MS = (
+    "COALESCE(CAST(strftime('%s', created_at) AS INTEGER) * 1000"
+    " + CAST(substr(created_at, 21, 3) AS INTEGER), 0)"
+)
+
+
+def _m001_base_tables(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            email TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            created_at TEXT NOT NULL
+        );
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS symptom_checks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            age INTEGER,
+            temperature REAL,
+            symptoms_text TEXT,
+            risk_level TEXT,
+            risk_score INTEGER,
+            advice TEXT,
+            created_at TEXT NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        );
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS chat_messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        );
+        """
+    )
+
+
+def _m002_history_indexes(conn: sqlite3.Connection) -> None:
+    # Sortable integer timestamp so history reads can walk an index instead
+    # of sorting datetime(created_at) over the whole table.
+    for table in ("symptom_checks", "chat_messages"):
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN created_ts INTEGER NOT NULL DEFAULT 0")
+        conn.execute(f"UPDATE {table} SET created_ts = {_ISO_TO_EPOCH_MS}")
+        conn.execute(
+            f"CREATE INDEX IF NOT EXISTS idx_{table}_user_ts "
+            f"ON {table} (user_id, created_ts DESC, id DESC)"
+        )
+
+
+def _m003_reply_cache(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS reply_cache (
+            key TEXT PRIMARY KEY,
+            question TEXT NOT NULL,
+            reply TEXT NOT NULL,
+            created_ts INTEGER NOT NULL
+        );
+        """
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_reply_cache_created_ts ON reply_cache (created_ts)"
+    )
+
+
+def _m004_hospitals(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS hospitals (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            osm_key TEXT UNIQUE NOT NULL,
+            place_id TEXT NOT NULL,
+            name TEXT NOT NULL,
+            address TEXT,
+            lat REAL NOT NULL,
+            lng REAL NOT NULL,
+            source TEXT,
+            updated_ts INTEGER NOT NULL
+        );
+        """
+    )
+    try:
+        conn.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS hospitals_rtree "
+            "USING rtree(id, min_lat, max_lat, min_lng, max_lng)"
+        )
+    except sqlite3.OperationalError:
+        # SQLite built without the R*Tree module: fall back to a plain index.
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_hospitals_lat_lng ON hospitals (lat, lng)")
+
+
+def _m005_symptom_trends(conn: sqlite3.Connection) -> None:
+    # Daily rollups maintained on insert (see trends.py); user_id 0 is the
+    # population-wide row.
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS symptom_trends_daily (
+            user_id INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            checks INTEGER NOT NULL DEFAULT 0,
+            low INTEGER NOT NULL DEFAULT 0,
+            medium INTEGER NOT NULL DEFAULT 0,
+            high INTEGER NOT NULL DEFAULT 0,
+            score_sum INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, day)
+        ) WITHOUT ROWID;
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS symptom_trends_flags (
+            user_id INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            flag TEXT NOT NULL,
+            hits INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, day, flag)
+        ) WITHOUT ROWID;
+        """
+    )
+    # Backfill counts and scores from existing history. Flags were never
+    # stored per check, so flag frequencies start from this migration on.
+    for user_column in ("user_id", "0"):
+        conn.execute(
+            f"""
+            INSERT INTO symptom_trends_daily (user_id, day, checks, low, medium, high, score_sum)
+            SELECT {user_column}, date(created_ts / 1000, 'unixepoch'), COUNT(*),
+                   SUM(risk_level = 'Low'), SUM(risk_level = 'Medium'), SUM(risk_level = 'High'),
+                   COALESCE(SUM(risk_score), 0)
+            FROM symptom_checks
+            GROUP BY 1, 2
+            """
+        )
+
+
+def _m006_history_fts(conn: sqlite3.Connection) -> None:
+    # External-content FTS5 indexes over the history text, kept in sync by
+    # triggers (see search.py).
+    sources = (("chat_messages", "content"), ("symptom_checks", "symptoms_text"))
+    try:
+        for table, column in sources:
+            conn.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {table}_fts USING fts5("
+                f"{column}, content='{table}', content_rowid='id', "
+                f"tokenize='porter unicode61')"
+            )
+    except sqlite3.OperationalError:
+        # SQLite built without FTS5: search falls back to LIKE.
+        logger.warning("FTS5 unavailable; history search will use LIKE scans")
+        return
+    for table, column in sources:
+        fts = f"{table}_fts"
+        conn.execute(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN
+                INSERT INTO {fts} (rowid, {column}) VALUES (new.id, new.{column});
+            END;
+            """
+        )
+        conn.execute(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN
+                INSERT INTO {fts} ({fts}, rowid, {column}) VALUES ('delete', old.id, old.{column});
+            END;
+            """
+        )
+        conn.execute(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {column} ON {table} BEGIN
+                INSERT INTO {fts} ({fts}, rowid, {column}) VALUES ('delete', old.id, old.{column});
+                INSERT INTO {fts} (rowid, {column}) VALUES (new.id, new.{column});
+            END;
+            """
+        )
+        # Backfill the index from the rows already there
+        conn.execute(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')")
+
+
+def _m007_archive(conn: sqlite3.Connection) -> None:
+    # Manifest of archived history (see archive.py): one row per user per
+    # archive file, pointing at that user's gzip member.
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS archive_segments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            table_name TEXT NOT NULL,
+            path TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            offset INTEGER NOT NULL,
+            length INTEGER NOT NULL,
+            rows INTEGER NOT NULL,
+            min_ts INTEGER NOT NULL,
+            min_id INTEGER NOT NULL,
+            max_ts INTEGER NOT NULL,
+            max_id INTEGER NOT NULL,
+            created_ts INTEGER NOT NULL
+        )
+        """
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_archive_segments_user "
+        "ON archive_segments (table_name, user_id, max_ts DESC, max_id DESC)"
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS archive_runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            started_ts INTEGER NOT NULL,
+            finished_ts INTEGER,
+            rows INTEGER
+        )
+        """
+    )
+    # The archiver takes the globally oldest rows first
+    for table in ("symptom_checks", "chat_messages"):
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_ts ON {table} (created_ts, id)")
+
+
+def _m008_advice_codes(conn: sqlite3.Connection) -> None:
+    # Each check repeated one of a few canned advice paragraphs; store each
+    # text once and keep a code per row (reads resolve it, see storage.py).
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS advice_texts (id INTEGER PRIMARY KEY, text TEXT UNIQUE NOT NULL)"
+    )
+    conn.execute("ALTER TABLE symptom_checks ADD COLUMN advice_code INTEGER")
+    conn.execute(
+        "INSERT OR IGNORE INTO advice_texts (text) "
+        "SELECT DISTINCT advice FROM symptom_checks WHERE advice IS NOT NULL"
+    )
+    conn.execute(
+        """
+        UPDATE symptom_checks
+        SET advice_code = (SELECT id FROM advice_texts WHERE text = symptom_checks.advice),
+            advice = NULL
+        WHERE advice IS NOT NULL
+        """
+    )
+
+
+def _m009_hospital_coverage(conn: sqlite3.Connection) -> None:
+    # Circles the local hospital index is known to be complete for (one per
+    # Overpass fetch or file import, see hospitals.py); a lookup reaching
+    # outside them goes upstream even when the index has some hits.
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS hospital_coverage (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            lat REAL NOT NULL,
+            lng REAL NOT NULL,
+            radius_m REAL NOT NULL,
+            min_lat REAL NOT NULL,
+            max_lat REAL NOT NULL,
+            min_lng REAL NOT NULL,
+            max_lng REAL NOT NULL,
+            source TEXT,
+            fetched_ts INTEGER NOT NULL
+        )
+        """
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_hospital_coverage_lat ON hospital_coverage (min_lat, max_lat)"
+    )
+
+
+def _m010_history_fts_owner(conn: sqlite3.Connection) -> None:
+    # Rebuild the migration-6 indexes with an `owner` column holding a
+    # per-user token ("u42"), so search MATCHes on it and FTS5 only walks
+    # the caller's postings instead of filtering everyone's hits after the
+    # fact. The base tables have no `owner` column, so each index reads its
+    # content through a view that derives it.
+    if conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'chat_messages_fts'"
+    ).fetchone() is None:
+        return  # no FTS5 in this build (see _m006_history_fts)
+    sources = (("chat_messages", "content"), ("symptom_checks", "symptoms_text"))
+    for table, column in sources:
+        fts = f"{table}_fts"
+        for suffix in ("ai", "ad", "au"):
+            conn.execute(f"DROP TRIGGER IF EXISTS {fts}_{suffix}")
+        conn.execute(f"DROP TABLE IF EXISTS {fts}")
+        conn.execute(
+            f"CREATE VIEW IF NOT EXISTS {fts}_src AS "
+            f"SELECT id, {column}, 'u' || user_id AS owner FROM {table}"
+        )
+        conn.execute(
+            f"CREATE VIRTUAL TABLE {fts} USING fts5("
+            f"{column}, owner, content='{fts}_src', content_rowid='id', "
+            f"tokenize='porter unicode61')"
+        )
+        conn.execute(
+            f"""
+            CREATE TRIGGER {fts}_ai AFTER INSERT ON {table} BEGIN
+                INSERT INTO {fts} (rowid, {column}, owner)
+                VALUES (new.id, new.{column}, 'u' || new.user_id);
+            END;
+            """
+        )
+        conn.execute(
+            f"""
+            CREATE TRIGGER {fts}_ad AFTER DELETE ON {table} BEGIN
+                INSERT INTO {fts} ({fts}, rowid, {column}, owner)
+                VALUES ('delete', old.id, old.{column}, 'u' || old.user_id);
+            END;
+            """
+        )
+        conn.execute(
+            f"""
+            CREATE TRIGGER {fts}_au AFTER UPDATE OF {column}, user_id ON {table} BEGIN
+                INSERT INTO {fts} ({fts}, rowid, {column}, owner)
+                VALUES ('delete', old.id, old.{column}, 'u' || old.user_id);
+                INSERT INTO {fts} (rowid, {column}, owner)
+                VALUES (new.id, new.{column}, 'u' || new.user_id);
+            END;
+            """
+        )
+        conn.execute(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')")
+
+
+MIGRATIONS: List[Tuple[int, Callable[[sqlite3.Connection], None]]] = [
+    (1, _m001_base_tables),
+    (2, _m002_history_indexes),
+    (3, _m003_reply_cache),
+    (4, _m004_hospitals),
+    (5, _m005_symptom_trends),
+    (6, _m006_history_fts),
+    (7, _m007_archive),
+    (8, _m008_advice_codes),
+    (9, _m009_hospital_coverage),
+    (10, _m010_history_fts_owner),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+# Databases (by path) this process has already seen at SCHEMA_VERSION
+_current: Set[str] = set()
+
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def ensure_schema(conn: sqlite3.Connection, path: str) -> int:
+    """
+    Startup entry point: a single `PRAGMA user_version` read when the
+    database is already current (nothing at all on later calls in the same
+    process), and migrate() only when it is behind.
+    """
+    if path in _current:
+        return 0
+    applied = 0
+    if get_schema_version(conn) < SCHEMA_VERSION:
+        applied = migrate(conn)
+    _current.add(path)
+    return applied
+
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """
+    Bring the database up to SCHEMA_VERSION. Returns the number of
+    migrations applied.
+    """
+    current = get_schema_version(conn)
+    applied = 0
+    for version, migration in MIGRATIONS:
+        if version <= current:
+            continue
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Another worker may have migrated while we waited for the lock.
+            if get_schema_version(conn) >= version:
+                conn.rollback()
+                continue
+            migration(conn)
+            conn.execute(f"PRAGMA user_version = {version}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        logger.info("DB migrated to schema version %d (%s)", version, migration.__name__)
+        applied += 1
+    if applied:
+        conn.execute("ANALYZE")
+    return applied
@@ -0,0 +1,168 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+# ---------- Config ----------
+# scrypt cost; n=2**14, r=8 needs 16 MiB and ~50-100 ms per hash.
+PASSWORD_SCRYPT_N = int(os.getenv("PASSWORD_SCRYPT_N", str(2 ** 14)))
+PASSWORD_SCRYPT_R = int(os.getenv("PASSWORD_SCRYPT_R", "8"))
+PASSWORD_SCRYPT_P = int(os.getenv("PASSWORD_SCRYPT_P", "1"))
+# Threads dedicated to hashing (hashlib.scrypt releases the GIL), i.e. the
+# most cores auth traffic can ever occupy.
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+# Hash jobs allowed to wait for a worker before new ones are refused.
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "32"))
+
+SALT_BYTES = 16
+KEY_BYTES = 32
+SCHEME = "scrypt"
+
+
+class HashPoolBusy(Exception):
+    """Too many password hashes are already queued."""
+
+
+def _b64(raw: bytes) -> str:
+    return base64.b64encode(raw).decode("ascii")
+
+
+def _scrypt(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    return hashlib.scrypt(
+        password.encode("utf-8"),
+        salt=salt,
+        n=n,
+        r=r,
+        p=p,
+        maxmem=256 * n * r + 1024 * 1024,
+        dklen=KEY_BYTES,
+    )
+
+
+def hash_password(password: str) -> str:
+    """scrypt hash encoded as `scrypt$n$r$p$salt$key` (blocking)."""
+    salt = secrets.token_bytes(SALT_BYTES)
+    key = _scrypt(password, salt, PASSWORD_SCRYPT_N, PASSWORD_SCRYPT_R, PASSWORD_SCRYPT_P)
+    return f"{SCHEME}${PASSWORD_SCRYPT_N}${PASSWORD_SCRYPT_R}${PASSWORD_SCRYPT_P}${_b64(salt)}${_b64(key)}"
+
+
+def _is_legacy(stored: str) -> bool:
+    # Original scheme: unsalted SHA-256 hex digest
+    return len(stored) == 64 and all(c in "0123456789abcdef" for c in stored)
+
+
+def verify_password(password: str, stored: str) -> Tuple[bool, bool]:
+    """
+    Returns (valid, needs_rehash). Legacy SHA-256 hashes and scrypt hashes
+    with outdated cost parameters verify normally but ask to be rehashed.
+    Comparisons are constant-time.
+    """
+    if _is_legacy(stored):
+        digest = hashlib.sha256(password.encode("utf-8")).hexdigest()
+        return hmac.compare_digest(digest, stored), True
+    try:
+        scheme, n, r, p, salt, key = stored.split("$")
+        if scheme != SCHEME:
+            return False, False
+        n, r, p = int(n), int(r), int(p)
+        expected = base64.b64decode(key)
+        actual = _scrypt(password, base64.b64decode(salt), n, r, p)
+    except ValueError:
+        return False, False
+    outdated = (n, r, p) != (PASSWORD_SCRYPT_N, PASSWORD_SCRYPT_R, PASSWORD_SCRYPT_P)
+    return hmac.compare_digest(actual, expected), outdated
+
+
+# Verified against when the email is unknown, so a miss costs the same as a
+# wrong password and response times don't reveal which emails exist.
+_DUMMY_HASH: Optional[str] = None
+
+
+def verify_unknown_user(password: str) -> Tuple[bool, bool]:
+    global _DUMMY_HASH
+    if _DUMMY_HASH is None:
+        _DUMMY_HASH = hash_password(secrets.token_hex(16))
+    verify_password(password, _DUMMY_HASH)
+    return False, False
+
+
+class PasswordHasher:
+    """
+    Runs password hashing on its own small thread pool, away from the event
+    loop and from the threadpool that serves DB work for the other
+    endpoints. At most `workers` hashes run at once and at most
+    `max_pending` may wait; beyond that HashPoolBusy is raised so a
+    credential-stuffing burst is refused instead of queueing without bound.
+    """
+
+    def __init__(
+        self,
+        workers: int = PASSWORD_HASH_WORKERS,
+        max_pending: int = PASSWORD_HASH_MAX_PENDING,
+    ):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._pending = 0
+
+        self.hashed = 0
+        self.verified = 0
+        self.rejected_busy = 0
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="password-hash"
+                )
+            return self._executor
+
+    async def _run(self, fn, *args):
+        with self._lock:
+            if self._pending >= self.workers + self.max_pending:
+                self.rejected_busy += 1
+                raise HashPoolBusy()
+            self._pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), fn, *args)
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    async def hash(self, password: str) -> str:
+        self.hashed += 1
+        return await self._run(hash_password, password)
+
+    async def verify(self, password: str, stored: Optional[str]) -> Tuple[bool, bool]:
+        self.verified += 1
+        if stored is None:
+            return await self._run(verify_unknown_user, password)
+        return await self._run(verify_password, password, stored)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "in_flight": self._pending,
+                "hashed": self.hashed,
+                "verified": self.verified,
+                "rejected_busy": self.rejected_busy,
+                "scrypt": {"n": PASSWORD_SCRYPT_N, "r": PASSWORD_SCRYPT_R, "p": PASSWORD_SCRYPT_P},
+            }
+
+
+password_hasher = PasswordHasher()
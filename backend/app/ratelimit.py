@@ -0,0 +1,72 @@
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Tuple
+
+# ---------- Config ----------
+AUTH_RATE_LIMIT_ENABLED = os.getenv("AUTH_RATE_LIMIT_ENABLED", "true").lower() == "true"
+AUTH_IP_PER_MINUTE = float(os.getenv("AUTH_IP_PER_MINUTE", "20"))
+AUTH_IP_BURST = float(os.getenv("AUTH_IP_BURST", "10"))
+AUTH_EMAIL_PER_MINUTE = float(os.getenv("AUTH_EMAIL_PER_MINUTE", "5"))
+AUTH_EMAIL_BURST = float(os.getenv("AUTH_EMAIL_BURST", "5"))
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+
+
+class TokenBucketLimiter:
+    """
+    Token buckets keyed by an arbitrary string (client IP, email, ...).
+
+    Each key holds up to `burst` tokens and refills at `per_minute` tokens
+    per minute; a request spends one. Buckets live in an LRU capped at
+    `max_keys`, so spraying random keys can't grow memory without bound
+    (an evicted key just starts again with a full bucket).
+    """
+
+    def __init__(self, per_minute: float, burst: float, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.rate = per_minute / 60.0
+        self.burst = burst
+        self.max_keys = max_keys
+        # key -> (tokens, last refill time)
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.allowed = 0
+        self.limited = 0
+
+    def acquire(self, key: str) -> Tuple[bool, float]:
+        """Spend a token for `key`. Returns (allowed, seconds until one is available)."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.get(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            if tokens >= 1.0:
+                self._buckets[key] = (tokens - 1.0, now)
+                allowed, retry_after = True, 0.0
+            else:
+                self._buckets[key] = (tokens, now)
+                allowed = False
+                retry_after = (1.0 - tokens) / self.rate if self.rate > 0 else math.inf
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            if allowed:
+                self.allowed += 1
+            else:
+                self.limited += 1
+        return allowed, retry_after
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "per_minute": round(self.rate * 60, 3),
+                "burst": self.burst,
+                "keys": len(self._buckets),
+                "allowed": self.allowed,
+                "limited": self.limited,
+            }
+
+
+auth_ip_limiter = TokenBucketLimiter(AUTH_IP_PER_MINUTE, AUTH_IP_BURST)
+auth_email_limiter = TokenBucketLimiter(AUTH_EMAIL_PER_MINUTE, AUTH_EMAIL_BURST)
@@ -0,0 +1,240 @@
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Dict, Optional, Set, Tuple
+
+from db import get_db, utc_now
+
+# ---------- Config ----------
+REPLY_CACHE_ENABLED = os.getenv("REPLY_CACHE_ENABLED", "true").lower() == "true"
+REPLY_CACHE_MAX_ENTRIES = int(os.getenv("REPLY_CACHE_MAX_ENTRIES", "2000"))
+REPLY_CACHE_TTL_SECONDS = float(os.getenv("REPLY_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+REPLY_CACHE_SIMILARITY = float(os.getenv("REPLY_CACHE_SIMILARITY", "0.85"))
+REPLY_CACHE_PERSIST = os.getenv("REPLY_CACHE_PERSIST", "true").lower() == "true"
+
+_WORD_RE = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+
+# Words that carry no meaning for matching a health question. Negations are
+# deliberately NOT here: "fever" and "no fever" must not collide.
+STOPWORDS = frozenset("""
+a about am an and any are as at be been can could did do does doing for from
+get got had has have having hello hey hi how i i'm i've im is it its ive me my
+of on or please should so some tell that the there this to was what when which
+who why will with would you your
+""".split())
+
+
+def normalize(text: str) -> str:
+    return " ".join(_WORD_RE.findall(text.lower()))
+
+
+def content_terms(normalized: str) -> Counter:
+    return Counter(w for w in normalized.split() if w not in STOPWORDS)
+
+
+class _Entry:
+    __slots__ = ("question", "reply", "terms", "created", "hits")
+
+    def __init__(self, question: str, reply: str, terms: Counter, created: float):
+        self.question = question
+        self.reply = reply
+        self.terms = terms
+        self.created = created
+        self.hits = 0
+
+
+class ReplyCache:
+    """
+    Two-tier cache of chat replies keyed by the user's question.
+
+    Tier 1 is an exact match on the normalized question text. Tier 2 is a
+    TF-IDF cosine match over content words, served from an inverted index so
+    a lookup only scores cached questions that share at least one term.
+    Entries expire after `ttl` seconds and the least recently used entry is
+    evicted past `max_entries`. With `persist` on, entries are also written
+    to the `reply_cache` table and reloaded on startup.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = REPLY_CACHE_MAX_ENTRIES,
+        ttl: float = REPLY_CACHE_TTL_SECONDS,
+        threshold: float = REPLY_CACHE_SIMILARITY,
+        persist: bool = REPLY_CACHE_PERSIST,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self.persist = persist
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._index: Dict[str, Set[str]] = {}
+        self._lock = threading.Lock()
+
+        self.exact_hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    # ----- internal (caller holds the lock) -----
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key)
+        for term in entry.terms:
+            keys = self._index.get(term)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._index[term]
+
+    def _expired(self, entry: _Entry, now: float) -> bool:
+        return now - entry.created > self.ttl
+
+    def _idf(self, term: str) -> float:
+        df = len(self._index.get(term, ()))
+        return math.log((len(self._entries) + 1) / (df + 1)) + 1.0
+
+    def _insert(self, key: str, question: str, reply: str, created: float) -> None:
+        if key in self._entries:
+            self._remove(key)
+        entry = _Entry(question, reply, content_terms(key), created)
+        self._entries[key] = entry
+        for term in entry.terms:
+            self._index.setdefault(term, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _most_similar(self, terms: Counter, now: float) -> Tuple[Optional[str], float]:
+        candidates: Set[str] = set()
+        for term in terms:
+            candidates |= self._index.get(term, set())
+        if not candidates:
+            return None, 0.0
+
+        idf = {t: self._idf(t) for t in terms}
+        query = {t: n * idf[t] for t, n in terms.items()}
+        query_norm = math.sqrt(sum(w * w for w in query.values()))
+
+        best_key, best_score = None, 0.0
+        for key in candidates:
+            entry = self._entries[key]
+            if self._expired(entry, now):
+                continue
+            dot = 0.0
+            norm = 0.0
+            for term, n in entry.terms.items():
+                w = n * (idf[term] if term in idf else self._idf(term))
+                norm += w * w
+                if term in query:
+                    dot += w * query[term]
+            if norm and query_norm:
+                score = dot / (math.sqrt(norm) * query_norm)
+                if score > best_score:
+                    best_key, best_score = key, score
+        return best_key, best_score
+
+    # ----- public API -----
+    def get(self, question: str) -> Optional[str]:
+        key = normalize(question)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if self._expired(entry, now):
+                    self._remove(key)
+                    self.expirations += 1
+                else:
+                    self._entries.move_to_end(key)
+                    entry.hits += 1
+                    self.exact_hits += 1
+                    return entry.reply
+
+            terms = content_terms(key)
+            if terms:
+                best_key, score = self._most_similar(terms, now)
+                if best_key is not None and score >= self.threshold:
+                    entry = self._entries[best_key]
+                    self._entries.move_to_end(best_key)
+                    entry.hits += 1
+                    self.similar_hits += 1
+                    return entry.reply
+
+            self.misses += 1
+            return None
+
+    def put(self, question: str, reply: str) -> Optional[str]:
+        """
+        Cache a reply. Returns the normalized key, or None if the question
+        has nothing worth caching on.
+        """
+        key = normalize(question)
+        if not key:
+            return None
+        with self._lock:
+            self._insert(key, question, reply, time.time())
+        return key
+
+    def save_entry(self, key: str) -> None:
+        """Write one cached entry through to SQLite (blocking)."""
+        if not self.persist:
+            return
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            row = (key, entry.question, entry.reply, int(entry.created * 1000))
+        with get_db() as conn:
+            conn.execute(
+                """
+                INSERT OR REPLACE INTO reply_cache (key, question, reply, created_ts)
+                VALUES (?, ?, ?, ?)
+                """,
+                row,
+            )
+
+    def load(self) -> int:
+        """Reload unexpired entries from SQLite, newest last. Returns the count."""
+        if not self.persist:
+            return 0
+        _, now_ms = utc_now()
+        cutoff_ms = now_ms - int(self.ttl * 1000)
+        with get_db() as conn:
+            conn.execute("DELETE FROM reply_cache WHERE created_ts < ?", (cutoff_ms,))
+            rows = conn.execute(
+                """
+                SELECT key, question, reply, created_ts FROM (
+                    SELECT * FROM reply_cache ORDER BY created_ts DESC LIMIT ?
+                ) ORDER BY created_ts ASC
+                """,
+                (self.max_entries,),
+            ).fetchall()
+        with self._lock:
+            for row in rows:
+                self._insert(row["key"], row["question"], row["reply"], row["created_ts"] / 1000)
+        return len(rows)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._index.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.exact_hits + self.similar_hits + self.misses
+            return {
+                "enabled": REPLY_CACHE_ENABLED,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "exact_hits": self.exact_hits,
+                "similar_hits": self.similar_hits,
+                "misses": self.misses,
+                "hit_ratio": round((self.exact_hits + self.similar_hits) / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+reply_cache = ReplyCache()
@@ -0,0 +1,78 @@
+"""
+Lean JSON responses and HTTP compression.
+
+FastJSONResponse renders with orjson (falling back to the stdlib json
+module when it is not installed). Handlers that already hold plain dicts
+built from trusted DB rows return it directly, which skips FastAPI's
+response_model validation and serialization pass. The response_model stays
+on the route for the OpenAPI schema.
+
+add_compression() installs gzip (or Brotli, with the optional brotli-asgi
+package) for responses over HTTP_COMPRESSION_MIN_BYTES. Starlette's gzip
+leaves text/event-stream alone, so chat tokens still arrive as they are
+produced; NDJSON exports are compressed chunk by chunk.
+"""
+import json
+import logging
+import os
+from typing import Any, Mapping, Optional
+
+from fastapi import FastAPI, Response
+
+try:
+    import orjson
+except ImportError:  # optional: pip install orjson
+    orjson = None
+
+logger = logging.getLogger("safelink")
+
+# ---------- Config ----------
+# gzip | brotli | off
+HTTP_COMPRESSION = os.getenv("HTTP_COMPRESSION", "gzip").lower()
+HTTP_COMPRESSION_MIN_BYTES = int(os.getenv("HTTP_COMPRESSION_MIN_BYTES", "1024"))
+# Higher levels cost CPU for little gain on small JSON bodies
+HTTP_GZIP_LEVEL = int(os.getenv("HTTP_GZIP_LEVEL", "6"))
+HTTP_BROTLI_QUALITY = int(os.getenv("HTTP_BROTLI_QUALITY", "4"))
+
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def json_response(content: Any, headers: Optional[Mapping[str, str]] = None) -> FastJSONResponse:
+    """`content` must already be JSON-ready (dicts, lists, str, numbers)."""
+    return FastJSONResponse(content, headers={k: v for k, v in (headers or {}).items() if v})
+
+
+def add_compression(app: FastAPI, mode: str = HTTP_COMPRESSION) -> str:
+    """Install the configured compression middleware; returns what was installed."""
+    if mode == "off":
+        return "off"
+    if mode == "brotli":
+        try:
+            from brotli_asgi import BrotliMiddleware  # type: ignore
+        except ImportError:
+            logger.warning("HTTP_COMPRESSION=brotli needs brotli-asgi; using gzip")
+        else:
+            app.add_middleware(
+                BrotliMiddleware,
+                quality=HTTP_BROTLI_QUALITY,
+                minimum_size=HTTP_COMPRESSION_MIN_BYTES,
+                gzip_fallback=True,
+            )
+            return "brotli"
+    from starlette.middleware.gzip import GZipMiddleware
+
+    app.add_middleware(
+        GZipMiddleware, minimum_size=HTTP_COMPRESSION_MIN_BYTES, compresslevel=HTTP_GZIP_LEVEL
+    )
+    return "gzip"
@@ -0,0 +1,374 @@
+"""
+Triage rules: symptom scoring and the rule-based chat replies.
+
+The thresholds, weights, keyword lists, level cut-offs and canned replies
+live in a versioned JSON rule file (RULES_PATH, rules.json by default).
+compile_rules() turns it into a CompiledRules evaluator:
+
+- every keyword of every group, plus the emergency and topic vocabularies,
+  goes into one KeywordEngine automaton, so a text is scanned once however
+  many rules there are;
+- each scoring keyword gets a column number, in rule-file order, and the
+  columns carry precomputed weight, flag text and minimum level, so scoring
+  is one lookup per match.
+
+The rule book re-reads the file when its mtime changes (checked at most
+every RULES_CHECK_INTERVAL seconds), compiles it on a background thread and
+swaps the result in as one reference, so a request always sees one complete
+version. A file that fails to parse or validate is logged and the previous
+rules stay live. Replace the file atomically (write a temp file, then rename) when editing
+it on a running server.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from keywords import KeywordEngine
+from metrics import record_error, registry, timed
+from trends import RISK_LEVELS
+
+logger = logging.getLogger("safelink")
+
+# ---------- Config ----------
+RULES_PATH = Path(os.getenv("RULES_PATH", str(Path(__file__).parent / "rules.json")))
+# Seconds between mtime checks; 0 disables hot reload
+RULES_CHECK_INTERVAL = float(os.getenv("RULES_CHECK_INTERVAL", "2"))
+
+# Stored checks with no flags carry this instead (and trends skip it)
+NO_FLAGS_MESSAGE = "No specific high/medium risk symptoms detected from description."
+
+RULES_RELOADS = registry.counter(
+    "safelink_rules_reloads_total", "Rule file reloads by result (ok, error).", ["result"]
+)
+
+
+class RuleError(ValueError):
+    """The rule file is malformed; the message says where."""
+
+
+class Band(NamedTuple):
+    low: Optional[float]    # inclusive; None = unbounded
+    high: Optional[float]   # inclusive; None = unbounded
+    score: int
+    flag: str
+
+
+class Column(NamedTuple):
+    term: str
+    weight: int
+    flag: str
+    min_rank: int           # index into RISK_LEVELS the match forces at least
+
+
+class Evaluation(NamedTuple):
+    risk_level: str
+    risk_score: int
+    advice: str
+    flags: List[str]
+
+
+def _require(mapping: dict, key: str, where: str):
+    if not isinstance(mapping, dict) or key not in mapping:
+        raise RuleError(f"{where}: missing {key!r}")
+    return mapping[key]
+
+
+def _number(value, where: str) -> float:
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise RuleError(f"{where}: expected a number, got {value!r}")
+    return value
+
+
+def _text(value, where: str) -> str:
+    if not isinstance(value, str) or not value.strip():
+        raise RuleError(f"{where}: expected non-empty text")
+    return value
+
+
+def _rank(level, where: str) -> int:
+    if level not in RISK_LEVELS:
+        raise RuleError(f"{where}: unknown level {level!r} (expected one of {RISK_LEVELS})")
+    return RISK_LEVELS.index(level)
+
+
+def _bands(items, where: str) -> Tuple[Band, ...]:
+    if not isinstance(items, list):
+        raise RuleError(f"{where}: expected a list")
+    bands = []
+    for i, item in enumerate(items):
+        at = f"{where}[{i}]"
+        low, high = item.get("min"), item.get("max")
+        if low is None and high is None:
+            raise RuleError(f"{at}: needs 'min' and/or 'max'")
+        bands.append(Band(
+            None if low is None else _number(low, f"{at}.min"),
+            None if high is None else _number(high, f"{at}.max"),
+            int(_number(_require(item, "score", at), f"{at}.score")),
+            _text(_require(item, "flag", at), f"{at}.flag"),
+        ))
+    return tuple(bands)
+
+
+def _keywords(items, where: str) -> List[Tuple[str, Sequence[str]]]:
+    """[(canonical term, aliases)] from strings or {"term": ..., "aliases": [...]}."""
+    if not isinstance(items, list) or not items:
+        raise RuleError(f"{where}: expected a non-empty list")
+    out = []
+    for i, item in enumerate(items):
+        if isinstance(item, str):
+            out.append((_text(item, f"{where}[{i}]").lower(), ()))
+        else:
+            term = _text(_require(item, "term", f"{where}[{i}]"), f"{where}[{i}].term").lower()
+            out.append((term, [a.lower() for a in item.get("aliases", [])]))
+    return out
+
+
+def match_band(bands: Sequence[Band], value) -> Optional[Band]:
+    """First band containing `value`; 0 and None mean "not provided"."""
+    if not value:
+        return None
+    for band in bands:
+        if (band.low is None or value >= band.low) and (band.high is None or value <= band.high):
+            return band
+    return None
+
+
+class CompiledRules:
+    """One validated rule-file version, ready to evaluate."""
+
+    def __init__(self, doc: dict, source: str = "<memory>"):
+        self.source = source
+        self.version = _require(doc, "version", "rules")
+        symptoms = _require(doc, "symptoms", "rules")
+        chat = _require(doc, "chat", "rules")
+        engine = KeywordEngine()
+
+        self.temperature_bands = _bands(
+            _require(symptoms, "temperature_bands", "symptoms"), "symptoms.temperature_bands"
+        )
+        self.age_bands = _bands(_require(symptoms, "age_bands", "symptoms"), "symptoms.age_bands")
+        self.max_score = int(_number(symptoms.get("max_score", 100), "symptoms.max_score"))
+
+        # Scoring keywords: category "risk:<group>", one column per canonical term
+        self.columns: List[Column] = []
+        self._column: Dict[Tuple[str, str], int] = {}
+        groups = _require(symptoms, "keyword_groups", "symptoms")
+        for g, group in enumerate(groups):
+            at = f"symptoms.keyword_groups[{g}]"
+            category = f"risk:{_text(_require(group, 'name', at), f'{at}.name')}"
+            weight = int(_number(_require(group, "weight", at), f"{at}.weight"))
+            prefix = _text(_require(group, "flag", at), f"{at}.flag")
+            min_rank = _rank(group["min_level"], f"{at}.min_level") if "min_level" in group else 0
+            for term, aliases in _keywords(_require(group, "keywords", at), f"{at}.keywords"):
+                if (category, term) in self._column:
+                    continue
+                self._column[(category, term)] = len(self.columns)
+                self.columns.append(Column(term, weight, f"{prefix}: {term}", min_rank))
+                engine.add(term, category)
+                for alias in aliases:
+                    engine.add(alias, category, canonical=term)
+
+        levels = _require(symptoms, "levels", "symptoms")
+        # (min_score, rank), highest threshold first
+        self.cutoffs = sorted(
+            (
+                (_number(_require(item, "min_score", f"symptoms.levels[{i}]"), f"symptoms.levels[{i}]"),
+                 _rank(_require(item, "level", f"symptoms.levels[{i}]"), f"symptoms.levels[{i}]"))
+                for i, item in enumerate(levels)
+            ),
+            reverse=True,
+        )
+        advice = _require(symptoms, "advice", "symptoms")
+        self.advice = {
+            level: _text(_require(advice, level, "symptoms.advice"), f"symptoms.advice.{level}")
+            for level in RISK_LEVELS
+        }
+
+        emergency = _require(chat, "emergency", "chat")
+        for term, aliases in _keywords(_require(emergency, "keywords", "chat.emergency"), "chat.emergency.keywords"):
+            engine.add(term, "emergency")
+            for alias in aliases:
+                engine.add(alias, "emergency", canonical=term)
+        self.emergency_reply = _text(_require(emergency, "reply", "chat.emergency"), "chat.emergency.reply")
+
+        # (category, reply), checked in order
+        self.topics: List[Tuple[str, str]] = []
+        for t, topic in enumerate(_require(chat, "topics", "chat")):
+            at = f"chat.topics[{t}]"
+            category = f"topic:{_text(_require(topic, 'name', at), f'{at}.name')}"
+            for term, aliases in _keywords(_require(topic, "keywords", at), f"{at}.keywords"):
+                engine.add(term, category)
+                for alias in aliases:
+                    engine.add(alias, category, canonical=term)
+            self.topics.append((category, _text(_require(topic, "reply", at), f"{at}.reply")))
+        self.default_reply = _text(_require(chat, "default_reply", "chat"), "chat.default_reply")
+
+        self.engine = engine.build()
+
+    # ---------- Symptom scoring ----------
+    def hit_columns(self, text: str) -> List[int]:
+        """Scoring columns matched (not negated) in `text`, in rule-file order."""
+        column = self._column
+        return sorted({
+            column[key]
+            for key in ((m.category, m.term) for m in self.engine.scan(text) if not m.negated)
+            if key in column
+        })
+
+    def level_for(self, score: int, min_rank: int = 0) -> str:
+        rank = 0
+        for cutoff, level_rank in self.cutoffs:
+            if score >= cutoff:
+                rank = level_rank
+                break
+        return RISK_LEVELS[max(rank, min_rank)]
+
+    def evaluate(self, age: Optional[int], temperature: Optional[float], text: str) -> Evaluation:
+        flags: List[str] = []
+        score = 0
+        for band in (match_band(self.temperature_bands, temperature), match_band(self.age_bands, age)):
+            if band is not None:
+                flags.append(band.flag)
+                score += band.score
+
+        min_rank = 0
+        for col in self.hit_columns(text):
+            column = self.columns[col]
+            flags.append(column.flag)
+            score += column.weight
+            min_rank = max(min_rank, column.min_rank)
+
+        score = max(0, min(self.max_score, score))
+        level = self.level_for(score, min_rank)
+        if not flags:
+            flags.append(NO_FLAGS_MESSAGE)
+        return Evaluation(level, score, self.advice[level], flags)
+
+    # ---------- Chat ----------
+    def is_emergency(self, text: str) -> bool:
+        return self.engine.has(self.engine.scan(text), "emergency")
+
+    def fallback_reply(self, text: str) -> str:
+        matches = self.engine.scan(text)
+        for category, reply in self.topics:
+            if self.engine.has(matches, category):
+                return reply
+        return self.default_reply
+
+    def stats(self) -> dict:
+        return {
+            "version": self.version,
+            "source": self.source,
+            "scoring_keywords": len(self.columns),
+            "temperature_bands": len(self.temperature_bands),
+            "age_bands": len(self.age_bands),
+            "topics": len(self.topics),
+        }
+
+
+def compile_rules(doc: dict, source: str = "<memory>") -> CompiledRules:
+    try:
+        return CompiledRules(doc, source)
+    except RuleError:
+        raise
+    except (AttributeError, TypeError, ValueError) as e:
+        raise RuleError(f"{source}: {e}") from e
+
+
+@timed("rules_load")
+def load_rules(path: Path) -> CompiledRules:
+    try:
+        doc = json.loads(Path(path).read_text(encoding="utf-8"))
+    except (OSError, ValueError) as e:
+        raise RuleError(f"{path}: {e}") from e
+    return compile_rules(doc, str(path))
+
+
+class RuleBook:
+    """The live CompiledRules for a rule file, reloaded when the file changes."""
+
+    def __init__(self, path: Path = RULES_PATH, check_interval: float = RULES_CHECK_INTERVAL):
+        self.path = Path(path)
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._signature = self._stat()
+        self._rules = load_rules(self.path)
+        self._checked = time.monotonic()
+        self.loaded_at = time.time()
+        self.reloads = 0
+        self.errors = 0
+        self.last_error: Optional[str] = None
+
+    def _stat(self) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def current(self) -> CompiledRules:
+        if self.check_interval > 0 and time.monotonic() - self._checked >= self.check_interval:
+            self._maybe_reload()
+        return self._rules
+
+    def _maybe_reload(self) -> None:
+        # One caller checks; everyone keeps using the current rules meanwhile
+        if not self._lock.acquire(blocking=False):
+            return
+        self._checked = time.monotonic()
+        signature = self._stat()
+        if signature is None or signature == self._signature:
+            self._lock.release()
+            return
+        self._signature = signature
+        # Compiling a large rule book takes a while; keep it off the caller
+        # (often the event loop). The thread releases the lock when done.
+        threading.Thread(target=self._reload_and_release, name="rules-reload", daemon=True).start()
+
+    def _reload_and_release(self) -> None:
+        try:
+            self._reload()
+        finally:
+            self._lock.release()
+
+    def _reload(self) -> None:
+        try:
+            rules = load_rules(self.path)
+        except RuleError as e:
+            self.errors += 1
+            self.last_error = str(e)
+            RULES_RELOADS.labels("error").inc()
+            record_error("rules", f"Keeping rules version {self._rules.version}", e)
+            return
+        self._rules = rules
+        self.loaded_at = time.time()
+        self.reloads += 1
+        self.last_error = None
+        RULES_RELOADS.labels("ok").inc()
+        logger.info("Rules reloaded: version %s from %s", rules.version, self.path)
+
+    def reload(self) -> CompiledRules:
+        """Re-read the file now, regardless of its mtime."""
+        with self._lock:
+            self._signature = self._stat()
+            self._reload()
+            self._checked = time.monotonic()
+        return self._rules
+
+    def stats(self) -> dict:
+        stats = self._rules.stats()
+        stats.update({
+            "check_interval_seconds": self.check_interval,
+            "loaded_at": self.loaded_at,
+            "reloads": self.reloads,
+            "errors": self.errors,
+            "last_error": self.last_error,
+        })
+        return stats
+
+
+rule_book = RuleBook()
@@ -0,0 +1,331 @@
+import asyncio
+import bisect
+import os
+import threading
+import time
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from metrics import LLM_SECONDS, record_error
+
+# ---------- Config ----------
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "true").lower() == "true"
+# Fixed hedge delay in ms; unset means "use the primary's observed p95".
+LLM_HEDGE_DELAY_MS = os.getenv("LLM_HEDGE_DELAY_MS")
+LLM_HEDGE_DEFAULT_MS = float(os.getenv("LLM_HEDGE_DEFAULT_MS", "4000"))
+LLM_HEDGE_MIN_MS = float(os.getenv("LLM_HEDGE_MIN_MS", "250"))
+LLM_HEDGE_MAX_MS = float(os.getenv("LLM_HEDGE_MAX_MS", "15000"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("LLM_BREAKER_FAILURES", "3"))
+BREAKER_RESET_SECONDS = float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))
+
+# Chat-format prompt: [{"role": "system" | "user" | "assistant", "content": ...}]
+Messages = List[Dict[str, str]]
+
+LATENCY_BUCKETS_MS = [25, 50, 100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000, 64000]
+
+
+class LatencyHistogram:
+    """
+    Fixed-bucket latency histogram. Quantiles are estimated as the upper
+    bound of the bucket containing the requested rank, which is plenty for
+    picking a hedge delay.
+    """
+
+    def __init__(self, buckets_ms: List[float] = LATENCY_BUCKETS_MS):
+        self.buckets_ms = list(buckets_ms)
+        self.counts = [0] * (len(self.buckets_ms) + 1)  # last slot is +Inf
+        self.count = 0
+        self.sum_ms = 0.0
+
+    def observe(self, seconds: float) -> None:
+        ms = seconds * 1000
+        self.counts[bisect.bisect_left(self.buckets_ms, ms)] += 1
+        self.count += 1
+        self.sum_ms += ms
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return self.buckets_ms[i] if i < len(self.buckets_ms) else self.buckets_ms[-1]
+        return self.buckets_ms[-1]
+
+    def snapshot(self) -> dict:
+        return {
+            "count": self.count,
+            "avg_ms": round(self.sum_ms / self.count, 1) if self.count else None,
+            "p50_ms": self.quantile(0.50),
+            "p95_ms": self.quantile(0.95),
+            "p99_ms": self.quantile(0.99),
+            "buckets_ms": dict(zip([str(b) for b in self.buckets_ms] + ["+Inf"], self.counts)),
+        }
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure breaker. After `failure_threshold` failures in a row
+    the provider is skipped for `reset_seconds`; then a single probe request
+    is let through (half-open) and its outcome closes or re-opens the circuit.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+        reset_seconds: float = BREAKER_RESET_SECONDS,
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.reset_seconds:
+                    return False
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._probe_in_flight = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.times_opened += 1
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def release_probe(self) -> None:
+        # A cancelled half-open probe proves nothing either way.
+        with self._lock:
+            self._probe_in_flight = False
+
+
+class StreamInterrupted(Exception):
+    """A provider failed after part of its reply had already been streamed."""
+
+    def __init__(self, provider: str):
+        super().__init__(f"{provider} stream ended early")
+        self.provider = provider
+
+
+class Provider:
+    def __init__(
+        self,
+        name: str,
+        call: Callable[[Messages], Awaitable[str]],
+        stream: Optional[Callable[[Messages], AsyncIterator[str]]] = None,
+        enabled: Callable[[], bool] = lambda: True,
+    ):
+        self.name = name
+        self.call = call
+        self.stream = stream
+        self.enabled = enabled
+        self.breaker = CircuitBreaker()
+        self.latency = LatencyHistogram()
+        self.first_token = LatencyHistogram()
+        self.successes = 0
+        self.failures = 0
+        self.wins = 0
+        self.hedged_launches = 0
+        self.skipped_open = 0
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled(),
+            "breaker": self.breaker.state,
+            "breaker_times_opened": self.breaker.times_opened,
+            "successes": self.successes,
+            "failures": self.failures,
+            "wins": self.wins,
+            "hedged_launches": self.hedged_launches,
+            "skipped_open": self.skipped_open,
+            "latency": self.latency.snapshot(),
+            "first_token": self.first_token.snapshot(),
+        }
+
+
+class ProviderScheduler:
+    """
+    Dispatches a prompt to an ordered list of providers.
+
+    The first healthy provider is called right away. If it has not answered
+    within its hedge delay (its observed p95 unless LLM_HEDGE_DELAY_MS is
+    set), the next healthy provider is started in parallel, and so on; the
+    first non-empty reply wins and the rest are cancelled. A provider that
+    fails outright hands over to the next one immediately.
+    """
+
+    def __init__(self, providers: List[Provider], hedge: bool = LLM_HEDGE_ENABLED):
+        self.providers = providers
+        self.hedge = hedge
+        self.requests = 0
+        self.hedges = 0
+        self.exhausted = 0
+
+    def hedge_delay(self, provider: Provider) -> float:
+        if LLM_HEDGE_DELAY_MS:
+            ms = float(LLM_HEDGE_DELAY_MS)
+        elif provider.latency.count >= LLM_HEDGE_MIN_SAMPLES:
+            ms = provider.latency.quantile(0.95) or LLM_HEDGE_DEFAULT_MS
+        else:
+            ms = LLM_HEDGE_DEFAULT_MS
+        return max(LLM_HEDGE_MIN_MS, min(LLM_HEDGE_MAX_MS, ms)) / 1000
+
+    def _next_available(self, start: int) -> Tuple[Optional[Provider], int]:
+        for i in range(start, len(self.providers)):
+            provider = self.providers[i]
+            if not provider.enabled():
+                continue
+            if not provider.breaker.allow():
+                provider.skipped_open += 1
+                continue
+            return provider, i + 1
+        return None, len(self.providers)
+
+    async def _attempt(self, provider: Provider, messages: Messages) -> str:
+        start = time.perf_counter()
+        try:
+            reply = await provider.call(messages)
+        except asyncio.CancelledError:
+            provider.breaker.release_probe()
+            raise
+        except Exception as e:
+            provider.failures += 1
+            provider.breaker.record_failure()
+            LLM_SECONDS.labels(provider.name.lower(), "error").observe(time.perf_counter() - start)
+            record_error(f"llm_{provider.name.lower()}", f"{provider.name} error", e)
+            raise
+        provider.latency.observe(time.perf_counter() - start)
+        LLM_SECONDS.labels(provider.name.lower(), "ok").observe(time.perf_counter() - start)
+        provider.successes += 1
+        provider.breaker.record_success()
+        return reply
+
+    async def run(self, messages: Messages) -> Optional[Tuple[str, str]]:
+        """
+        Returns (provider name, reply), or None if every provider failed or
+        was skipped.
+        """
+        self.requests += 1
+        tasks = {}
+        next_index = 0
+        last_launched: Optional[Provider] = None
+
+        def launch(hedged: bool) -> bool:
+            nonlocal next_index, last_launched
+            provider, next_index = self._next_available(next_index)
+            if provider is None:
+                return False
+            if hedged:
+                provider.hedged_launches += 1
+                self.hedges += 1
+            task = asyncio.ensure_future(self._attempt(provider, messages))
+            tasks[task] = provider
+            last_launched = provider
+            return True
+
+        launch(hedged=False)
+        try:
+            while tasks:
+                can_hedge = self.hedge and next_index < len(self.providers)
+                timeout = self.hedge_delay(last_launched) if can_hedge else None
+                done, _ = await asyncio.wait(
+                    tasks.keys(), timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    launch(hedged=True)
+                    continue
+                for task in done:
+                    provider = tasks.pop(task)
+                    if task.exception() is None:
+                        provider.wins += 1
+                        return provider.name, task.result()
+                if not tasks:
+                    launch(hedged=False)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        self.exhausted += 1
+        return None
+
+    async def stream(self, messages: Messages) -> AsyncIterator[str]:
+        """
+        Streams from the first healthy provider, failing over to the next one
+        if it errors before producing a token. Yields nothing if all fail.
+        Raises StreamInterrupted when the provider fails after its first
+        token: what was yielded is only part of a reply.
+        """
+        self.requests += 1
+        index = 0
+        while True:
+            provider, index = self._next_available(index)
+            if provider is None:
+                self.exhausted += 1
+                return
+            if provider.stream is None:
+                provider.breaker.release_probe()
+                continue
+
+            started = False
+            start = time.perf_counter()
+            try:
+                async for token in provider.stream(messages):
+                    if not started:
+                        started = True
+                        provider.first_token.observe(time.perf_counter() - start)
+                    yield token
+            except (asyncio.CancelledError, GeneratorExit):
+                provider.breaker.release_probe()
+                raise
+            except Exception as e:
+                provider.failures += 1
+                provider.breaker.record_failure()
+                LLM_SECONDS.labels(provider.name.lower(), "error").observe(time.perf_counter() - start)
+                record_error(f"llm_{provider.name.lower()}", f"{provider.name} stream error", e)
+                if started:
+                    raise StreamInterrupted(provider.name) from e
+                continue
+
+            if started:
+                LLM_SECONDS.labels(provider.name.lower(), "ok").observe(time.perf_counter() - start)
+                provider.successes += 1
+                provider.wins += 1
+                provider.breaker.record_success()
+                return
+            provider.failures += 1
+            provider.breaker.record_failure()
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "hedges": self.hedges,
+            "exhausted": self.exhausted,
+            "providers": {p.name: p.stats() for p in self.providers},
+        }
@@ -0,0 +1,203 @@
+"""
+Full-text search over a user's chat and symptom history.
+
+`chat_messages_fts` and `symptom_checks_fts` are external-content FTS5
+tables (migrations 6 and 10): they index `content` / `symptoms_text` plus an
+`owner` token ("u<user_id>") without storing a second copy, and triggers
+keep them in step with the base tables. The owner token is part of every
+MATCH, so FTS5 only walks the caller's postings.
+
+bm25 scores come from each table's own statistics and cannot be compared
+across tables, so each source is ranked on its own, its scores are divided
+by its best hit (0..1], and the two lists are interleaved rank by rank.
+Pages use an opaque offset cursor.
+
+On SQLite builds without FTS5 the migration skips the tables and search
+falls back to a LIKE scan over the caller's own rows (newest first).
+"""
+import base64
+import os
+import re
+import sqlite3
+from typing import List, Optional, Tuple
+
+from metrics import timed
+
+# ---------- Config ----------
+SEARCH_DEFAULT_LIMIT = int(os.getenv("SEARCH_DEFAULT_LIMIT", "20"))
+SEARCH_MAX_LIMIT = int(os.getenv("SEARCH_MAX_LIMIT", "100"))
+# Ranked results are paged by offset; stop before it gets expensive
+SEARCH_MAX_OFFSET = int(os.getenv("SEARCH_MAX_OFFSET", "1000"))
+SEARCH_MAX_TERMS = 8
+SNIPPET_TOKENS = 12
+HIGHLIGHT_START = "<mark>"
+HIGHLIGHT_END = "</mark>"
+
+SOURCES = ("chat", "symptom")
+
+_TERM_RE = re.compile(r"\w+", re.UNICODE)
+
+# `raw` is the flipped bm25() (higher is better), weighted on the text
+# column only; each source keeps just the rows a page could reach.
+_FTS_SELECT = {
+    "chat": """
+        SELECT * FROM (
+            SELECT 'chat' AS kind, m.id, m.created_at, m.created_ts,
+                   m.role AS role, NULL AS risk_level,
+                   snippet(chat_messages_fts, 0, :hl_start, :hl_end, '…', :tokens) AS snippet,
+                   -bm25(chat_messages_fts, 1.0, 0.0) AS raw
+            FROM chat_messages_fts
+            JOIN chat_messages m ON m.id = chat_messages_fts.rowid
+            WHERE chat_messages_fts MATCH :chat_query
+            ORDER BY raw DESC, m.created_ts DESC, m.id DESC
+            LIMIT :per_source
+        )
+    """,
+    "symptom": """
+        SELECT * FROM (
+            SELECT 'symptom' AS kind, s.id, s.created_at, s.created_ts,
+                   NULL AS role, s.risk_level AS risk_level,
+                   snippet(symptom_checks_fts, 0, :hl_start, :hl_end, '…', :tokens) AS snippet,
+                   -bm25(symptom_checks_fts, 1.0, 0.0) AS raw
+            FROM symptom_checks_fts
+            JOIN symptom_checks s ON s.id = symptom_checks_fts.rowid
+            WHERE symptom_checks_fts MATCH :symptom_query
+            ORDER BY raw DESC, s.created_ts DESC, s.id DESC
+            LIMIT :per_source
+        )
+    """,
+}
+
+# Text column each FTS table indexes, for the MATCH column filter
+_FTS_COLUMN = {"chat": "content", "symptom": "symptoms_text"}
+
+# Interleave per-source rankings: every source's best hit, then every
+# source's second, ...; within a rank the better normalized score goes first.
+# Shared with storage_postgres (window functions read the same on both).
+INTERLEAVE_SQL = """
+    SELECT *, CASE WHEN top > 0 THEN raw / top ELSE 0.0 END AS score
+    FROM (
+        SELECT *,
+               ROW_NUMBER() OVER (PARTITION BY kind ORDER BY raw DESC, created_ts DESC, id DESC) AS pos,
+               MAX(raw) OVER (PARTITION BY kind) AS top
+        FROM ({hits}) hits
+    ) ranked
+    ORDER BY pos, score DESC, created_ts DESC, id DESC
+"""
+
+_LIKE_SELECT = {
+    "chat": """
+        SELECT 'chat' AS kind, id, created_at, created_ts, role, NULL AS risk_level,
+               content AS snippet, 0.0 AS score
+        FROM chat_messages WHERE user_id = :user_id AND content LIKE :pattern ESCAPE '\\'
+    """,
+    "symptom": """
+        SELECT 'symptom' AS kind, id, created_at, created_ts, NULL AS role, risk_level,
+               symptoms_text AS snippet, 0.0 AS score
+        FROM symptom_checks WHERE user_id = :user_id AND symptoms_text LIKE :pattern ESCAPE '\\'
+    """,
+}
+
+
+class InvalidQuery(ValueError):
+    pass
+
+
+def query_terms(text: str) -> List[str]:
+    terms = _TERM_RE.findall(text.lower())[:SEARCH_MAX_TERMS]
+    if not terms:
+        raise InvalidQuery("Search query needs at least one word.")
+    return terms
+
+
+def fts_query(terms: List[str], column: Optional[str] = None, user_id: Optional[int] = None) -> str:
+    """
+    All terms must match; the last one also as a prefix so partially typed
+    words ("headac") still hit. Terms are quoted, so FTS5 operators in the
+    user's text are searched as plain words. With `column` and `user_id`
+    the terms are held to the text column and ANDed with the owner token.
+    """
+    quoted = [f'"{t}"' for t in terms]
+    quoted[-1] += "*"
+    query = " ".join(quoted)
+    if column is None:
+        return query
+    return f'owner : "u{user_id}" AND {column} : ({query})'
+
+
+def encode_offset(offset: int) -> str:
+    return base64.urlsafe_b64encode(f"o:{offset}".encode("ascii")).decode("ascii").rstrip("=")
+
+
+def decode_offset(cursor: Optional[str]) -> int:
+    if not cursor:
+        return 0
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        tag, offset = base64.urlsafe_b64decode(padded).decode("ascii").split(":")
+        if tag != "o" or int(offset) < 0:
+            raise ValueError(cursor)
+        return int(offset)
+    except Exception:
+        raise InvalidQuery("Invalid cursor.")
+
+
+def fts_available(conn: sqlite3.Connection) -> bool:
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'chat_messages_fts'"
+    ).fetchone() is not None
+
+
+@timed("db_search_history")
+def search_history(
+    conn: sqlite3.Connection,
+    user_id: int,
+    text: str,
+    sources=SOURCES,
+    limit: int = SEARCH_DEFAULT_LIMIT,
+    cursor: Optional[str] = None,
+) -> Tuple[List[dict], Optional[str]]:
+    """Best matches first (see module docstring); returns (hits, next cursor or None)."""
+    terms = query_terms(text)
+    offset = decode_offset(cursor)
+    if offset >= SEARCH_MAX_OFFSET:
+        return [], None
+
+    if fts_available(conn):
+        hits = " UNION ALL ".join(_FTS_SELECT[s] for s in sources)
+        sql = INTERLEAVE_SQL.format(hits=hits) + " LIMIT :limit OFFSET :offset"
+        params = {
+            f"{s}_query": fts_query(terms, _FTS_COLUMN[s], user_id) for s in sources
+        }
+        params.update(
+            hl_start=HIGHLIGHT_START,
+            hl_end=HIGHLIGHT_END,
+            tokens=SNIPPET_TOKENS,
+            per_source=offset + limit + 1,
+        )
+    else:
+        selects = [_LIKE_SELECT[s] for s in sources]
+        sql = " UNION ALL ".join(selects) + " ORDER BY created_ts DESC, id DESC LIMIT :limit OFFSET :offset"
+        escaped = " ".join(terms).replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        params = {"pattern": f"%{escaped}%", "user_id": user_id}
+    params.update(limit=limit + 1, offset=offset)
+    return build_page(conn.execute(sql, params).fetchall(), offset, limit)
+
+
+def build_page(rows, offset: int, limit: int) -> Tuple[List[dict], Optional[str]]:
+    """Hits plus the next cursor from `limit + 1` ranked rows (any backend)."""
+    hits = [
+        {
+            "kind": row["kind"],
+            "id": row["id"],
+            "created_at": row["created_at"],
+            "role": row["role"],
+            "risk_level": row["risk_level"],
+            "snippet": row["snippet"],
+            "score": round(row["score"], 4) or 0.0,
+        }
+        for row in rows[:limit]
+    ]
+    next_offset = offset + limit
+    more = len(rows) > limit and next_offset < SEARCH_MAX_OFFSET
+    return hits, encode_offset(next_offset) if more else None
@@ -0,0 +1,55 @@
+"""
+Production launcher:
+
+    python serve.py
+
+Runs uvicorn on "main:app" with settings from the environment. The app is
+imported by the workers only, so this process stays light:
+
+    HOST                  bind address (default 127.0.0.1; 0.0.0.0 on a server)
+    PORT                  default 8000
+    WEB_CONCURRENCY       worker processes (default 1)
+    UVICORN_RELOAD        "true" to auto-reload on code changes (development;
+                          forces a single worker)
+    UVICORN_KEEP_ALIVE    idle keep-alive seconds (default 5)
+    FORWARDED_ALLOW_IPS   proxies trusted for X-Forwarded-* (default 127.0.0.1)
+    UVICORN_ACCESS_LOG    "false" to drop per-request log lines
+    LOG_LEVEL             default info
+
+With several workers, set SESSION_SECRET so tokens verify in every worker;
+each worker keeps its own in-memory caches and rate limiters. Chat contexts
+are per worker too, and are re-seeded from storage when another worker has
+stored newer turns (CHAT_CONTEXT_VERIFY, see conversations.py).
+"""
+import os
+
+import uvicorn
+
+HOST = os.getenv("HOST", "127.0.0.1")
+PORT = int(os.getenv("PORT", "8000"))
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+UVICORN_RELOAD = os.getenv("UVICORN_RELOAD", "false").lower() == "true"
+UVICORN_KEEP_ALIVE = int(os.getenv("UVICORN_KEEP_ALIVE", "5"))
+FORWARDED_ALLOW_IPS = os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1")
+UVICORN_ACCESS_LOG = os.getenv("UVICORN_ACCESS_LOG", "true").lower() == "true"
+LOG_LEVEL = os.getenv("LOG_LEVEL", "info").lower()
+
+
+def main() -> None:
+    uvicorn.run(
+        "main:app",
+        app_dir=os.path.dirname(os.path.abspath(__file__)),
+        host=HOST,
+        port=PORT,
+        workers=1 if UVICORN_RELOAD else max(1, WEB_CONCURRENCY),
+        reload=UVICORN_RELOAD,
+        timeout_keep_alive=UVICORN_KEEP_ALIVE,
+        proxy_headers=True,
+        forwarded_allow_ips=FORWARDED_ALLOW_IPS,
+        log_level=LOG_LEVEL,
+        access_log=UVICORN_ACCESS_LOG,
+    )
+
+
+if __name__ == "__main__":
+    main()
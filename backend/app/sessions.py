@@ -0,0 +1,141 @@
+import base64
+import hashlib
+import hmac
+import logging
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple, Optional, Tuple
+
+logger = logging.getLogger("safelink")
+
+# ---------- Config ----------
+# Must be set (and shared) when running several workers or to keep sessions
+# across restarts; otherwise a random per-process key is used.
+SESSION_SECRET = os.getenv("SESSION_SECRET")
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", str(7 * 24 * 3600)))
+SESSION_REVOKED_MAX = int(os.getenv("SESSION_REVOKED_MAX", "100000"))
+# Trust a bare X-User-Id header as the caller's identity. Anyone can send
+# one, so this is an explicit opt-in for third-party clients not yet sending
+# `Authorization: Bearer <token>` (the bundled frontend sends the token).
+SESSION_ALLOW_USER_ID_HEADER = os.getenv("SESSION_ALLOW_USER_ID_HEADER", "false").lower() == "true"
+
+TOKEN_VERSION = "v1"
+
+
+class Session(NamedTuple):
+    user_id: int
+    session_id: str
+    expires_at: int  # epoch seconds
+
+
+def _b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+class SessionManager:
+    """
+    Stateless signed session tokens.
+
+    A token is `v1.<payload>.<signature>` where the payload carries the user
+    id, a random session id and the expiry, and the signature is an
+    HMAC-SHA256 over it. Validation is a single HMAC in memory, with no
+    lookup in `users`. Logout adds the session id to a revocation list,
+    which is an LRU whose entries are dropped once the token would have
+    expired anyway. The list is per process, so a multi-worker deployment
+    needs sticky sessions or short TTLs for logout to take effect everywhere.
+    """
+
+    def __init__(
+        self,
+        secret: Optional[str] = SESSION_SECRET,
+        ttl: int = SESSION_TTL_SECONDS,
+        revoked_max: int = SESSION_REVOKED_MAX,
+    ):
+        if not secret:
+            logger.warning("SESSION_SECRET is not set; sessions will not survive a restart")
+            secret = secrets.token_hex(32)
+        self._key = secret.encode("utf-8")
+        self.ttl = ttl
+        self.revoked_max = revoked_max
+        # session id -> expires_at
+        self._revoked: "OrderedDict[str, int]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.issued = 0
+        self.verified = 0
+        self.rejected = 0
+        self.revocations = 0
+
+    def _sign(self, payload: str) -> str:
+        return _b64encode(hmac.new(self._key, payload.encode("ascii"), hashlib.sha256).digest())
+
+    def issue(self, user_id: int) -> Tuple[str, int]:
+        """New token for `user_id`. Returns (token, expires_at epoch seconds)."""
+        expires_at = int(time.time()) + self.ttl
+        payload = _b64encode(f"{user_id}:{secrets.token_urlsafe(12)}:{expires_at}".encode("ascii"))
+        signed = f"{TOKEN_VERSION}.{payload}"
+        self.issued += 1
+        return f"{signed}.{self._sign(signed)}", expires_at
+
+    def _decode(self, token: str) -> Optional[Session]:
+        try:
+            version, payload, signature = token.split(".")
+        except ValueError:
+            return None
+        if version != TOKEN_VERSION:
+            return None
+        if not hmac.compare_digest(signature, self._sign(f"{version}.{payload}")):
+            return None
+        try:
+            user_id, session_id, expires_at = _b64decode(payload).decode("ascii").split(":")
+            return Session(int(user_id), session_id, int(expires_at))
+        except ValueError:
+            return None
+
+    def verify(self, token: str) -> Optional[Session]:
+        """The token's session if it is authentic, unexpired and not revoked."""
+        session = self._decode(token)
+        if session is None or session.expires_at <= time.time():
+            self.rejected += 1
+            return None
+        with self._lock:
+            if session.session_id in self._revoked:
+                self.rejected += 1
+                return None
+        self.verified += 1
+        return session
+
+    def revoke(self, session: Session) -> None:
+        now = time.time()
+        with self._lock:
+            self._revoked[session.session_id] = session.expires_at
+            self._revoked.move_to_end(session.session_id)
+            self.revocations += 1
+            # Oldest entries first: drop ones past their expiry, then cap size
+            while self._revoked:
+                sid, expires_at = next(iter(self._revoked.items()))
+                if expires_at > now and len(self._revoked) <= self.revoked_max:
+                    break
+                self._revoked.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "ttl_seconds": self.ttl,
+                "allow_user_id_header": SESSION_ALLOW_USER_ID_HEADER,
+                "issued": self.issued,
+                "verified": self.verified,
+                "rejected": self.rejected,
+                "revocations": self.revocations,
+                "revoked_tracked": len(self._revoked),
+            }
+
+
+session_manager = SessionManager()
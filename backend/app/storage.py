@@ -0,0 +1,335 @@
+"""
+Storage backends for user data: accounts, symptom checks, chat history and
+the trend rollups.
+
+STORAGE_BACKEND picks one at startup:
+
+    sqlite    (default) the local file from db.py; queries run on the
+              threadpool through the shared connection pool
+    postgres  asyncpg pools on DATABASE_URL, with history, trend and search
+              reads sent to DATABASE_REPLICA_URL when set (storage_postgres.py)
+
+Both expose the async `Storage` interface below, so API replicas behind a
+load balancer can share one PostgreSQL database while a single node keeps
+the zero-setup SQLite file. Node-local caches (reply cache, hospital index)
+stay in local SQLite either way.
+"""
+import os
+import sqlite3
+from typing import AsyncIterator, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+from starlette.concurrency import iterate_in_threadpool
+
+import search
+import trends
+from db import db_pool, get_db, utc_now
+from migrations import ensure_schema
+
+# ---------- Config ----------
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "sqlite").lower()
+DATABASE_URL = os.getenv("DATABASE_URL", "")
+# Optional streaming replica for history / trends / search reads
+DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL", "")
+DATABASE_POOL_MIN = int(os.getenv("DATABASE_POOL_MIN", "2"))
+DATABASE_POOL_MAX = int(os.getenv("DATABASE_POOL_MAX", "20"))
+# Rows per keyset page when streaming a history export; each page holds a
+# pooled connection only while it is read
+HISTORY_STREAM_PAGE = int(os.getenv("HISTORY_STREAM_PAGE", "500"))
+
+# Columns each history endpoint returns (plus created_ts for the cursor)
+HISTORY_COLUMNS = {
+    "symptom_checks": (
+        "id", "created_at", "age", "temperature", "symptoms_text",
+        "risk_level", "risk_score", "advice",
+    ),
+    "chat_messages": ("id", "created_at", "role", "content"),
+}
+
+# symptom_checks keeps advice as a code into advice_texts (the same few
+# canned paragraphs would otherwise repeat on every row); legacy rows that
+# still carry the text win. Valid SQL for both backends.
+COLUMN_SQL = {
+    "advice": "COALESCE(advice, (SELECT text FROM advice_texts WHERE id = advice_code)) AS advice",
+}
+
+
+def select_list(columns: Iterable[str]) -> str:
+    return ", ".join(COLUMN_SQL.get(column, column) for column in columns)
+
+# Newest-first keyset position: (created_ts, id) of the last row seen
+After = Optional[Tuple[int, int]]
+
+
+class Storage:
+    """
+    Async persistence interface used by the API. Rows come back as
+    mapping-style records (`row["column"]`); history rows always include
+    `created_ts` and `id` for the cursor.
+    """
+
+    name = "base"
+
+    async def start(self) -> None:
+        """Open pools and bring the schema up to date."""
+
+    async def close(self) -> None:
+        """Release pools."""
+
+    async def write_batch(self, batch: Dict[str, List[tuple]]) -> None:
+        """
+        Commit {"symptom_checks": rows, "chat_messages": rows} in one
+        transaction, rows as built by main.symptom_check_rows /
+        main.chat_pair_rows. The write-behind queue's sink.
+        """
+        raise NotImplementedError
+
+    async def history_page(self, table: str, user_id: int, limit: int, after: After = None) -> list:
+        """Up to `limit` of the user's rows in `table`, newest first, after `after`."""
+        raise NotImplementedError
+
+    def iter_history(
+        self, table: str, user_id: int, limit: Optional[int] = None, after: After = None
+    ) -> AsyncIterator:
+        """Like history_page but streamed, for NDJSON exports of any length."""
+        raise NotImplementedError
+
+    async def recent_chat_messages(self, user_id: int, limit: int) -> list:
+        """The user's last `limit` chat rows (role, content, created_ts), newest first."""
+        raise NotImplementedError
+
+    async def latest_chat_ts(self, user_id: int) -> Optional[int]:
+        """created_ts of the user's newest stored chat row, or None."""
+        raise NotImplementedError
+
+    async def get_user_by_email(self, email: str):
+        """(id, password_hash) record, or None."""
+        raise NotImplementedError
+
+    async def create_user(self, email: str, password_hash: str) -> Optional[int]:
+        """New user's id, or None if the email is already registered."""
+        raise NotImplementedError
+
+    async def update_password_hash(self, user_id: int, password_hash: str) -> None:
+        raise NotImplementedError
+
+    async def symptom_trends(self, user_id: int, days: int) -> Tuple[List[dict], List[dict]]:
+        """(daily rollups oldest first, top flags) as in trends.get_trends."""
+        raise NotImplementedError
+
+    async def search_history(
+        self, user_id: int, text: str, sources, limit: int, cursor: Optional[str]
+    ) -> Tuple[List[dict], Optional[str]]:
+        """Ranked hits and next cursor as in search.search_history."""
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        return {"backend": self.name}
+
+
+# ---------- SQLite ----------
+def insert_symptom_rows(conn: sqlite3.Connection, rows: List[tuple]) -> None:
+    """Insert `symptom_check_rows` output and fold it into the daily trends."""
+    conn.executemany(
+        "INSERT OR IGNORE INTO advice_texts (text) VALUES (?)", {(row[6],) for row in rows}
+    )
+    conn.executemany(
+        """
+        INSERT INTO symptom_checks (
+            user_id, age, temperature, symptoms_text,
+            risk_level, risk_score, advice_code, created_at, created_ts
+        )
+        VALUES (?, ?, ?, ?, ?, ?, (SELECT id FROM advice_texts WHERE text = ?), ?, ?)
+        """,
+        [row[:9] for row in rows],
+    )
+    trends.record_checks(conn, trend_entries(rows))
+
+
+def trend_entries(rows: Iterable[tuple]) -> Iterator[trends.TrendEntry]:
+    # user_id, created_ts, risk_level, risk_score, flags
+    return ((r[0], r[8], r[4], r[5], r[9]) for r in rows)
+
+
+def insert_chat_rows(conn: sqlite3.Connection, rows: List[tuple]) -> None:
+    conn.executemany(
+        """
+        INSERT INTO chat_messages (user_id, role, content, created_at, created_ts)
+        VALUES (?, ?, ?, ?, ?)
+        """,
+        rows,
+    )
+
+
+SQLITE_WRITERS = {
+    "symptom_checks": insert_symptom_rows,
+    "chat_messages": insert_chat_rows,
+}
+
+
+def write_rows(batch: Dict[str, List[tuple]]) -> None:
+    with get_db() as conn:
+        for kind, rows in batch.items():
+            SQLITE_WRITERS[kind](conn, rows)
+
+
+def iter_history_rows(
+    table: str,
+    user_id: int,
+    limit: Optional[int] = None,
+    after: After = None,
+) -> Iterator[sqlite3.Row]:
+    """
+    Yield a user's rows newest-first, starting strictly after `after`.
+
+    Reads HISTORY_STREAM_PAGE rows at a time along the (user_id, created_ts,
+    id) index, resuming each page from the last row's keyset position. The
+    pooled connection goes back after every page, so a client reading the
+    stream slowly never holds one while it is not being read from.
+    """
+    while limit is None or limit > 0:
+        size = HISTORY_STREAM_PAGE if limit is None else min(limit, HISTORY_STREAM_PAGE)
+        rows = history_rows(table, user_id, size, after)
+        yield from rows
+        if len(rows) < size:
+            return
+        if limit is not None:
+            limit -= len(rows)
+        after = (rows[-1]["created_ts"], rows[-1]["id"])
+
+
+def history_rows(table: str, user_id: int, limit: int, after: After = None) -> List[sqlite3.Row]:
+    columns = select_list(HISTORY_COLUMNS[table])
+    sql = f"SELECT {columns}, created_ts FROM {table} WHERE user_id = ?"
+    params: list = [user_id]
+    if after:
+        sql += " AND (created_ts, id) < (?, ?)"
+        params.extend(after)
+    sql += " ORDER BY created_ts DESC, id DESC LIMIT ?"
+    params.append(limit)
+    with get_db() as conn:
+        return conn.execute(sql, params).fetchall()
+
+
+def _recent_chat_messages(user_id: int, limit: int) -> List[sqlite3.Row]:
+    with get_db() as conn:
+        return conn.execute(
+            """
+            SELECT role, content, created_ts FROM chat_messages
+            WHERE user_id = ?
+            ORDER BY created_ts DESC, id DESC
+            LIMIT ?
+            """,
+            (user_id, limit),
+        ).fetchall()
+
+
+def _latest_chat_ts(user_id: int) -> Optional[int]:
+    with get_db() as conn:
+        return conn.execute(
+            "SELECT MAX(created_ts) FROM chat_messages WHERE user_id = ?", (user_id,)
+        ).fetchone()[0]
+
+
+def _get_user_by_email(email: str) -> Optional[sqlite3.Row]:
+    with get_db() as conn:
+        return conn.execute(
+            "SELECT id, password_hash FROM users WHERE email = ?", (email,)
+        ).fetchone()
+
+
+def _create_user(email: str, password_hash: str) -> Optional[int]:
+    now, _ = utc_now()
+    try:
+        with get_db() as conn:
+            cur = conn.execute(
+                "INSERT INTO users (email, password_hash, created_at) VALUES (?, ?, ?)",
+                (email, password_hash, now),
+            )
+            return cur.lastrowid
+    except sqlite3.IntegrityError:
+        return None
+
+
+def _update_password_hash(user_id: int, password_hash: str) -> None:
+    with get_db() as conn:
+        conn.execute(
+            "UPDATE users SET password_hash = ? WHERE id = ?", (password_hash, user_id)
+        )
+
+
+def _symptom_trends(user_id: int, days: int):
+    with get_db() as conn:
+        return trends.get_trends(conn, user_id, days)
+
+
+def _search_history(user_id: int, text: str, sources, limit: int, cursor: Optional[str]):
+    with get_db() as conn:
+        return search.search_history(conn, user_id, text, sources, limit, cursor)
+
+
+class SQLiteStorage(Storage):
+    """The local SQLite file (db.py), with blocking calls moved off the event loop."""
+
+    name = "sqlite"
+
+    async def start(self) -> None:
+        def migrate_local():
+            with get_db() as conn:
+                ensure_schema(conn, str(db_pool.path))
+
+        await run_in_threadpool(migrate_local)
+
+    async def write_batch(self, batch: Dict[str, List[tuple]]) -> None:
+        await run_in_threadpool(write_rows, batch)
+
+    async def history_page(self, table: str, user_id: int, limit: int, after: After = None) -> list:
+        return await run_in_threadpool(history_rows, table, user_id, limit, after)
+
+    def iter_history(
+        self, table: str, user_id: int, limit: Optional[int] = None, after: After = None
+    ) -> AsyncIterator:
+        return iterate_in_threadpool(iter_history_rows(table, user_id, limit, after))
+
+    async def recent_chat_messages(self, user_id: int, limit: int) -> list:
+        return await run_in_threadpool(_recent_chat_messages, user_id, limit)
+
+    async def latest_chat_ts(self, user_id: int) -> Optional[int]:
+        return await run_in_threadpool(_latest_chat_ts, user_id)
+
+    async def get_user_by_email(self, email: str):
+        return await run_in_threadpool(_get_user_by_email, email)
+
+    async def create_user(self, email: str, password_hash: str) -> Optional[int]:
+        return await run_in_threadpool(_create_user, email, password_hash)
+
+    async def update_password_hash(self, user_id: int, password_hash: str) -> None:
+        await run_in_threadpool(_update_password_hash, user_id, password_hash)
+
+    async def symptom_trends(self, user_id: int, days: int) -> Tuple[List[dict], List[dict]]:
+        return await run_in_threadpool(_symptom_trends, user_id, days)
+
+    async def search_history(
+        self, user_id: int, text: str, sources, limit: int, cursor: Optional[str]
+    ) -> Tuple[List[dict], Optional[str]]:
+        return await run_in_threadpool(_search_history, user_id, text, sources, limit, cursor)
+
+
+def create_storage(backend: str = STORAGE_BACKEND) -> Storage:
+    if backend == "sqlite":
+        return SQLiteStorage()
+    if backend == "postgres":
+        from storage_postgres import PostgresStorage
+
+        if not DATABASE_URL:
+            raise RuntimeError("STORAGE_BACKEND=postgres needs DATABASE_URL")
+        return PostgresStorage(
+            DATABASE_URL,
+            replica_dsn=DATABASE_REPLICA_URL or None,
+            min_size=DATABASE_POOL_MIN,
+            max_size=DATABASE_POOL_MAX,
+        )
+    raise RuntimeError(f"Unknown STORAGE_BACKEND {backend!r} (expected sqlite or postgres)")
+
+
+storage = create_storage()
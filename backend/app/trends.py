@@ -0,0 +1,137 @@
+"""
+Daily symptom-check rollups.
+
+Every stored check also bumps a per-user and a global (user_id 0) row in
+`symptom_trends_daily` (checks per risk level, score sum) and one row per
+detected flag in `symptom_trends_flags`, in the same transaction as the
+insert. /api/symptom-trends then reads at most one row per day of the
+requested window, however long the history behind it is.
+"""
+import os
+import sqlite3
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, List, Sequence, Tuple
+
+from metrics import timed
+
+# ---------- Config ----------
+TRENDS_DEFAULT_DAYS = int(os.getenv("TRENDS_DEFAULT_DAYS", "30"))
+TRENDS_MAX_DAYS = int(os.getenv("TRENDS_MAX_DAYS", "365"))
+TRENDS_TOP_FLAGS = int(os.getenv("TRENDS_TOP_FLAGS", "10"))
+
+# Rollup key for the whole population (real user ids start at 1)
+GLOBAL_USER_ID = 0
+
+RISK_LEVELS = ("Low", "Medium", "High")
+
+# (user_id, created_ts, risk_level, risk_score, flags)
+TrendEntry = Tuple[int, int, str, int, Sequence[str]]
+
+
+def day_of(created_ts: int) -> str:
+    """UTC calendar day ('YYYY-MM-DD') of an epoch-milliseconds timestamp."""
+    return datetime.fromtimestamp(created_ts / 1000, tz=timezone.utc).strftime("%Y-%m-%d")
+
+
+def rollup(entries: Iterable[TrendEntry]) -> Tuple[List[tuple], List[tuple]]:
+    """
+    Sum a batch of checks into (daily rows, flag rows) increments, so a
+    write-queue batch costs one upsert per (user, day) and per
+    (user, day, flag) rather than one per check. Shared by every storage
+    backend.
+    """
+    daily: dict = {}
+    flags: Counter = Counter()
+    for user_id, created_ts, risk_level, risk_score, check_flags in entries:
+        day = day_of(created_ts)
+        for key in ((user_id, day), (GLOBAL_USER_ID, day)):
+            row = daily.setdefault(key, [0, 0, 0, 0, 0])
+            row[0] += 1
+            if risk_level in RISK_LEVELS:
+                row[1 + RISK_LEVELS.index(risk_level)] += 1
+            row[4] += risk_score or 0
+            for flag in check_flags:
+                flags[(*key, flag)] += 1
+    return (
+        [(*key, *row) for key, row in daily.items()],
+        [(*key, hits) for key, hits in flags.items()],
+    )
+
+
+def record_checks(conn: sqlite3.Connection, entries: Iterable[TrendEntry]) -> None:
+    """Fold a batch of checks into the rollups, inside the caller's transaction."""
+    daily, flags = rollup(entries)
+    if daily:
+        conn.executemany(
+            """
+            INSERT INTO symptom_trends_daily (user_id, day, checks, low, medium, high, score_sum)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (user_id, day) DO UPDATE SET
+                checks = checks + excluded.checks,
+                low = low + excluded.low,
+                medium = medium + excluded.medium,
+                high = high + excluded.high,
+                score_sum = score_sum + excluded.score_sum
+            """,
+            daily,
+        )
+    if flags:
+        conn.executemany(
+            """
+            INSERT INTO symptom_trends_flags (user_id, day, flag, hits)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT (user_id, day, flag) DO UPDATE SET hits = hits + excluded.hits
+            """,
+            flags,
+        )
+
+
+def window_start(days: int) -> str:
+    """First day of a `days`-long window ending today (UTC)."""
+    today = datetime.now(timezone.utc).date()
+    return (today - timedelta(days=days - 1)).isoformat()
+
+
+def daily_item(row) -> dict:
+    return {
+        "day": row["day"],
+        "checks": row["checks"],
+        "low": row["low"],
+        "medium": row["medium"],
+        "high": row["high"],
+        "mean_score": round(row["score_sum"] / row["checks"], 2) if row["checks"] else 0.0,
+    }
+
+
+@timed("db_read_symptom_trends")
+def get_trends(conn: sqlite3.Connection, user_id: int, days: int) -> Tuple[List[dict], List[dict]]:
+    """Daily rollups (oldest first) and the most frequent flags over the window."""
+    since = window_start(days)
+    daily = [
+        daily_item(row)
+        for row in conn.execute(
+            """
+            SELECT day, checks, low, medium, high, score_sum
+            FROM symptom_trends_daily
+            WHERE user_id = ? AND day >= ?
+            ORDER BY day
+            """,
+            (user_id, since),
+        )
+    ]
+    top_flags = [
+        {"flag": row["flag"], "count": row["hits"]}
+        for row in conn.execute(
+            """
+            SELECT flag, SUM(hits) AS hits
+            FROM symptom_trends_flags
+            WHERE user_id = ? AND day >= ?
+            GROUP BY flag
+            ORDER BY hits DESC, flag
+            LIMIT ?
+            """,
+            (user_id, since, TRENDS_TOP_FLAGS),
+        )
+    ]
+    return daily, top_flags
@@ -0,0 +1,231 @@
+import asyncio
+import os
+import sqlite3
+import time
+from collections import defaultdict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from db import PoolTimeout
+from metrics import record_error, timed
+from scheduler import LatencyHistogram
+
+# ---------- Config ----------
+WRITE_QUEUE_ENABLED = os.getenv("WRITE_QUEUE_ENABLED", "true").lower() == "true"
+WRITE_QUEUE_MAX_SIZE = int(os.getenv("WRITE_QUEUE_MAX_SIZE", "10000"))
+WRITE_QUEUE_MAX_BATCH = int(os.getenv("WRITE_QUEUE_MAX_BATCH", "500"))
+# How long a request may wait for queue space before writing inline instead.
+WRITE_QUEUE_ENQUEUE_TIMEOUT = float(os.getenv("WRITE_QUEUE_ENQUEUE_TIMEOUT", "1.0"))
+# Locks and dropped connections are retried with backoff for this long
+# before a batch is given up
+WRITE_QUEUE_RETRY_SECONDS = float(os.getenv("WRITE_QUEUE_RETRY_SECONDS", "60"))
+WRITE_QUEUE_BACKOFF_MAX_SECONDS = 2.0
+
+# PostgreSQL SQLSTATE classes worth retrying: connection exceptions,
+# serialization failures / deadlocks, insufficient resources, operator
+# intervention (shutdowns, failovers)
+_TRANSIENT_SQLSTATE_CLASSES = ("08", "40", "53", "57")
+
+# {kind: rows} -> None; commits the whole batch in one transaction
+# (Storage.write_batch, see storage.py)
+BatchSink = Callable[[Dict[str, List[tuple]]], Awaitable[None]]
+
+
+class WriteBehindQueue:
+    """
+    In-process write-behind queue for request-path inserts.
+
+    Requests enqueue (kind, rows) and return immediately; a single background
+    task drains whatever has accumulated (up to `max_batch` items) and
+    group-commits it in one transaction through the bound storage sink. The queue
+    is bounded: when it is full, producers wait up to `enqueue_timeout` and
+    then write inline, so a stuck disk slows requests down rather than
+    growing memory without limit. stop() drains everything before returning.
+
+    A batch that fails on a transient error (see is_transient) is retried
+    with backoff. Any other failure is blamed on the data: the batch is
+    split in half until the item that cannot be written is isolated, and
+    only that item is dropped.
+
+    Reads are eventually consistent with writes (typically a few ms behind);
+    pending() exposes rows not yet committed for callers that can't wait.
+    """
+
+    def __init__(
+        self,
+        max_size: int = WRITE_QUEUE_MAX_SIZE,
+        max_batch: int = WRITE_QUEUE_MAX_BATCH,
+        enqueue_timeout: float = WRITE_QUEUE_ENQUEUE_TIMEOUT,
+    ):
+        self.max_size = max_size
+        self.max_batch = max_batch
+        self.enqueue_timeout = enqueue_timeout
+        self._sink: Optional[BatchSink] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        # Queued or committing items by id(), in enqueue order (see pending())
+        self._pending: Dict[int, Tuple[str, List[tuple]]] = {}
+
+        self.enqueued = 0
+        self.committed_rows = 0
+        self.batches = 0
+        self.inline_writes = 0
+        self.errors = 0
+        self.dropped_rows = 0
+        self.commit_latency = LatencyHistogram([1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 5000])
+
+    def bind(self, sink: BatchSink) -> None:
+        self._sink = sink
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_size)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Flush everything queued so far, then stop the writer task."""
+        if not self.running:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+
+    @timed("db_write_batch")
+    async def _commit(self, items: List[Tuple[str, List[tuple]]]) -> int:
+        grouped: Dict[str, List[tuple]] = defaultdict(list)
+        for kind, rows in items:
+            grouped[kind].extend(rows)
+        await self._sink(dict(grouped))
+        return sum(len(rows) for rows in grouped.values())
+
+    async def _commit_with_retry(self, items: List[Tuple[str, List[tuple]]]) -> None:
+        try:
+            await self._commit_attempts(items)
+        finally:
+            for item in items:
+                self._pending.pop(id(item), None)
+
+    async def _commit_attempts(self, items: List[Tuple[str, List[tuple]]]) -> None:
+        deadline = time.monotonic() + WRITE_QUEUE_RETRY_SECONDS
+        attempt = 0
+        while True:
+            attempt += 1
+            start = time.perf_counter()
+            try:
+                count = await self._commit(items)
+            except Exception as e:
+                self.errors += 1
+                if is_transient(e):
+                    delay = min(WRITE_QUEUE_BACKOFF_MAX_SECONDS, 0.1 * 2 ** (attempt - 1))
+                    if time.monotonic() + delay < deadline:
+                        record_error("write_queue", f"Write-behind commit failed (attempt {attempt})", e)
+                        await asyncio.sleep(delay)
+                        continue
+                    self._drop(items, f"after {attempt} attempts", e)
+                elif len(items) > 1:
+                    # Bisect so one bad row doesn't take the rest of the batch down
+                    middle = len(items) // 2
+                    await self._commit_attempts(items[:middle])
+                    await self._commit_attempts(items[middle:])
+                else:
+                    self._drop(items, "that cannot be written", e)
+                return
+            self.commit_latency.observe(time.perf_counter() - start)
+            self.committed_rows += count
+            self.batches += 1
+            return
+
+    def _drop(self, items: List[Tuple[str, List[tuple]]], reason: str, exc: Exception) -> None:
+        dropped = sum(len(rows) for _, rows in items)
+        self.dropped_rows += dropped
+        record_error("write_queue_dropped", f"Write-behind dropped {dropped} rows {reason}", exc)
+
+    async def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            batch: List[Tuple[str, List[tuple]]] = []
+            if item is None:
+                stopping = True
+            else:
+                batch.append(item)
+            # Group commit: take everything already waiting, up to max_batch
+            while len(batch) < self.max_batch and not self._queue.empty():
+                item = self._queue.get_nowait()
+                if item is None:
+                    stopping = True
+                    continue
+                batch.append(item)
+            if batch:
+                await self._commit_with_retry(batch)
+
+    async def enqueue(self, kind: str, rows: List[tuple]) -> None:
+        if not rows:
+            return
+        if not self.running:
+            await self._write_inline(kind, rows)
+            return
+        item = (kind, rows)
+        # Registered before the put: the writer may commit (and unregister)
+        # it before wait_for hands control back
+        self._pending[id(item)] = item
+        try:
+            await asyncio.wait_for(self._queue.put(item), self.enqueue_timeout)
+            self.enqueued += 1
+        except asyncio.TimeoutError:
+            self._pending.pop(id(item), None)
+            await self._write_inline(kind, rows)
+        except BaseException:
+            self._pending.pop(id(item), None)
+            raise
+
+    def pending(self, kind: str, user_id: int) -> List[tuple]:
+        """
+        The user's `kind` rows that are queued or being committed, oldest
+        first. Rows of the batch in flight may already be visible in the
+        database too.
+        """
+        return [
+            row
+            for item_kind, rows in list(self._pending.values())
+            if item_kind == kind
+            for row in rows
+            if row[0] == user_id
+        ]
+
+    async def _write_inline(self, kind: str, rows: List[tuple]) -> None:
+        self.inline_writes += 1
+        await self._commit([(kind, rows)])
+
+    def stats(self) -> dict:
+        return {
+            "enabled": WRITE_QUEUE_ENABLED,
+            "running": self.running,
+            "depth": self._queue.qsize() if self._queue is not None else 0,
+            "max_size": self.max_size,
+            "enqueued": self.enqueued,
+            "batches": self.batches,
+            "committed_rows": self.committed_rows,
+            "inline_writes": self.inline_writes,
+            "errors": self.errors,
+            "dropped_rows": self.dropped_rows,
+            "commit_latency": self.commit_latency.snapshot(),
+        }
+
+
+def is_transient(exc: BaseException) -> bool:
+    """Errors that say nothing about the rows: locks, timeouts, lost connections."""
+    if isinstance(exc, sqlite3.OperationalError):
+        message = str(exc).lower()
+        return "locked" in message or "busy" in message
+    if isinstance(exc, (ConnectionError, TimeoutError, asyncio.TimeoutError, PoolTimeout)):
+        return True
+    # asyncpg errors carry the server's SQLSTATE
+    return str(getattr(exc, "sqlstate", "") or "")[:2] in _TRANSIENT_SQLSTATE_CLASSES
+
+
+write_queue = WriteBehindQueue()
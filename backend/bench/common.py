@@ -0,0 +1,95 @@
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+BENCH_DIR = Path(__file__).resolve().parent
+APP_DIR = BENCH_DIR.parent / "app"
+
+
+def use_app_modules(db_path: Optional[str] = None) -> None:
+    """
+    Make backend/app importable (it uses flat `from db import ...` imports)
+    and point it at a throwaway database. Must run before importing app code.
+    """
+    if db_path is not None:
+        os.environ["SAFELINK_DB_PATH"] = db_path
+    if str(APP_DIR) not in sys.path:
+        sys.path.insert(0, str(APP_DIR))
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(q * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(latencies_s: List[float], elapsed_s: Optional[float] = None, errors: int = 0) -> dict:
+    """p50/p95/p99/mean/max in milliseconds plus throughput."""
+    values = sorted(latencies_s)
+    count = len(values)
+    elapsed = elapsed_s if elapsed_s is not None else sum(values)
+    return {
+        "count": count,
+        "errors": errors,
+        "p50_ms": round(percentile(values, 0.50) * 1000, 4),
+        "p95_ms": round(percentile(values, 0.95) * 1000, 4),
+        "p99_ms": round(percentile(values, 0.99) * 1000, 4),
+        "mean_ms": round(sum(values) / count * 1000, 4) if count else 0.0,
+        "max_ms": round(values[-1] * 1000, 4) if count else 0.0,
+        "throughput_per_s": round(count / elapsed, 2) if elapsed > 0 else 0.0,
+    }
+
+
+def measure(fn: Callable[[], object], iterations: int, warmup: int = 10) -> dict:
+    """Time `fn` one call at a time after a warm-up."""
+    for _ in range(warmup):
+        fn()
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(iterations):
+        t = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - t)
+    return summarize(latencies, time.perf_counter() - start)
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=BENCH_DIR,
+            capture_output=True,
+            text=True,
+            timeout=5,
+        )
+        return out.stdout.strip() or None
+    except Exception:
+        return None
+
+
+def environment() -> dict:
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "git_revision": _git_revision(),
+        "timestamp": int(time.time()),
+    }
+
+
+def write_report(kind: str, results: Dict[str, dict], config: dict, output: Optional[str]) -> dict:
+    """Print the report as JSON and optionally write it to `output`."""
+    report = {"kind": kind, "environment": environment(), "config": config, "results": results}
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if output:
+        Path(output).write_text(text + "\n", encoding="utf-8")
+    print(text)
+    return report
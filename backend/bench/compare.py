@@ -0,0 +1,69 @@
+"""
+Diff two benchmark reports (from micro.py or load.py):
+
+    python compare.py before.json after.json [--threshold 10]
+
+Prints p50/p95/p99 and throughput per case with the relative change, and
+marks changes beyond the threshold (in percent). Exits 1 if any case
+regressed beyond it.
+"""
+import argparse
+import json
+import sys
+from typing import Dict, Iterator, Tuple
+
+METRICS = [("p50_ms", False), ("p95_ms", False), ("p99_ms", False), ("throughput_per_s", True)]
+
+
+def _cases(report: dict) -> Iterator[Tuple[str, dict]]:
+    for name, value in report["results"].items():
+        if "p50_ms" in value:
+            yield name, value
+        else:
+            # micro.py groups cases: {"compute": {"analyze_symptoms": {...}}}
+            for case, stats in value.items():
+                yield f"{name}.{case}", stats
+
+
+def _change(old: float, new: float) -> float:
+    if not old:
+        return 0.0
+    return (new - old) / old * 100
+
+
+def main_cli(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--threshold", type=float, default=10.0, help="percent change worth flagging")
+    args = parser.parse_args(argv)
+
+    with open(args.before, encoding="utf-8") as f:
+        before: Dict[str, dict] = dict(_cases(json.load(f)))
+    with open(args.after, encoding="utf-8") as f:
+        after: Dict[str, dict] = dict(_cases(json.load(f)))
+
+    regressed = False
+    width = max((len(n) for n in after), default=10)
+    print(f"{'case':<{width}}  " + "  ".join(f"{m:>35}" for m, _ in METRICS))
+    for name in sorted(after):
+        if name not in before:
+            print(f"{name:<{width}}  (new)")
+            continue
+        cells = []
+        for metric, higher_is_better in METRICS:
+            old, new = before[name].get(metric, 0.0), after[name].get(metric, 0.0)
+            change = _change(old, new)
+            worse = change < -args.threshold if higher_is_better else change > args.threshold
+            better = change > args.threshold if higher_is_better else change < -args.threshold
+            mark = " !" if worse else (" +" if better else "  ")
+            regressed |= worse
+            cells.append(f"{old:>10.3f} -> {new:>10.3f} {change:+7.1f}%{mark}")
+        print(f"{name:<{width}}  " + "  ".join(cells))
+    for name in sorted(set(before) - set(after)):
+        print(f"{name:<{width}}  (removed)")
+    return 1 if regressed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,334 @@
+"""
+End-to-end load scenarios against the FastAPI app.
+
+By default this starts the stub upstreams (stubs.py) and the app itself
+(uvicorn, throwaway database, pointed at the stubs), then drives each
+scenario with a fixed number of concurrent closed-loop clients and prints a
+JSON report of p50/p95/p99 latency, throughput and status codes:
+
+    python load.py --concurrency 32 --duration 15 --output load.json
+    python load.py --scenarios chat,chat_stream --groq-failure-rate 0.2
+    python load.py --target http://127.0.0.1:8000 --scenarios symptom_check
+    python load.py --database-url postgresql://localhost/safelink_load --workers 4
+
+Stub latency/failure flags are the same as stubs.py. With --target the app
+and stubs are not started and the target is used as-is.
+"""
+import argparse
+import asyncio
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import httpx
+
+from common import APP_DIR, BENCH_DIR, summarize, write_report
+from micro import CHAT_MESSAGES, SYMPTOM_TEXTS
+from stubs import add_stub_arguments
+
+SCENARIOS = [
+    "health",
+    "symptom_check",
+    "symptom_batch",
+    "history",
+    "chat",
+    "chat_stream",
+    "nearby_hospitals",
+    "login",
+    "mixed",
+]
+
+CITIES = [(40.7128, -74.0060), (51.5074, -0.1278), (17.3850, 78.4867), (-33.8688, 151.2093)]
+USERS = 200
+BENCH_PASSWORD = "bench-password"
+
+
+# ---------- Processes ----------
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_for(url: str, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(url, timeout=1.0)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    raise RuntimeError(f"{url} did not come up within {timeout:.0f}s")
+
+
+def start_stubs(args: argparse.Namespace, port: int) -> subprocess.Popen:
+    stub_args = [
+        "--port", str(port),
+        "--groq-latency-ms", str(args.groq_latency_ms),
+        "--groq-failure-rate", str(args.groq_failure_rate),
+        "--ollama-latency-ms", str(args.ollama_latency_ms),
+        "--ollama-failure-rate", str(args.ollama_failure_rate),
+        "--overpass-latency-ms", str(args.overpass_latency_ms),
+        "--overpass-failure-rate", str(args.overpass_failure_rate),
+        "--jitter", str(args.jitter),
+        "--token-delay-ms", str(args.token_delay_ms),
+        "--reply-tokens", str(args.reply_tokens),
+        "--hospitals", str(args.hospitals),
+        "--seed", str(args.seed),
+    ]
+    proc = subprocess.Popen([sys.executable, str(BENCH_DIR / "stubs.py"), *stub_args])
+    _wait_for(f"http://127.0.0.1:{port}/stats")
+    return proc
+
+
+def start_app(args: argparse.Namespace, port: int, stub_port: int, db_path: Path) -> subprocess.Popen:
+    stub = f"http://127.0.0.1:{stub_port}"
+    env = {
+        **os.environ,
+        "SAFELINK_DB_PATH": str(db_path),
+        "GROQ_API_KEY": "bench-stub-key",
+        "GROQ_BASE_URL": stub,
+        "GROQ_MAX_RETRIES": "0",
+        "OLLAMA_URL": f"{stub}/api/generate",
+        "OVERPASS_URL": f"{stub}/api/interpreter",
+        "SESSION_SECRET": "bench-secret",
+        # Scenarios pick random users through the legacy header
+        "SESSION_ALLOW_USER_ID_HEADER": "true",
+        # The load generator is a single IP hammering one account
+        "AUTH_RATE_LIMIT_ENABLED": "false",
+        "REPLY_CACHE_ENABLED": "false" if args.no_reply_cache else "true",
+        "LOG_LEVEL": "WARNING",
+    }
+    if args.database_url:
+        env.update(STORAGE_BACKEND="postgres", DATABASE_URL=args.database_url)
+    proc = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "main:app",
+            "--host", "127.0.0.1", "--port", str(port),
+            "--workers", str(args.workers), "--log-level", "warning", "--no-access-log",
+        ],
+        cwd=APP_DIR,
+        env=env,
+    )
+    _wait_for(f"http://127.0.0.1:{port}/")
+    return proc
+
+
+def stop(proc: Optional[subprocess.Popen]) -> None:
+    if proc is None or proc.poll() is not None:
+        return
+    proc.terminate()
+    try:
+        proc.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+
+
+# ---------- Scenarios ----------
+class Scenario:
+    """One request shape; `call` returns the status code (and may record extra timings)."""
+
+    def __init__(self, client: httpx.AsyncClient, rng: random.Random, unique_ratio: float):
+        self.client = client
+        self.rng = rng
+        self.unique_ratio = unique_ratio
+        self.counter = 0
+        self.ttft: List[float] = []
+        self.token: Optional[str] = None
+
+    def user_headers(self) -> Dict[str, str]:
+        return {"X-User-Id": str(self.rng.randint(1, USERS))}
+
+    def symptom_payload(self) -> dict:
+        return {
+            "age": self.rng.choice([None, 6, 30, 45, 70]),
+            "temperature": self.rng.choice([None, 98.6, 100.5, 102.8]),
+            "symptoms_text": self.rng.choice(SYMPTOM_TEXTS),
+        }
+
+    def chat_message(self) -> str:
+        message = self.rng.choice(CHAT_MESSAGES)
+        if self.rng.random() < self.unique_ratio:
+            self.counter += 1
+            message = f"{message} (case {self.counter})"
+        return message
+
+    async def health(self) -> int:
+        return (await self.client.get("/")).status_code
+
+    async def symptom_check(self) -> int:
+        r = await self.client.post("/api/symptom-check", json=self.symptom_payload(), headers=self.user_headers())
+        return r.status_code
+
+    async def symptom_batch(self) -> int:
+        payloads = [self.symptom_payload() for _ in range(100)]
+        r = await self.client.post("/api/symptom-check/batch", json=payloads, headers=self.user_headers())
+        return r.status_code
+
+    async def history(self) -> int:
+        path = self.rng.choice(["/api/symptom-history", "/api/chat-history"])
+        return (await self.client.get(path, headers=self.user_headers())).status_code
+
+    async def chat(self) -> int:
+        r = await self.client.post("/api/chat", json={"message": self.chat_message()}, headers=self.user_headers())
+        return r.status_code
+
+    async def chat_stream(self) -> int:
+        start = time.perf_counter()
+        first = None
+        async with self.client.stream(
+            "POST", "/api/chat/stream", json={"message": self.chat_message()}, headers=self.user_headers()
+        ) as r:
+            async for chunk in r.aiter_text():
+                if first is None and chunk:
+                    first = time.perf_counter() - start
+            if first is not None:
+                self.ttft.append(first)
+            return r.status_code
+
+    async def nearby_hospitals(self) -> int:
+        lat, lng = self.rng.choice(CITIES)
+        payload = {
+            "latitude": lat + self.rng.uniform(-0.05, 0.05),
+            "longitude": lng + self.rng.uniform(-0.05, 0.05),
+            "radius_meters": self.rng.choice([2000, 5000, 10000]),
+        }
+        return (await self.client.post("/api/nearby-hospitals", json=payload)).status_code
+
+    async def login(self) -> int:
+        r = await self.client.post("/api/login", json={"email": "bench@example.com", "password": BENCH_PASSWORD})
+        return r.status_code
+
+    async def mixed(self) -> int:
+        # Roughly the frontend's traffic shape
+        pick = self.rng.random()
+        if pick < 0.40:
+            return await self.chat()
+        if pick < 0.70:
+            return await self.symptom_check()
+        if pick < 0.85:
+            return await self.history()
+        if pick < 0.95:
+            return await self.nearby_hospitals()
+        return await self.login()
+
+
+async def run_scenario(
+    base_url: str,
+    name: str,
+    concurrency: int,
+    duration: float,
+    warmup: float,
+    unique_ratio: float,
+    seed: int,
+) -> dict:
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60.0) as client:
+        latencies: List[float] = []
+        statuses: Counter = Counter()
+        errors = 0
+        scenarios = [Scenario(client, random.Random(seed + i), unique_ratio) for i in range(concurrency)]
+        measuring_from = time.perf_counter() + warmup
+        stop_at = measuring_from + duration
+
+        async def worker(scenario: Scenario) -> None:
+            nonlocal errors
+            call: Callable[[], Awaitable[int]] = getattr(scenario, name)
+            while True:
+                start = time.perf_counter()
+                if start >= stop_at:
+                    return
+                try:
+                    status = await call()
+                except Exception as e:
+                    status = type(e).__name__
+                end = time.perf_counter()
+                if start < measuring_from:
+                    scenario.ttft.clear()
+                    continue
+                statuses[str(status)] += 1
+                if isinstance(status, int) and status < 400:
+                    latencies.append(end - start)
+                else:
+                    errors += 1
+
+        await asyncio.gather(*(worker(s) for s in scenarios))
+
+    result = summarize(latencies, duration, errors)
+    result["status_codes"] = dict(sorted(statuses.items()))
+    ttft = [t for s in scenarios for t in s.ttft]
+    if ttft:
+        result["time_to_first_token"] = summarize(ttft, duration)
+    return result
+
+
+async def prepare(base_url: str) -> None:
+    """Create the login scenario's account (ignores 'already registered')."""
+    async with httpx.AsyncClient(base_url=base_url, timeout=30.0) as client:
+        await client.post("/api/signup", json={"email": "bench@example.com", "password": BENCH_PASSWORD})
+
+
+def main_cli(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"any of {','.join(SCENARIOS)}")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0, help="measured seconds per scenario")
+    parser.add_argument("--warmup", type=float, default=2.0, help="unmeasured seconds per scenario")
+    parser.add_argument("--unique-ratio", type=float, default=0.5,
+                        help="share of chat messages made unique (reply cache misses)")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers for the app")
+    parser.add_argument("--no-reply-cache", action="store_true")
+    parser.add_argument("--database-url", help="run the app on the PostgreSQL backend (empty database)")
+    parser.add_argument("--target", help="benchmark an already running app instead")
+    parser.add_argument("--output", help="also write the JSON report here")
+    add_stub_arguments(parser)
+    args = parser.parse_args(argv)
+
+    names = [n.strip() for n in args.scenarios.split(",") if n.strip()]
+    unknown = [n for n in names if n not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+
+    stubs_proc = app_proc = None
+    stub_stats = None
+    with tempfile.TemporaryDirectory(prefix="safelink-load-") as tmp:
+        try:
+            if args.target:
+                base_url = args.target.rstrip("/")
+            else:
+                stub_port, app_port = _free_port(), _free_port()
+                stubs_proc = start_stubs(args, stub_port)
+                app_proc = start_app(args, app_port, stub_port, Path(tmp) / "load.db")
+                base_url = f"http://127.0.0.1:{app_port}"
+
+            asyncio.run(prepare(base_url))
+            results = {}
+            for name in names:
+                print(f"running {name} ...", file=sys.stderr)
+                results[name] = asyncio.run(run_scenario(
+                    base_url, name, args.concurrency, args.duration, args.warmup,
+                    args.unique_ratio, args.seed,
+                ))
+            if stubs_proc is not None:
+                stub_stats = httpx.get(f"http://127.0.0.1:{stub_port}/stats").json()
+        finally:
+            stop(app_proc)
+            stop(stubs_proc)
+
+    config = {k: v for k, v in vars(args).items() if k != "output"}
+    config["scenarios"] = names
+    if stub_stats is not None:
+        config["stub_calls"] = stub_stats
+    write_report("load", results, config, args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,268 @@
+"""
+Micro-benchmarks for the backend hot paths.
+
+Times symptom scoring, the keyword engine, the rule-based chat fallback,
+symptom scoring against rule books grown to several sizes, and the SQLite
+helpers (with history tables seeded to several sizes) in-process, and prints
+a JSON report with p50/p95/p99 latency and throughput per case:
+
+    python micro.py --sizes 1000,10000,100000 --rule-sizes 0,1000,10000 --output micro.json
+
+Nothing touches backend/app/safelink.db; every table size gets its own
+temporary database.
+"""
+import argparse
+import copy
+import json
+import random
+import time
+import sys
+import tempfile
+from pathlib import Path
+
+from common import measure, use_app_modules, write_report
+
+SEED = 1234
+
+SYMPTOM_TEXTS = [
+    "mild headache and a runny nose since yesterday",
+    "high fever, chills and body aches for two days",
+    "chest pain spreading to my left arm and shortness of breath",
+    "no chest pain but a dry cough and sore throat",
+    "dizzy, vomiting and severe abdominal pain",
+    "fatigue and mild cough, no fever",
+    "my child has a rash and a temperature",
+    "sudden weakness on one side and slurred speech",
+]
+
+CHAT_MESSAGES = [
+    "What should I do for a cold?",
+    "How much water should I drink when I have a fever?",
+    "Any tips for a headache that won't go away?",
+    "I feel stressed and can't sleep",
+    "What is a healthy diet for diabetes?",
+    "How do I treat a small burn at home?",
+]
+
+USERS = 50
+BENCH_USER = 1
+
+
+def _payloads(main, n: int, rng: random.Random):
+    return [
+        main.SymptomCheckRequest(
+            age=rng.choice([None, 4, 25, 40, 68, 80]),
+            temperature=rng.choice([None, 98.6, 100.2, 101.5, 103.1]),
+            symptoms_text=rng.choice(SYMPTOM_TEXTS),
+        )
+        for _ in range(n)
+    ]
+
+
+def bench_compute(main, iterations: int) -> dict:
+    rng = random.Random(SEED)
+    payloads = _payloads(main, 256, rng)
+    batch_100 = _payloads(main, 100, rng)
+    batch_1000 = _payloads(main, 1000, rng)
+    texts = [rng.choice(SYMPTOM_TEXTS + CHAT_MESSAGES) for _ in range(256)]
+
+    def cycle(items):
+        it = iter(())
+
+        def next_item():
+            nonlocal it
+            try:
+                return next(it)
+            except StopIteration:
+                it = iter(items)
+                return next(it)
+
+        return next_item
+
+    next_payload = cycle(payloads)
+    next_text = cycle(texts)
+    next_message = cycle(CHAT_MESSAGES)
+
+    return {
+        "analyze_symptoms": measure(lambda: main.analyze_symptoms(next_payload()), iterations),
+        "analyze_symptoms_batch_100": measure(
+            lambda: main.analyze_symptoms_batch(batch_100), max(10, iterations // 100)
+        ),
+        "analyze_symptoms_batch_1000": measure(
+            lambda: main.analyze_symptoms_batch(batch_1000), max(10, iterations // 1000)
+        ),
+        "keyword_scan": measure(
+            lambda: main.rule_book.current().engine.scan(next_text()), iterations
+        ),
+        "fallback_rule_based_reply": measure(
+            lambda: main._fallback_rule_based_reply(next_message().lower()), iterations
+        ),
+    }
+
+
+def synthetic_rules(doc: dict, extra: int, rng: random.Random) -> dict:
+    """The shipped rule file plus `extra` made-up two-word keywords."""
+    doc = copy.deepcopy(doc)
+    groups = doc["symptoms"]["keyword_groups"]
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    for i in range(extra):
+        term = " ".join("".join(rng.choice(letters) for _ in range(rng.randint(4, 9))) for _ in range(2))
+        groups[i % len(groups)]["keywords"].append(term)
+    return doc
+
+
+def bench_rules(main, rule_sizes, iterations: int) -> dict:
+    """Per-check latency as the rule book grows; it should stay flat."""
+    import rules
+
+    rng = random.Random(SEED)
+    base = json.loads(rules.RULES_PATH.read_text(encoding="utf-8"))
+    payloads = _payloads(main, 256, rng)
+    results = {}
+    for extra in rule_sizes:
+        doc = synthetic_rules(base, extra, rng)
+        start = time.perf_counter()
+        compiled = rules.compile_rules(doc)
+        compile_ms = round((time.perf_counter() - start) * 1000, 3)
+        it = iter(())
+
+        def next_payload():
+            nonlocal it
+            try:
+                return next(it)
+            except StopIteration:
+                it = iter(payloads)
+                return next(it)
+
+        def evaluate():
+            p = next_payload()
+            return compiled.evaluate(p.age, p.temperature, p.symptoms_text)
+
+        case = measure(evaluate, iterations)
+        case["compile_ms"] = compile_ms
+        case["scoring_keywords"] = len(compiled.columns)
+        results[f"evaluate_{extra}_extra_keywords"] = case
+    return results
+
+
+def seed_tables(main, db, rows: int, rng: random.Random) -> None:
+    """`rows` symptom checks and `rows` chat messages spread over USERS users."""
+    import storage
+
+    created_at, created_ts = db.utc_now()
+    payloads = _payloads(main, 64, rng)
+    results = [main.analyze_symptoms(p) for p in payloads]
+    symptom_rows = []
+    chat_rows = []
+    for i in range(rows):
+        user_id = 1 + i % USERS
+        ts = created_ts - (rows - i) * 1000
+        p, r = payloads[i % 64], results[i % 64]
+        symptom_rows.append((
+            user_id, p.age, p.temperature, p.symptoms_text,
+            r.risk_level, r.risk_score, r.advice, created_at, ts,
+            tuple(f for f in r.detected_flags if f != main.NO_FLAGS_MESSAGE),
+        ))
+        role = "user" if i % 2 == 0 else "assistant"
+        chat_rows.append((user_id, role, rng.choice(CHAT_MESSAGES), created_at, ts))
+    with db.get_db() as conn:
+        storage.insert_symptom_rows(conn, symptom_rows)
+        storage.insert_chat_rows(conn, chat_rows)
+        conn.execute("ANALYZE")
+
+
+def bench_db(main, db, migrate, size: int, iterations: int, tmpdir: Path) -> dict:
+    import storage
+
+    # Point the shared pool at a fresh database for this table size
+    db.db_pool.close()
+    db.db_pool.path = tmpdir / f"bench_{size}.db"
+    with db.get_db() as conn:
+        migrate(conn)
+    rng = random.Random(SEED)
+    seed_tables(main, db, size, rng)
+
+    # The SQLite backend's blocking helpers, without the threadpool hop
+    def page(table: str, after=None):
+        return storage.history_rows(table, BENCH_USER, 51, after)
+
+    after = None
+    for _ in range(5):
+        rows = page("symptom_checks", after)
+        after = (rows[-2]["created_ts"], rows[-2]["id"]) if len(rows) > 50 else after
+    deep_after = after
+
+    def trends(user_id: int):
+        with db.get_db() as conn:
+            return main.trends.get_trends(conn, user_id, 30)
+
+    payload = _payloads(main, 1, rng)[0]
+    result = main.analyze_symptoms(payload)
+    return {
+        "symptom_history_first_page": measure(lambda: page("symptom_checks"), iterations),
+        "symptom_history_page_5": measure(lambda: page("symptom_checks", deep_after), iterations),
+        "chat_history_first_page": measure(lambda: page("chat_messages"), iterations),
+        "symptom_trends_user_30d": measure(lambda: trends(BENCH_USER), iterations),
+        "symptom_trends_global_30d": measure(
+            lambda: trends(main.trends.GLOBAL_USER_ID), iterations
+        ),
+        "save_symptom_check": measure(
+            lambda: storage.write_rows(
+                {"symptom_checks": main.symptom_check_rows(BENCH_USER, [(payload, result)])}
+            ),
+            iterations,
+        ),
+        "save_chat_pair": measure(
+            lambda: storage.write_rows(
+                {"chat_messages": main.chat_pair_rows(BENCH_USER, "bench question", "bench reply")}
+            ),
+            iterations,
+        ),
+    }
+
+
+def main_cli(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,10000,100000", help="history table sizes to seed")
+    parser.add_argument(
+        "--rule-sizes", default="0,1000,10000", help="synthetic keywords added to the rule book"
+    )
+    parser.add_argument("--iterations", type=int, default=2000, help="calls per case")
+    parser.add_argument("--skip-db", action="store_true", help="only run the in-memory cases")
+    parser.add_argument("--output", help="also write the JSON report here")
+    args = parser.parse_args(argv)
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    rule_sizes = [int(s) for s in args.rule_sizes.split(",") if s.strip()]
+
+    with tempfile.TemporaryDirectory(prefix="safelink-bench-") as tmp:
+        tmpdir = Path(tmp)
+        use_app_modules(str(tmpdir / "bench_app.db"))
+        import db
+        import main
+        from migrations import migrate
+
+        with db.get_db() as conn:
+            migrate(conn)
+
+        results = {
+            "compute": bench_compute(main, args.iterations),
+            "rules": bench_rules(main, rule_sizes, args.iterations),
+        }
+        if not args.skip_db:
+            for size in sizes:
+                results[f"db_{size}_rows"] = bench_db(
+                    main, db, migrate, size, max(100, args.iterations // 4), tmpdir
+                )
+        db.db_pool.close()
+
+    write_report(
+        "micro",
+        results,
+        {"sizes": sizes, "rule_sizes": rule_sizes, "iterations": args.iterations, "seed": SEED, "users": USERS},
+        args.output,
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
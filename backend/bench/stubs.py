@@ -0,0 +1,218 @@
+"""
+Local stand-ins for Groq, Ollama and Overpass, for load tests.
+
+One server answers all three APIs:
+
+    POST /openai/v1/chat/completions   Groq (OpenAI-compatible), incl. stream=true
+    POST /api/generate                 Ollama, incl. NDJSON streaming
+    POST /api/interpreter              Overpass (hospitals around the queried point)
+    GET  /stats                        calls and injected failures per service
+
+Latency, jitter and failure rate are configurable per service:
+
+    python stubs.py --port 9100 --groq-latency-ms 400 --groq-failure-rate 0.05
+
+and the app is pointed at it with GROQ_BASE_URL=http://127.0.0.1:9100,
+OLLAMA_URL=http://127.0.0.1:9100/api/generate and
+OVERPASS_URL=http://127.0.0.1:9100/api/interpreter (load.py does this).
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import re
+import sys
+import time
+from collections import Counter
+from typing import AsyncIterator
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+REPLY_WORDS = (
+    "Rest, drink plenty of fluids and keep an eye on your temperature. "
+    "If symptoms get worse or last more than a few days, please see a doctor."
+).split()
+
+_AROUND_RE = re.compile(r"around:(\d+(?:\.\d+)?),(-?\d+(?:\.\d+)?),(-?\d+(?:\.\d+)?)")
+
+
+class StubConfig:
+    def __init__(self, args: argparse.Namespace):
+        self.latency_ms = {
+            "groq": args.groq_latency_ms,
+            "ollama": args.ollama_latency_ms,
+            "overpass": args.overpass_latency_ms,
+        }
+        self.failure_rate = {
+            "groq": args.groq_failure_rate,
+            "ollama": args.ollama_failure_rate,
+            "overpass": args.overpass_failure_rate,
+        }
+        self.jitter = args.jitter
+        self.token_delay_ms = args.token_delay_ms
+        self.reply_tokens = args.reply_tokens
+        self.hospitals = args.hospitals
+        self.rng = random.Random(args.seed)
+        self.calls: Counter = Counter()
+        self.failures: Counter = Counter()
+
+    async def delay(self, service: str) -> None:
+        base = self.latency_ms[service]
+        ms = base * (1 + self.rng.uniform(-self.jitter, self.jitter)) if base else 0
+        if ms > 0:
+            await asyncio.sleep(ms / 1000)
+
+    def should_fail(self, service: str) -> bool:
+        self.calls[service] += 1
+        if self.rng.random() < self.failure_rate[service]:
+            self.failures[service] += 1
+            return True
+        return False
+
+    def reply_words(self):
+        words = (REPLY_WORDS * (self.reply_tokens // len(REPLY_WORDS) + 1))[: self.reply_tokens]
+        return [w if i == 0 else " " + w for i, w in enumerate(words)]
+
+
+def build_app(config: StubConfig) -> Starlette:
+    def unavailable(service: str) -> Response:
+        return JSONResponse({"error": f"{service} stub: injected failure"}, status_code=503)
+
+    # ----- Groq (OpenAI-compatible) -----
+    async def groq_chat(request: Request) -> Response:
+        body = await request.json()
+        if config.should_fail("groq"):
+            await config.delay("groq")
+            return unavailable("groq")
+        await config.delay("groq")
+        model = body.get("model", "stub")
+        created = int(time.time())
+        words = config.reply_words()
+
+        if not body.get("stream"):
+            return JSONResponse({
+                "id": "chatcmpl-stub",
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "".join(words)},
+                    "finish_reason": "stop",
+                }],
+                "usage": {"prompt_tokens": 10, "completion_tokens": len(words), "total_tokens": 10 + len(words)},
+            })
+
+        async def events() -> AsyncIterator[str]:
+            for word in words:
+                chunk = {
+                    "id": "chatcmpl-stub",
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {"content": word}, "finish_reason": None}],
+                }
+                yield f"data: {json.dumps(chunk)}\n\n"
+                if config.token_delay_ms:
+                    await asyncio.sleep(config.token_delay_ms / 1000)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    # ----- Ollama -----
+    async def ollama_generate(request: Request) -> Response:
+        body = await request.json()
+        if config.should_fail("ollama"):
+            await config.delay("ollama")
+            return unavailable("ollama")
+        await config.delay("ollama")
+        words = config.reply_words()
+        done = {
+            "model": body.get("model", "stub"),
+            "done": True,
+            "total_duration": 0,
+            "load_duration": 0,
+            "prompt_eval_count": len((body.get("prompt") or "").split()),
+            "eval_count": len(words),
+            "context": [*body.get("context", []), *range(len(words))],
+        }
+
+        if body.get("stream") is False:
+            return JSONResponse({**done, "response": "".join(words)})
+
+        async def lines() -> AsyncIterator[str]:
+            for word in words:
+                yield json.dumps({"model": done["model"], "response": word, "done": False}) + "\n"
+                if config.token_delay_ms:
+                    await asyncio.sleep(config.token_delay_ms / 1000)
+            yield json.dumps({**done, "response": ""}) + "\n"
+
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+    # ----- Overpass -----
+    async def overpass(request: Request) -> Response:
+        query = (await request.body()).decode("utf-8", "replace")
+        if config.should_fail("overpass"):
+            await config.delay("overpass")
+            return unavailable("overpass")
+        await config.delay("overpass")
+        match = _AROUND_RE.search(query)
+        if not match:
+            return JSONResponse({"elements": []})
+        radius, lat, lng = (float(g) for g in match.groups())
+        # Deterministic per query point so repeated runs see the same data
+        rng = random.Random(f"{lat:.4f},{lng:.4f},{radius:.0f}")
+        elements = []
+        for i in range(config.hospitals):
+            distance = radius * math.sqrt(rng.random())
+            bearing = rng.uniform(0, 2 * math.pi)
+            dlat = distance * math.cos(bearing) / 111320.0
+            dlng = distance * math.sin(bearing) / (111320.0 * max(0.01, math.cos(math.radians(lat))))
+            elements.append({
+                "type": "node",
+                "id": rng.randrange(10 ** 9),
+                "lat": lat + dlat,
+                "lon": lng + dlng,
+                "tags": {"amenity": "hospital", "name": f"Stub Hospital {i + 1}", "addr:city": "Stubville"},
+            })
+        return JSONResponse({"elements": elements})
+
+    async def stats(request: Request) -> Response:
+        return JSONResponse({"calls": dict(config.calls), "failures": dict(config.failures)})
+
+    return Starlette(routes=[
+        Route("/openai/v1/chat/completions", groq_chat, methods=["POST"]),
+        Route("/api/generate", ollama_generate, methods=["POST"]),
+        Route("/api/interpreter", overpass, methods=["POST"]),
+        Route("/stats", stats, methods=["GET"]),
+    ])
+
+
+def add_stub_arguments(parser: argparse.ArgumentParser) -> None:
+    for service, latency in (("groq", 300.0), ("ollama", 800.0), ("overpass", 500.0)):
+        parser.add_argument(f"--{service}-latency-ms", type=float, default=latency)
+        parser.add_argument(f"--{service}-failure-rate", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.2, help="± fraction of latency")
+    parser.add_argument("--token-delay-ms", type=float, default=5.0, help="gap between streamed tokens")
+    parser.add_argument("--reply-tokens", type=int, default=40)
+    parser.add_argument("--hospitals", type=int, default=25, help="hospitals per Overpass answer")
+    parser.add_argument("--seed", type=int, default=1234)
+
+
+def main_cli(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    add_stub_arguments(parser)
+    args = parser.parse_args(argv)
+    uvicorn.run(build_app(StubConfig(args)), host=args.host, port=args.port, log_level="warning")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
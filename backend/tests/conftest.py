@@ -0,0 +1,30 @@
+"""
+Shared test setup. backend/app uses flat imports (`from db import ...`), so
+it goes on sys.path, and the app is pointed at a throwaway SQLite file
+before anything imports db.
+"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+APP_DIR = Path(__file__).resolve().parent.parent / "app"
+
+os.environ.setdefault(
+    "SAFELINK_DB_PATH", str(Path(tempfile.mkdtemp(prefix="safelink-test-")) / "test.db")
+)
+if str(APP_DIR) not in sys.path:
+    sys.path.insert(0, str(APP_DIR))
+
+
+@pytest.fixture(scope="session")
+def migrated_db():
+    """The throwaway SQLite database, migrated to the current schema."""
+    from db import get_db
+    from migrations import migrate
+
+    with get_db() as conn:
+        migrate(conn)
+    return os.environ["SAFELINK_DB_PATH"]
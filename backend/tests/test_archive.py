@@ -0,0 +1,102 @@
+"""Archival: reads continue into the archive, and nothing heavy runs by default."""
+import asyncio
+import sqlite3
+
+import pytest
+
+import archive
+import db
+import main
+import storage
+from migrations import migrate
+
+DAY_MS = archive.DAY_MS
+
+
+@pytest.fixture()
+def fresh_db(tmp_path, monkeypatch):
+    original = db.db_pool.path
+    db.db_pool.close()
+    db.db_pool.path = tmp_path / "archive.db"
+    monkeypatch.setattr(archive, "ARCHIVE_DIR", tmp_path / "archive")
+    monkeypatch.setattr(archive, "_segments_seen", {})
+    yield db.db_pool.path
+    db.db_pool.close()
+    db.db_pool.path = original
+
+
+def _migrate():
+    with db.get_db() as conn:
+        migrate(conn)
+
+
+def _seed(user_id: int, old: int, new: int) -> None:
+    """`old` messages past the chat retention window, then `new` recent ones."""
+    _, now_ts = db.utc_now()
+    aged = now_ts - 400 * DAY_MS
+    rows = [(user_id, "user", f"old {i}", "t", aged + i) for i in range(old)]
+    rows += [(user_id, "user", f"new {old + i}", "t", now_ts - new + i) for i in range(new)]
+    storage.write_rows({"chat_messages": rows})
+
+
+def _page(limit, after=None):
+    return asyncio.run(main.history_page("chat_messages", 1, limit, after))
+
+
+def test_history_pages_continue_into_the_archive(fresh_db):
+    _migrate()
+    _seed(1, old=5, new=3)
+    assert archive.has_archived("chat_messages") is False
+    summary = archive.run_maintenance()
+    assert summary["archived"]["chat_messages"] == 5
+    assert archive.archived_hint("chat_messages") is True
+
+    seen, after = [], None
+    while True:
+        rows = _page(3, after)
+        seen += [r["content"] for r in rows]
+        if len(rows) < 3:
+            break
+        after = (rows[-1]["created_ts"], rows[-1]["id"])
+    assert seen == [f"new {i}" for i in (7, 6, 5)] + [f"old {i}" for i in (4, 3, 2, 1, 0)]
+
+
+def test_short_pages_skip_the_archive_until_it_has_rows(fresh_db, monkeypatch):
+    _migrate()
+    _seed(1, old=0, new=2)
+    calls = []
+    monkeypatch.setattr(archive, "read_history", lambda *a: calls.append(a) or [])
+    monkeypatch.setattr(archive, "has_archived", _counting(archive.has_archived, calls))
+
+    for _ in range(5):
+        assert len(_page(10)) == 2
+    # One segments lookup, cached after that; no archive reads at all
+    assert calls == ["has_archived"]
+
+
+def _counting(fn, calls):
+    def wrapper(table):
+        calls.append("has_archived")
+        return fn(table)
+
+    return wrapper
+
+
+def test_no_full_vacuum_unless_asked(fresh_db):
+    # A database from before incremental auto-vacuum
+    conn = sqlite3.connect(fresh_db)
+    conn.execute("PRAGMA auto_vacuum = NONE")
+    conn.execute("CREATE TABLE filler (x)")
+    conn.commit()
+    conn.close()
+    _migrate()
+    _seed(1, old=4, new=1)
+
+    summary = archive.run_maintenance()
+    assert summary["compaction"]["auto_vacuum"] == 0
+    assert summary["compaction"]["full_vacuum"] is False
+
+    summary = archive.run_maintenance(full_vacuum=True)
+    assert summary["compaction"]["full_vacuum"] is True
+    with db.get_db() as conn:
+        assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
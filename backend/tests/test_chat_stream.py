@@ -0,0 +1,61 @@
+"""Streamed chat replies and the reply cache."""
+import asyncio
+
+import pytest
+
+import main
+from reply_cache import ReplyCache
+from scheduler import Provider, ProviderScheduler
+
+QUESTION = "how do I treat a cold at home"
+
+
+async def _unused_call(messages):
+    raise RuntimeError("not called")
+
+
+def _stream(tokens, fail_after=None):
+    async def stream(messages):
+        for i, token in enumerate(tokens):
+            if i == fail_after:
+                raise RuntimeError("connection reset")
+            yield token
+
+    return stream
+
+
+@pytest.fixture
+def chat(monkeypatch):
+    """Installs a scheduler over the given stream and a fresh reply cache."""
+    cache = ReplyCache(persist=False)
+    monkeypatch.setattr(main, "REPLY_CACHE_ENABLED", True)
+    monkeypatch.setattr(main, "reply_cache", cache)
+
+    def install(stream):
+        provider = Provider("Groq", _unused_call, stream=stream)
+        monkeypatch.setattr(main, "chat_scheduler", ProviderScheduler([provider], hedge=False))
+        return cache
+
+    return install
+
+
+def _reply(question=QUESTION) -> str:
+    async def collect():
+        return "".join([t async for t in main.stream_chat_reply(question)])
+
+    return asyncio.run(collect())
+
+
+def test_complete_stream_is_cached(chat):
+    cache = chat(_stream(["Drink ", "fluids and ", "rest."]))
+    assert _reply() == "Drink fluids and rest."
+    assert cache.get(QUESTION) == "Drink fluids and rest."
+
+
+def test_stream_cut_off_midway_is_not_cached(chat):
+    cache = chat(_stream(["Drink ", "fluids and", "rest."], fail_after=2))
+    before = main.CHAT_REPLIES.labels("llm_stream").value
+
+    assert _reply() == "Drink fluids and" + main.CHAT_STREAM_CUT_OFF_NOTE
+    assert cache.get(QUESTION) is None
+    assert main.CHAT_REPLIES.labels("llm_stream").value == before
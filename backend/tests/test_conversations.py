@@ -0,0 +1,82 @@
+"""Per-worker chat contexts must not drift from what is stored."""
+import asyncio
+
+from conversations import ConversationStore
+from writer import WriteBehindQueue
+
+
+def pair(user_id, i, ts):
+    return [
+        (user_id, "user", f"question {i}", "t", ts),
+        (user_id, "assistant", f"answer {i}", "t", ts),
+    ]
+
+
+def stored(rows):
+    """recent_chat_messages shape: newest first."""
+    return [{"role": r[1], "content": r[2], "created_ts": r[4]} for r in reversed(rows)]
+
+
+def contents(messages):
+    return [m["content"] for m in messages]
+
+
+def test_context_older_than_storage_is_reseeded():
+    worker_a, worker_b = ConversationStore(), ConversationStore()
+    table = pair(1, 0, 1000)
+    worker_a.seed(1, stored(table))
+    worker_b.seed(1, stored(table))
+
+    # Worker B answers the next turn; A's copy is now behind storage
+    turn = pair(1, 1, 2000)
+    worker_b.record(1, turn)
+    table += turn
+
+    assert worker_a.cached(1, stored_ts=2000) is None
+    assert worker_a.stale == 1
+    messages = worker_a.seed(1, stored(table))
+    assert contents(messages) == contents(worker_b.cached(1, stored_ts=2000))
+    assert contents(messages)[-1] == "answer 1"
+
+
+def test_own_turns_keep_the_context_fresh():
+    store = ConversationStore()
+    store.seed(1, stored(pair(1, 0, 1000)))
+    store.record(1, pair(1, 1, 2000))
+    # Storage caught up with our own write, or has not yet
+    assert store.cached(1, stored_ts=2000) is not None
+    assert store.cached(1, stored_ts=1000) is not None
+    assert store.cached(1) is not None
+    assert store.stale == 0
+
+
+def test_seed_includes_rows_still_in_the_write_queue():
+    store = ConversationStore()
+    queued = pair(1, 1, 2000)
+    messages = store.seed(1, stored(pair(1, 0, 1000)), pending=queued + pair(1, 0, 1000))
+    assert contents(messages) == ["question 0", "answer 0", "question 1", "answer 1"]
+
+
+def test_write_queue_pending_rows():
+    committed = []
+
+    async def sink(batch):
+        await asyncio.sleep(0.01)
+        committed.append(batch)
+
+    async def scenario():
+        queue = WriteBehindQueue(max_batch=1)
+        queue.bind(sink)
+        queue.start()
+        await queue.enqueue("chat_messages", pair(1, 0, 1000))
+        await queue.enqueue("chat_messages", pair(2, 0, 1000))
+        await queue.enqueue("symptom_checks", [(1, 30)])
+        pending = queue.pending("chat_messages", 1)
+        await queue.stop()
+        return pending, queue.pending("chat_messages", 1), queue
+
+    pending, after, queue = asyncio.run(scenario())
+    assert [r[2] for r in pending] == ["question 0", "answer 0"]
+    assert after == []
+    assert queue.pending("chat_messages", 2) == []
+    assert len(committed) == 3
@@ -0,0 +1,83 @@
+"""The local hospital index only answers for areas it has fetched in full."""
+import asyncio
+
+import pytest
+
+import hospitals
+
+CENTER = (40.0, -75.0)
+
+
+def _hospital(key: str, lat: float, lng: float) -> dict:
+    return {"osm_key": key, "place_id": key, "name": key, "address": key, "lat": lat, "lng": lng}
+
+
+@pytest.fixture()
+def upstream(migrated_db, monkeypatch):
+    """Fake Overpass holding one hospital ~1 km and one ~15 km from CENTER."""
+    from db import get_db
+
+    with get_db() as conn:
+        conn.execute("DELETE FROM hospital_coverage")
+        conn.execute("DELETE FROM hospitals_rtree")
+        conn.execute("DELETE FROM hospitals")
+    hospitals._rtree_available = None
+    hospitals.hospital_tile_cache = hospitals.TileCache()
+    world = [_hospital("node/near", 40.009, -75.0), _hospital("node/far", 40.135, -75.0)]
+    calls = []
+
+    async def fetch_overpass(lat, lng, radius_m):
+        calls.append(radius_m)
+        return hospitals.rank(world, lat, lng, radius_m, limit=1000)
+
+    monkeypatch.setattr(hospitals, "fetch_overpass", fetch_overpass)
+    return calls
+
+
+def test_wider_query_than_fetched_goes_upstream(upstream):
+    asyncio.run(hospitals.lookup_upstream(*CENTER, 2000))
+    found, covered = hospitals.nearest(*CENTER, 2000)
+    assert [h["osm_key"] for h in found] == ["node/near"]
+    assert covered is not None
+
+    found, covered = hospitals.nearest(*CENTER, 20000)
+    assert [h["osm_key"] for h in found] == ["node/near"]
+    assert covered is None
+
+    found = asyncio.run(hospitals.lookup_upstream(*CENTER, 20000))
+    assert [h["osm_key"] for h in found] == ["node/near", "node/far"]
+    found, covered = hospitals.nearest(*CENTER, 20000)
+    assert [h["osm_key"] for h in found] == ["node/near", "node/far"]
+    assert covered is not None
+    assert len(upstream) == 2
+
+
+def test_empty_fetch_still_counts_as_covered(upstream):
+    asyncio.run(hospitals.lookup_upstream(10.0, 10.0, 5000))
+    found, covered = hospitals.nearest(10.0, 10.0, 5000)
+    assert found == []
+    assert covered is not None
+
+
+def test_wider_coverage_replaces_contained_circles(upstream):
+    from db import get_db
+
+    hospitals.upsert([], covers=(*CENTER, 1000))
+    hospitals.upsert([], covers=(40.001, -75.0, 500))
+    hospitals.upsert([], covers=(*CENTER, 10000))
+    with get_db() as conn:
+        radii = [r[0] for r in conn.execute("SELECT radius_m FROM hospital_coverage")]
+    assert radii == [10000]
+
+
+def test_import_covers_its_extent(upstream, tmp_path):
+    path = tmp_path / "h.geojson"
+    path.write_text(
+        '{"features": ['
+        '{"id": "a", "properties": {"name": "A"}, "geometry": {"type": "Point", "coordinates": [-75.0, 40.0]}},'
+        '{"id": "b", "properties": {"name": "B"}, "geometry": {"type": "Point", "coordinates": [-74.9, 40.1]}}'
+        "]}"
+    )
+    assert hospitals.import_file(str(path)) == 2
+    assert hospitals.nearest(40.05, -74.95, 1000)[1] is not None
+    assert hospitals.nearest(40.05, -74.95, 50000)[1] is None
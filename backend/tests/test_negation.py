@@ -0,0 +1,78 @@
+"""
+Negation discounts denied symptoms ("no chest pain") but must not hide
+one the user has ("never had chest pain this bad").
+"""
+import pytest
+
+from keywords import KeywordEngine
+from rules import RULES_PATH, load_rules
+
+RULES = load_rules(RULES_PATH)
+
+EMERGENCY_PHRASINGS = [
+    "I have never had chest pain this bad",
+    "never felt chest pain like this before",
+    "I don't know why but I have chest pain",
+    "not sure, chest pain started an hour ago",
+    "no idea what is happening, I can't breathe",
+    "my dad is not responding, I think it is a stroke",
+    "he denies it but he had a seizure",
+]
+
+
+@pytest.mark.parametrize("text", EMERGENCY_PHRASINGS)
+def test_emergency_is_not_negated(text):
+    assert RULES.is_emergency(text)
+
+
+@pytest.mark.parametrize("text", [
+    "I have never had chest pain this bad",
+    "not sure why but I have shortness of breath",
+    "no one noticed the blue lips at first",
+    "never been this confused, confusion all morning",
+])
+def test_high_risk_symptom_is_not_negated(text):
+    result = RULES.evaluate(None, None, text)
+    assert result.risk_level == "High"
+    assert result.risk_score >= 25
+    assert any(f.startswith("High-risk symptom") for f in result.flags)
+
+
+@pytest.mark.parametrize("text, flag", [
+    ("no fever but a bad cough", "Medium-risk symptom: cough"),
+    ("denies headache, some fatigue", "Medium-risk symptom: fatigue"),
+])
+def test_medium_risk_negation_still_applies(text, flag):
+    result = RULES.evaluate(None, None, text)
+    assert result.flags == [flag]
+    assert result.risk_level == "Low"
+
+
+@pytest.mark.parametrize("text", [
+    "no chest pain",
+    "I do not have chest pain",
+    "never had chest pain",
+    "denies chest pain or shortness of breath",
+])
+def test_denied_emergency_symptom_is_negated(text):
+    assert not RULES.is_emergency(text)
+    result = RULES.evaluate(None, None, text)
+    assert result.risk_level == "Low"
+    assert not any(f.startswith("High-risk symptom") for f in result.flags)
+
+
+def test_never_comparison_keeps_any_keyword():
+    engine = KeywordEngine()
+    engine.add("fever", "mild")
+    assert engine.terms(engine.scan("never had a fever this high"), "mild") == ["fever"]
+    assert engine.terms(engine.scan("never had a fever"), "mild") == []
+    # Only "never" reads as a comparison; "no fever this bad" is still a denial
+    assert engine.terms(engine.scan("no fever this bad"), "mild") == []
+
+
+def test_pseudo_negation_does_not_negate():
+    engine = KeywordEngine()
+    engine.add("cough", "mild")
+    assert engine.terms(engine.scan("not sure, cough since monday"), "mild") == ["cough"]
+    assert engine.terms(engine.scan("not sure it's a cough"), "mild") == ["cough"]
+    assert engine.terms(engine.scan("not sure but no cough"), "mild") == []
@@ -0,0 +1,46 @@
+"""The ops pages (/metrics, /api/*-stats) are not public."""
+import pytest
+from fastapi import HTTPException
+
+import main
+
+OPS_ROUTES = [
+    "/metrics", "/api/db-stats", "/api/hospital-stats",
+    "/api/auth-stats", "/api/llm-stats", "/api/rules-stats",
+]
+
+
+def status(authorization):
+    try:
+        main.require_ops_token(authorization=authorization)
+    except HTTPException as e:
+        return e.status_code
+    return 200
+
+
+def test_ops_routes_require_the_token():
+    for route in main.app.routes:
+        if getattr(route, "path", None) in OPS_ROUTES:
+            calls = [d.call for d in route.dependant.dependencies]
+            assert main.require_ops_token in calls, route.path
+
+
+def test_switched_off_without_a_token(monkeypatch):
+    monkeypatch.setattr(main, "OPS_TOKEN", "")
+    assert status(None) == 404
+    assert status("Bearer anything") == 404
+
+
+def test_token_checks(monkeypatch):
+    monkeypatch.setattr(main, "OPS_TOKEN", "s3cret")
+    assert status("Bearer s3cret") == 200
+    assert status("bearer s3cret ") == 200
+    for bad in (None, "", "Bearer", "Bearer wrong", "Basic s3cret", "s3cret"):
+        assert status(bad) == 401, bad
+
+
+@pytest.mark.usefixtures("migrated_db")
+def test_db_stats_do_not_expose_filesystem_paths():
+    stats = main.db_stats()
+    assert str(main.db_pool.path) not in repr(stats)
+    assert "dir" not in stats.get("archive", {})
@@ -0,0 +1,186 @@
+"""
+rules.json must score exactly like the hard-coded rules it replaced, and a
+bad edit must never take the live rules down.
+"""
+import itertools
+import json
+import os
+import time
+
+import pytest
+
+from keywords import KeywordEngine
+from rules import NO_FLAGS_MESSAGE, RULES_PATH, RuleBook, RuleError, load_rules
+
+# ---------- The scorer as it was before rules.json (negation fix included) ----------
+HIGH_RISK_KEYWORDS = [
+    "chest pain", "difficulty breathing", "shortness of breath", "blue lips", "high fever", "confusion",
+]
+MEDIUM_RISK_KEYWORDS = [
+    "fever", "cough", "sore throat", "body pain", "fatigue", "headache", "loss of smell", "loss of taste",
+]
+RISK_ADVICE = {
+    "High": (
+        "Your symptoms may indicate a higher-risk situation. "
+        "Consider seeking immediate medical attention or contacting your doctor. "
+        "If you have severe chest pain, trouble breathing, or confusion, call emergency services."
+    ),
+    "Medium": (
+        "Your symptoms suggest a moderate level of concern. "
+        "Monitor your condition, rest, stay hydrated, and contact a healthcare provider "
+        "if symptoms worsen or persist."
+    ),
+    "Low": (
+        "Your symptoms currently appear mild. Rest, drink fluids, and watch for changes. "
+        "If you feel worse, contact a medical professional."
+    ),
+}
+
+_engine = KeywordEngine()
+_engine.add_all(HIGH_RISK_KEYWORDS, "high")
+_engine.add_all(MEDIUM_RISK_KEYWORDS, "medium")
+_engine.build()
+
+
+def reference(age, temperature, text):
+    flags = []
+    score = 0
+    if temperature:
+        if temperature >= 102:
+            flags.append("High fever")
+            score += 30
+        elif temperature >= 100.4:
+            flags.append("Mild fever")
+            score += 15
+    if age:
+        if age >= 65:
+            flags.append("Older age (65+)")
+            score += 15
+        elif age <= 5:
+            flags.append("Young age (≤5)")
+            score += 15
+    matches = _engine.scan(text.lower())
+    high = _engine.terms(matches, "high")
+    medium = _engine.terms(matches, "medium")
+    flags += [f"High-risk symptom: {k}" for k in high] + [f"Medium-risk symptom: {k}" for k in medium]
+    score = max(0, min(100, score + 25 * len(high) + 10 * len(medium)))
+    level = "High" if score >= 60 or high else "Medium" if score >= 30 else "Low"
+    return level, score, RISK_ADVICE[level], flags or [NO_FLAGS_MESSAGE]
+
+
+# ---------- Parity ----------
+AGES = [None, 0, 1, 4, 5, 6, 40, 64, 65, 66, 100]
+TEMPERATURES = [None, 0.0, 97.0, 100.39, 100.4, 100.41, 101.99, 102.0, 102.01, 106.0]
+PHRASES = [
+    "", "feeling fine", "chest pain", "no chest pain", "never had chest pain this bad",
+    "difficulty breathing", "shortness of breath", "blue lips", "high fever", "confusion",
+    "fever", "no fever", "feverish", "cough", "coughing", "doesn't cough", "sore throat",
+    "body pain", "fatigue", "headache", "headaches", "denies headache", "loss of smell",
+    "loss of taste", "high fever and chest pain", "fever, cough and fatigue",
+    "no fever but cough", "sore throat, headache, body pain and loss of taste",
+    "CHEST PAIN", "mild headache; no cough",
+]
+
+
+@pytest.fixture(scope="module")
+def shipped():
+    return load_rules(RULES_PATH)
+
+
+def test_shipped_rules_match_reference_grid(shipped):
+    mismatches = []
+    for age, temperature, text in itertools.product(AGES, TEMPERATURES, PHRASES):
+        got = tuple(shipped.evaluate(age, temperature, text))
+        want = reference(age, temperature, text)
+        if got != want:
+            mismatches.append(((age, temperature, text), got, want))
+    assert not mismatches, mismatches[:5]
+
+
+def test_keyword_pairs_match_reference(shipped):
+    keywords = HIGH_RISK_KEYWORDS + MEDIUM_RISK_KEYWORDS
+    for a, b in itertools.combinations(keywords, 2):
+        text = f"{a} and {b}"
+        assert tuple(shipped.evaluate(70, 101.0, text)) == reference(70, 101.0, text), text
+
+
+def test_api_uses_the_rule_book(shipped):
+    import main
+
+    for age, temperature, text in [(70, 102.0, "chest pain"), (None, None, "cough"), (3, 100.5, "")]:
+        result = main.analyze_symptoms(
+            main.SymptomCheckRequest(age=age, temperature=temperature, symptoms_text=text)
+        )
+        assert (result.risk_level, result.risk_score, result.advice, result.detected_flags) == reference(
+            age, temperature, text
+        )
+
+
+# ---------- Reloads ----------
+@pytest.fixture()
+def rule_file(tmp_path):
+    path = tmp_path / "rules.json"
+    path.write_text(RULES_PATH.read_text(encoding="utf-8"), encoding="utf-8")
+    return path
+
+
+def _write(path, text):
+    # Atomic replace, as the README asks, with a visibly newer mtime
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(text, encoding="utf-8")
+    os.replace(tmp, path)
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+
+@pytest.mark.parametrize("bad", [
+    "{ not json",
+    json.dumps({"version": 2}),
+    json.dumps({**json.loads(RULES_PATH.read_text(encoding="utf-8")), "symptoms": {"levels": []}}),
+])
+def test_bad_reload_keeps_previous_rules(rule_file, bad):
+    book = RuleBook(rule_file, check_interval=0)
+    before = book.current()
+    _write(rule_file, bad)
+    assert book.reload() is before
+    assert book.current() is before
+    assert book.errors == 1
+    assert book.last_error
+    assert tuple(before.evaluate(70, 102.0, "chest pain")) == reference(70, 102.0, "chest pain")
+
+
+def test_hot_reload_swaps_valid_rules_and_skips_bad_ones(rule_file):
+    book = RuleBook(rule_file, check_interval=0.01)
+    original = book.current()
+    doc = json.loads(rule_file.read_text(encoding="utf-8"))
+
+    _write(rule_file, "{ broken")
+    time.sleep(0.02)
+    book.current()
+    _wait_for(lambda: book.errors == 1)
+    assert book.current() is original
+
+    doc["version"] = 2
+    doc["symptoms"]["keyword_groups"][1]["weight"] = 20
+    _write(rule_file, json.dumps(doc))
+    time.sleep(0.02)
+    book.current()
+    _wait_for(lambda: book.reloads == 1)
+    assert book.current().version == 2
+    assert book.current().evaluate(None, None, "cough").risk_score == 20
+    assert book.last_error is None
+
+
+def test_invalid_level_is_a_rule_error(rule_file):
+    doc = json.loads(rule_file.read_text(encoding="utf-8"))
+    doc["symptoms"]["keyword_groups"][0]["min_level"] = "Critical"
+    _write(rule_file, json.dumps(doc))
+    with pytest.raises(RuleError, match="min_level"):
+        load_rules(rule_file)
+
+
+def _wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "rule book did not reload in time"
+        time.sleep(0.01)
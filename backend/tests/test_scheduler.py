@@ -0,0 +1,171 @@
+"""
+ProviderScheduler: hedged calls, streaming failover and the circuit breaker.
+"""
+import asyncio
+
+import pytest
+
+import scheduler
+from scheduler import CircuitBreaker, Provider, ProviderScheduler, StreamInterrupted
+
+MESSAGES = [{"role": "user", "content": "hi"}]
+
+
+def replying(text, delay=0.0):
+    async def call(messages):
+        await asyncio.sleep(delay)
+        return text
+
+    return call
+
+
+def failing(delay=0.0):
+    async def call(messages):
+        await asyncio.sleep(delay)
+        raise RuntimeError("upstream down")
+
+    return call
+
+
+def streaming(tokens, fail_after=None):
+    async def stream(messages):
+        for i, token in enumerate(tokens):
+            if i == fail_after:
+                raise RuntimeError("connection reset")
+            yield token
+        if fail_after == len(tokens):
+            raise RuntimeError("connection reset")
+
+    return stream
+
+
+def collect(sched):
+    async def main():
+        tokens = []
+        try:
+            async for token in sched.stream(MESSAGES):
+                tokens.append(token)
+        except StreamInterrupted as e:
+            return tokens, e
+        return tokens, None
+
+    return asyncio.run(main())
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(scheduler.time, "monotonic", lambda: now[0])
+    return now
+
+
+# ---------- Circuit breaker ----------
+def test_breaker_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=30)
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.allow()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.times_opened == 1
+    assert not breaker.allow()
+
+
+def test_breaker_half_open_probe_reopens_or_closes(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=30)
+    breaker.record_failure()
+    clock[0] += 29
+    assert not breaker.allow()
+
+    clock[0] += 2
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()  # one probe at a time
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.times_opened == 2
+
+    clock[0] += 31
+    assert breaker.allow()
+    breaker.release_probe()  # a cancelled probe frees the slot
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.failures == 0
+    assert breaker.allow() and breaker.allow()
+
+
+# ---------- run() ----------
+def test_run_skips_open_provider_and_fails_over():
+    primary = Provider("A", failing())
+    secondary = Provider("B", replying("from B"))
+    tertiary = Provider("C", replying("from C"))
+    primary.breaker.failure_threshold = 1
+    sched = ProviderScheduler([primary, secondary, tertiary], hedge=False)
+
+    assert asyncio.run(sched.run(MESSAGES)) == ("B", "from B")
+    assert primary.failures == 1 and primary.breaker.state == CircuitBreaker.OPEN
+
+    assert asyncio.run(sched.run(MESSAGES)) == ("B", "from B")
+    assert primary.skipped_open == 1 and primary.failures == 1
+
+
+def test_run_returns_none_when_every_provider_fails():
+    sched = ProviderScheduler([Provider("A", failing()), Provider("B", failing())], hedge=False)
+    assert asyncio.run(sched.run(MESSAGES)) is None
+    assert sched.exhausted == 1
+
+
+def test_hedge_launches_after_delay_and_faster_reply_wins(monkeypatch):
+    monkeypatch.setattr(scheduler, "LLM_HEDGE_DELAY_MS", "20")
+    monkeypatch.setattr(scheduler, "LLM_HEDGE_MIN_MS", 1.0)
+    slow = Provider("A", replying("from A", delay=1.0))
+    fast = Provider("B", replying("from B", delay=0.01))
+    sched = ProviderScheduler([slow, fast], hedge=True)
+
+    assert asyncio.run(sched.run(MESSAGES)) == ("B", "from B")
+    assert (sched.hedges, fast.hedged_launches, fast.wins) == (1, 1, 1)
+    # The cancelled primary is neither a win nor a failure
+    assert (slow.wins, slow.failures, slow.breaker.failures) == (0, 0, 0)
+
+
+def test_no_hedge_when_primary_answers_in_time(monkeypatch):
+    monkeypatch.setattr(scheduler, "LLM_HEDGE_DELAY_MS", "500")
+    primary = Provider("A", replying("from A", delay=0.01))
+    backup = Provider("B", replying("from B"))
+    sched = ProviderScheduler([primary, backup], hedge=True)
+
+    assert asyncio.run(sched.run(MESSAGES)) == ("A", "from A")
+    assert sched.hedges == 0 and backup.hedged_launches == 0
+
+
+# ---------- stream() ----------
+def test_stream_fails_over_before_the_first_token():
+    broken = Provider("A", failing(), stream=streaming(["x"], fail_after=0))
+    backup = Provider("B", failing(), stream=streaming(["Drink ", "fluids."]))
+    sched = ProviderScheduler([broken, backup])
+
+    assert collect(sched) == (["Drink ", "fluids."], None)
+    assert broken.failures == 1 and backup.wins == 1
+
+
+def test_stream_failure_after_first_token_raises_and_counts_as_failure():
+    flaky = Provider("A", failing(), stream=streaming(["Drink ", "fluids and", "rest."], fail_after=2))
+    backup = Provider("B", failing(), stream=streaming(["never used"]))
+    flaky.breaker.failure_threshold = 1
+    sched = ProviderScheduler([flaky, backup])
+
+    tokens, error = collect(sched)
+    assert tokens == ["Drink ", "fluids and"]
+    assert isinstance(error, StreamInterrupted) and error.provider == "A"
+    assert (flaky.failures, flaky.successes, flaky.wins) == (1, 0, 0)
+    assert flaky.breaker.state == CircuitBreaker.OPEN
+    assert backup.successes == 0
+
+
+def test_stream_yields_nothing_when_every_provider_fails():
+    sched = ProviderScheduler([Provider("A", failing(), stream=streaming([], fail_after=0))])
+    assert collect(sched) == ([], None)
+    assert sched.exhausted == 1
@@ -0,0 +1,31 @@
+"""Who the API thinks the caller is."""
+import os
+
+import pytest
+from fastapi import HTTPException
+
+import main
+import sessions
+from sessions import session_manager
+
+
+@pytest.mark.skipif(
+    bool(os.getenv("SESSION_ALLOW_USER_ID_HEADER")), reason="header opt-in set in the environment"
+)
+def test_user_id_header_is_ignored_by_default():
+    assert sessions.SESSION_ALLOW_USER_ID_HEADER is False
+    assert main.current_user_id(authorization=None, x_user_id=7) is None
+
+
+def test_bearer_token_wins():
+    token, _ = session_manager.issue(42)
+    assert main.current_user_id(authorization=f"Bearer {token}", x_user_id=7) == 42
+
+
+def test_user_id_header_when_opted_in(monkeypatch):
+    monkeypatch.setattr(main, "SESSION_ALLOW_USER_ID_HEADER", True)
+    assert main.current_user_id(authorization=None, x_user_id=7) == 7
+    for bad in (0, -1):
+        with pytest.raises(HTTPException) as exc:
+            main.current_user_id(authorization=None, x_user_id=bad)
+        assert exc.value.status_code == 400
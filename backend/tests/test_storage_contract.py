@@ -0,0 +1,333 @@
+"""
+One behavioural contract for every Storage backend.
+
+SQLite always runs; PostgreSQL runs against an embedded server from
+pgserver (pip install pgserver asyncpg) and is skipped when that is not
+installed. Each test gets a fresh database.
+"""
+import asyncio
+import itertools
+
+import pytest
+
+import db
+import storage
+from migrations import SCHEMA_VERSION as SQLITE_SCHEMA_VERSION
+
+ADVICE = "Rest and drink fluids."
+BASE_TS = 1_700_000_000_000
+_db_names = itertools.count()
+
+
+@pytest.fixture(scope="session")
+def pg_server(tmp_path_factory):
+    pgserver = pytest.importorskip("pgserver")
+    pytest.importorskip("asyncpg")
+    server = pgserver.get_server(str(tmp_path_factory.mktemp("pgdata")), cleanup_mode="stop")
+    yield server
+    server.cleanup()
+
+
+@pytest.fixture(params=["sqlite", "postgres"])
+def backend(request, tmp_path):
+    """A factory for fresh Storage instances on one empty database."""
+    if request.param == "sqlite":
+        original = db.db_pool.path
+        db.db_pool.close()
+        db.db_pool.path = tmp_path / "contract.db"
+        yield storage.SQLiteStorage
+        db.db_pool.close()
+        db.db_pool.path = original
+        return
+
+    from storage_postgres import PostgresStorage
+
+    server = request.getfixturevalue("pg_server")
+    name = f"safelink_contract_{next(_db_names)}"
+    server.psql(f"CREATE DATABASE {name};")
+    dsn = server.get_uri().replace("/postgres?", f"/{name}?")
+    yield lambda: PostgresStorage(dsn, min_size=1, max_size=4)
+    server.psql(f"DROP DATABASE {name};")
+
+
+def run(make_storage, scenario):
+    async def main():
+        store = make_storage()
+        await store.start()
+        try:
+            return await scenario(store)
+        finally:
+            await store.close()
+
+    return asyncio.run(main())
+
+
+def symptom_row(user_id, i, text, level="Low", score=10, flags=()):
+    ts = BASE_TS + i * 1000
+    return (user_id, 30, 98.6, text, level, score, ADVICE, f"t{i}", ts, tuple(flags))
+
+
+def chat_row(user_id, i, role, content):
+    return (user_id, role, content, f"t{i}", BASE_TS + i * 1000)
+
+
+async def _all_pages(store, table, user_id, limit):
+    seen, after = [], None
+    while True:
+        rows = await store.history_page(table, user_id, limit + 1, after)
+        seen.extend(rows[:limit])
+        if len(rows) <= limit:
+            return seen
+        after = (rows[limit - 1]["created_ts"], rows[limit - 1]["id"])
+
+
+def test_schema_is_current_and_start_is_idempotent(backend):
+    async def scenario(store):
+        if store.name == "postgres":
+            from storage_postgres import SCHEMA_VERSION
+
+            async with store.pool.acquire() as conn:
+                await store._migrate()
+                versions = await conn.fetch("SELECT version FROM safelink_schema ORDER BY version")
+            assert [r["version"] for r in versions] == list(range(1, SCHEMA_VERSION + 1))
+        else:
+            await store.start()
+            with db.get_db() as conn:
+                assert conn.execute("PRAGMA user_version").fetchone()[0] == SQLITE_SCHEMA_VERSION
+
+    run(backend, scenario)
+
+
+def test_users(backend):
+    async def scenario(store):
+        user_id = await store.create_user("a@example.com", "hash-1")
+        assert user_id is not None
+        assert await store.create_user("a@example.com", "hash-2") is None
+        row = await store.get_user_by_email("a@example.com")
+        assert (row["id"], row["password_hash"]) == (user_id, "hash-1")
+        await store.update_password_hash(user_id, "hash-3")
+        assert (await store.get_user_by_email("a@example.com"))["password_hash"] == "hash-3"
+        assert await store.get_user_by_email("b@example.com") is None
+
+    run(backend, scenario)
+
+
+def test_history_cursor_pages_and_stream(backend):
+    async def scenario(store):
+        await store.write_batch({
+            "symptom_checks": [symptom_row(1 + i % 2, i, f"check {i}") for i in range(25)],
+            "chat_messages": [chat_row(1, i, "user", f"message {i}") for i in range(7)],
+        })
+        paged = await _all_pages(store, "symptom_checks", 1, 4)
+        assert [r["symptoms_text"] for r in paged] == [f"check {i}" for i in range(24, -1, -2)]
+        assert all(r["advice"] == ADVICE for r in paged)
+        assert set(storage.HISTORY_COLUMNS["symptom_checks"]) <= set(paged[0].keys())
+
+        streamed = [r async for r in store.iter_history("symptom_checks", 1)]
+        assert [r["id"] for r in streamed] == [r["id"] for r in paged]
+        after = (paged[2]["created_ts"], paged[2]["id"])
+        tail = [r async for r in store.iter_history("symptom_checks", 1, 2, after)]
+        assert [r["id"] for r in tail] == [r["id"] for r in paged[3:5]]
+
+        chat = await store.history_page("chat_messages", 1, 100)
+        assert [r["content"] for r in chat] == [f"message {i}" for i in range(6, -1, -1)]
+        assert await store.history_page("chat_messages", 2, 100) == []
+
+    run(backend, scenario)
+
+
+def test_stream_reads_pages_without_holding_a_connection(backend, monkeypatch):
+    monkeypatch.setattr(storage, "HISTORY_STREAM_PAGE", 3)
+    try:
+        import storage_postgres
+    except ImportError:
+        pass
+    else:
+        monkeypatch.setattr(storage_postgres, "HISTORY_STREAM_PAGE", 3)
+
+    def checked_out(store) -> int:
+        if store.name == "postgres":
+            return store.read_pool.get_size() - store.read_pool.get_idle_size()
+        return len(db.db_pool._all) - len(db.db_pool._idle)
+
+    async def scenario(store):
+        # Same-timestamp pairs straddle page boundaries
+        rows = [chat_row(1, i // 2, "user", f"m{i}") for i in range(13)]
+        await store.write_batch({"chat_messages": rows})
+        paged = await _all_pages(store, "chat_messages", 1, 100)
+
+        streamed = []
+        async for row in store.iter_history("chat_messages", 1):
+            assert checked_out(store) == 0
+            streamed.append(row["id"])
+        assert streamed == [r["id"] for r in paged]
+
+        for limit in (3, 7):
+            limited = [r["id"] async for r in store.iter_history("chat_messages", 1, limit)]
+            assert limited == streamed[:limit]
+
+    run(backend, scenario)
+
+
+def test_same_timestamp_rows_page_by_id(backend):
+    async def scenario(store):
+        rows = [chat_row(1, 0, "user" if i % 2 == 0 else "assistant", f"m{i}") for i in range(9)]
+        await store.write_batch({"chat_messages": rows})
+        paged = await _all_pages(store, "chat_messages", 1, 2)
+        assert [r["content"] for r in paged] == [f"m{i}" for i in range(8, -1, -1)]
+
+    run(backend, scenario)
+
+
+def test_recent_chat_messages(backend):
+    async def scenario(store):
+        await store.write_batch({"chat_messages": [
+            chat_row(1, 0, "user", "first"),
+            chat_row(1, 1, "assistant", "second"),
+            chat_row(1, 2, "user", "third"),
+            chat_row(2, 3, "user", "someone else"),
+        ]})
+        rows = await store.recent_chat_messages(1, 2)
+        assert [(r["role"], r["content"], r["created_ts"]) for r in rows] == [
+            ("user", "third", BASE_TS + 2000), ("assistant", "second", BASE_TS + 1000),
+        ]
+        assert await store.latest_chat_ts(1) == BASE_TS + 2000
+        assert await store.latest_chat_ts(3) is None
+
+    run(backend, scenario)
+
+
+def test_trends(backend):
+    import trends
+
+    async def scenario(store):
+        _, now_ts = db.utc_now()
+        rows = [
+            (7, 30, 98.6, "cough", "Low", 10, ADVICE, "now", now_ts, ("Medium-risk symptom: cough",)),
+            (7, 70, 103.0, "fever", "High", 70, ADVICE, "now", now_ts,
+             ("High fever", "Medium-risk symptom: fever")),
+            (8, 30, None, "cough", "Medium", 30, ADVICE, "now", now_ts, ("Medium-risk symptom: cough",)),
+        ]
+        await store.write_batch({"symptom_checks": rows})
+        daily, flags = await store.symptom_trends(7, 7)
+        assert len(daily) == 1
+        assert (daily[0]["checks"], daily[0]["low"], daily[0]["high"]) == (2, 1, 1)
+        assert {f["flag"]: f["count"] for f in flags} == {
+            "Medium-risk symptom: cough": 1, "High fever": 1, "Medium-risk symptom: fever": 1,
+        }
+        daily, flags = await store.symptom_trends(trends.GLOBAL_USER_ID, 7)
+        assert daily[0]["checks"] == 3
+        assert flags[0] == {"flag": "Medium-risk symptom: cough", "count": 2}
+
+    run(backend, scenario)
+
+
+def test_search(backend):
+    import search
+
+    async def scenario(store):
+        await store.write_batch({
+            "symptom_checks": [
+                symptom_row(1, 0, "terrible headache since monday"),
+                symptom_row(1, 1, "sore throat"),
+                symptom_row(2, 2, "headache for another user"),
+            ],
+            "chat_messages": [
+                chat_row(1, 3, "user", "what helps a headache?"),
+                chat_row(1, 4, "assistant", "rest and fluids"),
+            ],
+        })
+        hits, cursor = await store.search_history(1, "headach", search.SOURCES, 10, None)
+        assert cursor is None
+        assert sorted((h["kind"], h["role"]) for h in hits) == [("chat", "user"), ("symptom", None)]
+        assert all(search.HIGHLIGHT_START in h["snippet"] for h in hits)
+
+        hits, _ = await store.search_history(1, "headache", ("symptom",), 10, None)
+        assert [h["kind"] for h in hits] == ["symptom"]
+        assert hits[0]["risk_level"] == "Low"
+
+        everything, _ = await store.search_history(1, "headache", search.SOURCES, 10, None)
+        first, cursor = await store.search_history(1, "headache", search.SOURCES, 1, None)
+        assert cursor is not None
+        second, cursor = await store.search_history(1, "headache", search.SOURCES, 1, cursor)
+        assert cursor is None
+        assert [(h["kind"], h["id"]) for h in first + second] == [
+            (h["kind"], h["id"]) for h in everything
+        ]
+
+        assert (await store.search_history(1, "nothing", search.SOURCES, 10, None)) == ([], None)
+
+    run(backend, scenario)
+
+
+def test_search_ranks_each_source_and_interleaves(backend):
+    import search
+
+    async def scenario(store):
+        await store.write_batch({
+            "symptom_checks": [
+                symptom_row(1, 0, "fever"),
+                symptom_row(1, 1, "fever and chills"),
+                # Another user's hits must neither show up nor skew the ranking
+                *(symptom_row(2, 10 + i, "fever fever fever") for i in range(20)),
+            ],
+            "chat_messages": [
+                *(chat_row(1, 2 + i, "user", f"fever again, day {i}") for i in range(5)),
+                chat_row(2, 30, "user", "what does u1 mean"),
+            ],
+        })
+        hits, cursor = await store.search_history(1, "fever", search.SOURCES, 10, None)
+        assert cursor is None
+        kinds = [h["kind"] for h in hits]
+        assert sorted(kinds[:2]) == sorted(kinds[2:4]) == ["chat", "symptom"]
+        assert kinds[4:] == ["chat"] * 3
+        # Scores are per source, scaled to that source's best hit
+        assert {h["score"] for h in hits[:2]} == {1.0}
+        assert all(0.0 <= h["score"] <= 1.0 for h in hits)
+
+        # The owner token is not searchable text
+        hits, _ = await store.search_history(2, "u1", search.SOURCES, 10, None)
+        assert [h["kind"] for h in hits] == ["chat"]
+        assert (await store.search_history(1, "u1", search.SOURCES, 10, None)) == ([], None)
+
+    run(backend, scenario)
+
+
+def test_postgres_v1_database_migrates_advice_to_codes(pg_server):
+    from storage_postgres import SCHEMA, PostgresStorage
+
+    name = f"safelink_contract_{next(_db_names)}"
+    pg_server.psql(f"CREATE DATABASE {name};")
+    dsn = pg_server.get_uri().replace("/postgres?", f"/{name}?")
+
+    async def scenario():
+        import asyncpg
+
+        conn = await asyncpg.connect(dsn)
+        try:
+            await conn.execute("CREATE TABLE safelink_schema (version INTEGER NOT NULL)")
+            for statement in SCHEMA[0][1]:
+                await conn.execute(statement)
+            await conn.execute("INSERT INTO safelink_schema (version) VALUES (1)")
+            await conn.execute(
+                "INSERT INTO symptom_checks (user_id, symptoms_text, risk_level, risk_score, advice, "
+                "created_at, created_ts) VALUES (1, 'legacy', 'Low', 0, $1, 't', $2)",
+                ADVICE, BASE_TS,
+            )
+        finally:
+            await conn.close()
+
+        store = PostgresStorage(dsn, min_size=1, max_size=2)
+        await store.start()
+        try:
+            rows = await store.history_page("symptom_checks", 1, 10)
+            raw = await store.pool.fetchrow("SELECT advice, advice_code FROM symptom_checks")
+        finally:
+            await store.close()
+        assert [r["advice"] for r in rows] == [ADVICE]
+        assert raw["advice"] is None and raw["advice_code"] is not None
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        pg_server.psql(f"DROP DATABASE {name};")
@@ -0,0 +1,75 @@
+"""analyze_symptoms_batch (NumPy) must agree with analyze_symptoms item for item."""
+import random
+
+import pytest
+from pydantic import ValidationError
+
+pytest.importorskip("numpy")
+
+import main
+from main import SymptomCheckRequest, analyze_symptoms, analyze_symptoms_batch
+
+SEED = 20240601
+
+# Band edges of rules.json plus values just either side of them
+AGES = [None, 0, 1, 4, 5, 6, 30, 64, 65, 66, 90, 150]
+TEMPERATURES = [None, 75.0, 96.0, 98.6, 100.3, 100.39, 100.4, 100.41, 101.9, 101.99, 102.0, 102.01, 115.0]
+PHRASES = [
+    "chest pain", "no chest pain", "never had chest pain this bad", "difficulty breathing",
+    "shortness of breath", "blue lips", "high fever", "confusion", "fever", "no fever",
+    "cough", "coughing", "sore throat", "body pain", "fatigue", "headache", "denies headache",
+    "loss of smell", "loss of taste", "runny nose", "feeling fine", "fever, but no cough",
+]
+
+
+def _random_intakes(n: int):
+    rng = random.Random(SEED)
+    return [
+        SymptomCheckRequest(
+            age=rng.choice(AGES),
+            temperature=rng.choice(TEMPERATURES),
+            symptoms_text=" and ".join(rng.sample(PHRASES, rng.randint(0, 5))),
+        )
+        for _ in range(n)
+    ]
+
+
+def _edge_intakes():
+    return [
+        SymptomCheckRequest(age=age, temperature=temp, symptoms_text=text)
+        for age in AGES
+        for temp in TEMPERATURES
+        for text in ("", "cough", "chest pain and fever")
+    ]
+
+
+@pytest.mark.parametrize("payloads", [_random_intakes(2000), _edge_intakes()], ids=["random", "edges"])
+def test_batch_matches_single(payloads):
+    batch = analyze_symptoms_batch(payloads)
+    assert len(batch) == len(payloads)
+    for payload, got in zip(payloads, batch):
+        want = analyze_symptoms(payload)
+        assert (got.risk_score, got.risk_level, got.detected_flags, got.advice) == (
+            want.risk_score, want.risk_level, want.detected_flags, want.advice
+        ), payload
+
+
+@pytest.mark.parametrize(
+    "field", [{"age": -1}, {"age": 151}, {"age": 10**20}, {"temperature": 74.9}, {"temperature": 1e308}]
+)
+def test_out_of_range_intake_is_rejected(field):
+    # FastAPI answers 422 before the check is scored or queued
+    with pytest.raises(ValidationError):
+        SymptomCheckRequest(symptoms_text="cough", **field)
+
+
+def test_batch_of_one_and_empty():
+    payload = SymptomCheckRequest(age=70, temperature=102.0, symptoms_text="chest pain")
+    assert analyze_symptoms_batch([payload]) == [analyze_symptoms(payload)]
+    assert analyze_symptoms_batch([]) == []
+
+
+def test_no_flags_message():
+    (result,) = analyze_symptoms_batch([SymptomCheckRequest(symptoms_text="feeling fine")])
+    assert result.detected_flags == [main.NO_FLAGS_MESSAGE]
+    assert (result.risk_level, result.risk_score) == ("Low", 0)
@@ -0,0 +1,89 @@
+"""Write-behind queue: one bad item must not cost anyone else their rows."""
+import asyncio
+import sqlite3
+
+import pytest
+
+import storage
+import writer
+from db import get_db
+from writer import WriteBehindQueue
+
+BASE_TS = 1_800_000_000_000
+
+
+def symptom_row(user_id, i, age=30):
+    return (user_id, age, 98.6, f"writer check {i}", "Low", 10, "Rest.", "t", BASE_TS + i, ())
+
+
+def run_queue(sink, items, max_batch=100):
+    async def scenario():
+        queue = WriteBehindQueue(max_batch=max_batch)
+        queue.bind(sink)
+        queue.start()
+        # Enqueued before the writer task first runs, so they form one batch
+        for kind, rows in items:
+            await queue.enqueue(kind, rows)
+        await queue.stop()
+        return queue
+
+    return asyncio.run(scenario())
+
+
+@pytest.fixture
+def fast_backoff(monkeypatch):
+    monkeypatch.setattr(writer, "WRITE_QUEUE_BACKOFF_MAX_SECONDS", 0.001)
+
+
+def test_bad_row_is_isolated_from_the_rest_of_the_batch(migrated_db):
+    items = [("symptom_checks", [symptom_row(100 + i, i)]) for i in range(10)]
+    items.insert(4, ("symptom_checks", [symptom_row(99, 99, age=10**20)]))
+
+    queue = run_queue(storage.SQLiteStorage().write_batch, items)
+
+    assert (queue.committed_rows, queue.dropped_rows) == (10, 1)
+    with get_db() as conn:
+        users = [r[0] for r in conn.execute(
+            "SELECT user_id FROM symptom_checks WHERE created_ts >= ? ORDER BY user_id", (BASE_TS,)
+        )]
+    assert users == list(range(100, 110))
+
+
+def test_transient_errors_are_retried_not_dropped(fast_backoff):
+    committed = []
+    failures = iter([sqlite3.OperationalError("database is locked")] * 5)
+
+    async def sink(batch):
+        error = next(failures, None)
+        if error is not None:
+            raise error
+        committed.append(batch)
+
+    queue = run_queue(sink, [("chat_messages", [(1, "user", "hi", "t", 1)])])
+    assert (queue.errors, queue.dropped_rows, queue.committed_rows) == (5, 0, 1)
+    assert committed == [{"chat_messages": [(1, "user", "hi", "t", 1)]}]
+
+
+def test_transient_errors_give_up_after_the_retry_window(fast_backoff, monkeypatch):
+    monkeypatch.setattr(writer, "WRITE_QUEUE_RETRY_SECONDS", 0.05)
+
+    async def sink(batch):
+        raise sqlite3.OperationalError("database is locked")
+
+    queue = run_queue(sink, [("chat_messages", [(1, "user", "hi", "t", 1)])])
+    assert queue.errors > 1
+    assert (queue.dropped_rows, queue.committed_rows) == (1, 0)
+
+
+def test_is_transient():
+    assert writer.is_transient(sqlite3.OperationalError("database is locked"))
+    assert writer.is_transient(ConnectionResetError())
+    assert not writer.is_transient(sqlite3.OperationalError("no such table: x"))
+    assert not writer.is_transient(OverflowError("Python int too large to convert to SQLite INTEGER"))
+
+    class PgError(Exception):
+        def __init__(self, sqlstate):
+            self.sqlstate = sqlstate
+
+    assert writer.is_transient(PgError("40P01"))
+    assert not writer.is_transient(PgError("22003"))  # numeric_value_out_of_range
@@ -63,9 +63,14 @@ const IconStar = () => (
   </svg>
 );
 
+// Headers for calls made on the user's behalf: the session token from
+// /api/login or /api/signup, when there is one
+const authHeaders = (user) =>
+  user?.token ? { Authorization: `Bearer ${user.token}` } : {};
+
 function App() {
   // Auth state
-  const [user, setUser] = useState(null); // { user_id, email } or null
+  const [user, setUser] = useState(null); // { user_id, email, token, expires_at } or null
   const [authMode, setAuthMode] = useState("login"); // "login" | "signup"
   const [authEmail, setAuthEmail] = useState("");
   const [authPassword, setAuthPassword] = useState("");
@@ -111,8 +116,11 @@ function App() {
     if (saved) {
       try {
         const parsed = JSON.parse(saved);
-        if (parsed && "email" in parsed) {
+        // Users saved by the old mock login have no token: log in again
+        if (parsed && parsed.token && parsed.expires_at * 1000 > Date.now()) {
           setUser(parsed);
+        } else {
+          localStorage.removeItem("safelink_user");
         }
       } catch (e) {
         console.error("Failed to parse saved user:", e);
@@ -121,35 +129,61 @@ function App() {
   }, []);
 
   // Auth handlers
-  const handleAuthSubmit = (e) => {
+  const handleAuthSubmit = async (e) => {
     e.preventDefault();
     setAuthError("");
+
+    if (authMode === "signup" && authPassword.length < 6) {
+      setAuthError("Password must be at least 6 characters.");
+      return;
+    }
+
     setAuthLoading(true);
+    try {
+      const response = await fetch(
+        `${API_BASE_URL}/api/${authMode === "signup" ? "signup" : "login"}`,
+        {
+          method: "POST",
+          headers: { "Content-Type": "application/json" },
+          body: JSON.stringify({ email: authEmail, password: authPassword }),
+        }
+      );
 
-    // Mock Authentication Logic
-    setTimeout(() => {
-      setAuthLoading(false);
-      if (authEmail.length > 5 && authPassword.length >= 6) {
-        const loggedInUser = {
-          user_id: Date.now(),
-          email: authEmail,
-        };
-        setUser(loggedInUser);
-        localStorage.setItem("safelink_user", JSON.stringify(loggedInUser));
-        setAuthPassword("");
-        setAuthError("");
-        setActiveTab("symptoms"); // Redirect after login
-      } else {
-        setAuthError(
-          authMode === "login"
-            ? "Invalid credentials."
-            : "Email too short or password less than 6 chars."
-        );
+      if (!response.ok) {
+        const errData = await response.json().catch(() => null);
+        let msg = "Could not sign you in. Please try again shortly.";
+        if (response.status === 422) {
+          msg = "Please enter a valid email address.";
+        } else if (errData && typeof errData.detail === "string") {
+          msg = errData.detail;
+        }
+        throw new Error(msg);
       }
-    }, 1000);
+
+      // { user_id, email, token, expires_at }
+      const loggedInUser = await response.json();
+      setUser(loggedInUser);
+      localStorage.setItem("safelink_user", JSON.stringify(loggedInUser));
+      setAuthPassword("");
+      setActiveTab("symptoms"); // Redirect after login
+    } catch (err) {
+      console.error("Auth error:", err);
+      setAuthError(
+        err.message || "Network error. Check if the server is reachable."
+      );
+    } finally {
+      setAuthLoading(false);
+    }
   };
 
   const handleLogout = () => {
+    if (user?.token) {
+      // Revoke the session server-side; the local logout doesn't wait on it
+      fetch(`${API_BASE_URL}/api/logout`, {
+        method: "POST",
+        headers: authHeaders(user),
+      }).catch((err) => console.error("Logout error:", err));
+    }
     setUser(null);
     localStorage.removeItem("safelink_user");
     setActiveTab("home");
@@ -170,10 +204,8 @@ function App() {
 
       const headers = {
         "Content-Type": "application/json",
+        ...authHeaders(user),
       };
-      if (user?.user_id) {
-        headers["X-User-Id"] = user.user_id;
-      }
 
       const response = await fetch(`${API_BASE_URL}/api/symptom-check`, {
         method: "POST",
@@ -217,10 +249,8 @@ function App() {
     try {
       const headers = {
         "Content-Type": "application/json",
+        ...authHeaders(user),
       };
-      if (user?.user_id) {
-        headers["X-User-Id"] = user.user_id;
-      }
 
       const controller = new AbortController();
       const id = setTimeout(() => controller.abort(), 30000); // 30s timeout
@@ -275,7 +305,7 @@ function App() {
 
   // Chat history handler
   const handleLoadChatHistory = async () => {
-    if (!user?.user_id) {
+    if (!user?.token) {
       setChatHistoryError("Please log in to view your chat history.");
       return;
     }
@@ -285,11 +315,15 @@ function App() {
     try {
       const response = await fetch(`${API_BASE_URL}/api/chat-history`, {
         method: "GET",
-        headers: {
-          "X-User-Id": user.user_id,
-        },
+        headers: authHeaders(user),
       });
 
+      if (response.status === 401) {
+        // The session expired or was revoked
+        setUser(null);
+        localStorage.removeItem("safelink_user");
+        throw new Error("Your session has expired. Please log in again.");
+      }
       if (!response.ok) {
         const errData = await response.json().catch(() => null);
         const msg =